@@ -1,44 +1,143 @@
-from app.store import PropertyStore
+import asyncio
+from typing import Dict, List, Optional
+
+from app import deadline
+from app.config import settings
+from app.store import PropertyStore, parse_query
 from app.llm_client import GroqLllmClient
 from app.nlu import NLUProcessor
-from app.notifier import Notifier
-from app.scheduler import VisitScheduler
+from app.notifier import notifier
+from app.scheduler import SlotUnavailable, VisitScheduler
 from app.stt import SpeechToText
+from app.metrics import timed, FALLBACKS
+from app.facets import from_records as facet_counts
 
 
 class RealEstateAgent:
     def __init__(self):
         self.store = PropertyStore()
         self.llm = GroqLllmClient()
-        self.nlu = NLUProcessor()
-        self.notifier = Notifier()
+        self.nlu = NLUProcessor(corrector=self.store.spelling)
+        self.notifier = notifier
         self.scheduler = VisitScheduler()
-        self.stt = SpeechToText()
+        self.stt = SpeechToText(nlu=self.nlu)
+
+    @timed("agent.handle_query")
+    async def handle_query(self, query: str, budget: Optional[deadline.Deadline] = None):
+        """
+        Main pipeline for handling client text queries. `budget` bounds the
+        whole request (QUERY_DEADLINE_SECONDS by default); stages that can't
+        fit in what is left skip or fall back, and are listed under "degraded".
+        """
+        budget = budget or deadline.current() or deadline.Deadline()
+        with deadline.scope(budget):
+            return await self._handle_query(query, budget)
 
-    async def handle_query(self, query: str):
-        """Main pipeline for handling client text queries."""
+    async def _handle_query(self, query: str, budget: deadline.Deadline):
         normalized_query = self.nlu.normalize(query)
         intent = self.nlu.classify_intent(normalized_query) 
         print('final intent '+intent)
 
         if intent == "search_property":
-            properties = self.store.search(normalized_query)
+            properties, facets = self.store.search_faceted(normalized_query)
+            # Structured matches suffice; vector search only runs when there are none
             if not properties:
-               properties = self.store.semantic_search(normalized_query)
-            summarize = self.llm.summarize(properties)
-            return {"properties":properties,"summarize":summarize}
+                if not budget.allows(settings.DEADLINE_SEMANTIC_MIN_SECONDS):
+                    budget.degrade("semantic_search", "budget")
+                else:
+                    FALLBACKS.labels("semantic_search").inc()
+                    # The full filter set already matched nothing; keep location and budget as hard
+                    # constraints and let similarity stand in for the bhk / type match
+                    filters = {k: v for k, v in parse_query(normalized_query).items()
+                               if k in ("location", "max_price") and v}
+                    try:
+                        # Off the event loop so concurrent queries can share an embedding batch
+                        properties = await asyncio.wait_for(
+                            asyncio.to_thread(self.store.semantic_search, normalized_query, 5, **filters),
+                            budget.remaining())
+                        facets = facet_counts(properties)
+                    except deadline.TIMEOUTS:
+                        budget.degrade("semantic_search", "timeout")
+            summarize = await self._summarize(properties, budget)
+            return {"properties":properties,"summarize":summarize,"facets":facets,"degraded":list(budget.degraded)}
 
         elif intent == "schedule_visit":
-            result = self.scheduler.schedule_visit(normalized_query)
-            return f"Visit scheduled: {result}"
+            return await asyncio.to_thread(self._schedule_visit, normalized_query)
 
         elif intent == "notify_advertiser":
-            self.notifier.notify_advertiser(normalized_query)
-            return "Advertiser notified successfully."
+            jobs = self.notifier.notify_advertiser(normalized_query)
+            return {"message": "Advertiser notification queued.", "notifications": jobs}
 
         else:
             return #self.llm.generate(normalized_query)
 
+    def _schedule_visit(self, normalized_query: str) -> Dict:
+        """Book the listing named in the query with its own agent (the listing's contact person)."""
+        entities = self.nlu.extract_entities(normalized_query)
+        listing = self.store.get(entities["property_id"]) if entities.get("property_id") else None
+        if listing is None:
+            return {"message": "Which property would you like to visit? Mention its id, "
+                               "e.g. 'schedule a visit to property 42'.", "visit": None}
+        agent = listing.get("contact_person")
+        if not agent:
+            return {"message": f"Property {entities['property_id']} has no agent to show it; "
+                               "please contact the advertiser.", "visit": None}
+        entities.update(property=listing.get("title"), agent=agent)
+        try:
+            visit = self.scheduler.schedule_from_text({"entities": entities})
+        except SlotUnavailable:
+            visit = None
+        if visit is None:
+            return {"message": "No visit slot is available for this property right now.", "visit": None}
+        return {"message": "Visit scheduled.", "visit": visit, "ics": f"/visits/{visit['id']}.ics"}
+
+    async def handle_batch(self, queries: List[str], summarize: bool = False, limit: int = 20):
+        """
+        Results for a list of requirement strings, yielded per query as they
+        are ready (each carries its position as "index"): structured matches
+        first, then semantic matches for the queries with none, then
+        summaries, BATCH_SUMMARY_GROUP queries per LLM call.
+        """
+        normalized = [self.nlu.normalize(q) for q in queries]
+        results = await asyncio.to_thread(self.store.search_batch, normalized, limit)
+
+        misses = [i for i, result in enumerate(results) if not result["properties"]]
+        if misses:
+            FALLBACKS.labels("semantic_search").inc(len(misses))
+            # One embedding batch and one vector lookup for every miss
+            matches = await asyncio.to_thread(self.store.semantic_search_many, [normalized[i] for i in misses])
+            for i, properties in zip(misses, matches):
+                results[i] = {"total": len(properties), "properties": properties,
+                              "facets": facet_counts(properties), "semantic": True}
+
+        for i, (query, result) in enumerate(zip(queries, results)):
+            result.update(index=i, query=query)
+            if not summarize:
+                yield result
+
+        if summarize:
+            group = max(1, settings.BATCH_SUMMARY_GROUP)
+            tasks = [asyncio.create_task(self._summarize_group(results[start:start + group]))
+                     for start in range(0, len(results), group)]
+            for task in asyncio.as_completed(tasks):
+                for result in await task:
+                    yield result
+
+    async def _summarize(self, properties: List[Dict], budget: deadline.Deadline) -> str:
+        try:
+            # The LLM call already times out at the deadline; the margin lets it return its own fallback
+            return await asyncio.wait_for(asyncio.to_thread(self.llm.summarize, properties),
+                                          budget.remaining() + 0.1)
+        except deadline.TIMEOUTS:
+            budget.degrade("summarize", "timeout")
+            return self.llm.template_summary(properties)
+
+    async def _summarize_group(self, results: List[Dict]) -> List[Dict]:
+        summaries = await asyncio.to_thread(self.llm.summarize_many, [r["properties"] for r in results])
+        for result, summary in zip(results, summaries):
+            result["summarize"] = summary
+        return results
+
     def stt_to_text(self, audio_file: bytes) -> str:
         """Convert voice input to text using STT."""
         return self.stt.convert(audio_file)
@@ -0,0 +1,147 @@
+"""
+batch_query.py — Vectorized structured filters for many queries at once
+------------------------------------------------------------------------
+/query/batch evaluates every query's filters together over the shared
+catalog's coded columns instead of one full-catalog mask per query:
+ - identical filter sets are evaluated once
+ - queries are grouped by location; each location's regex is resolved once
+   against the generation's dictionary and its rows are gathered once, so
+   every query naming it only scans that block
+ - within a block, a chunk of queries is masked together: the type lookup
+   table gathered by type_code and the bhk / budget comparisons broadcast
+   give a (chunk x block rows) mask in a handful of numpy ops
+
+The semantics match PropertyStore._filter_indices (a query with no filters
+matches nothing).
+    python -m app.batch_query --bench 100000     # per-query loop vs one batched pass
+"""
+
+import re
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+# Queries masked together; bounds the (chunk x block rows) boolean matrix
+CHUNK = 32
+
+
+def _matching_codes(pattern: Optional[str], names: List[str], cache: Dict) -> "np.ndarray":
+    if not pattern:
+        return np.ones(len(names), dtype=bool)
+    if pattern not in cache:
+        cache[pattern] = np.array([bool(re.search(pattern, name, re.IGNORECASE)) for name in names],
+                                  dtype=bool)
+    return cache[pattern]
+
+
+def _filter_key(f: Dict) -> Tuple:
+    return tuple(f.get(k) or None for k in ("location", "bhk", "max_price", "prop_type"))
+
+
+def filter_indices(generation, filters: List[Dict], chunk: int = CHUNK) -> Iterator[Tuple[int, "np.ndarray"]]:
+    """
+    (query position, matching row indices) for each filter dict. Positions
+    come out grouped by location, not in input order.
+    """
+    positions: Dict[Tuple, List[int]] = {}
+    for i, f in enumerate(filters):
+        positions.setdefault(_filter_key(f), []).append(i)
+    by_location: Dict[Optional[str], List[Tuple]] = {}
+    for key in positions:
+        by_location.setdefault(key[0], []).append(key)
+
+    location_code = np.asarray(generation.location_code)
+    type_code = np.asarray(generation.type_code)
+    bhk = np.asarray(generation.bhk)
+    price = np.asarray(generation.price_num)
+    location_cache, type_cache = {}, {}
+    empty = np.empty(0, dtype=np.int64)
+
+    for location, keys in by_location.items():
+        # Rows in the location are gathered once and shared by every query naming it
+        rows = (np.flatnonzero(_matching_codes(location, generation.locations, location_cache)[location_code])
+                if location else np.arange(len(location_code)))
+        sub_type, sub_bhk, sub_price = type_code[rows], bhk[rows], price[rows]
+        for start in range(0, len(keys), chunk):
+            part = keys[start:start + chunk]
+            type_ok = np.stack([_matching_codes(k[3], generation.types, type_cache) for k in part])
+            wanted = np.array([int(k[1] or 0) for k in part], dtype=np.int64)[:, None]
+            # float64 like _filter_mask, so float32 prices compare identically
+            max_price = np.array([float(k[2] or np.inf) for k in part], dtype=np.float64)[:, None]
+            mask = type_ok[:, sub_type]
+            mask &= (wanted == 0) | (sub_bhk[None, :] == wanted)
+            mask &= sub_price[None, :] <= max_price
+            for key, row_mask in zip(part, mask):
+                # No filters at all matches nothing, like _filter_indices
+                indices = rows[row_mask] if any(key) else empty
+                for i in positions[key]:
+                    yield i, indices
+
+
+# ---------------------------
+# Benchmark: per-query filter loop vs one batched pass
+# ---------------------------
+if __name__ == "__main__":
+    import argparse
+    import contextlib
+    import io
+    import os
+    import random
+    import tempfile
+    import time
+
+    from app.config import settings
+    from app.catalog_compiler import _synthetic_csv
+
+    parser = argparse.ArgumentParser(description="Batch query benchmark")
+    parser.add_argument("--bench", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(9)
+    places = ["noida", "gurugram", "delhi", "mumbai", "bangalore", "greater noida", "sector 62", "dlf phase 2"]
+    kinds = ["flat", "villa", "plot", "apartment", ""]
+    queries = [" ".join(filter(None, [f"{rng.randint(1, 5)}bhk" if rng.random() < 0.7 else "",
+                                      rng.choice(kinds), f"in {rng.choice(places)}",
+                                      f"under {rng.randint(30, 300)} lakh" if rng.random() < 0.6 else ""]))
+               for _ in range(args.queries)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "properties.csv")
+        _synthetic_csv(path, args.bench)
+        settings.CATALOG_DIR = os.path.join(tmp, "catalog")
+        settings.CATALOG_WATCH_SECONDS = 0
+        os.environ["USE_VECTOR"] = "false"
+        from app.store import PropertyStore, parse_query
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            store = PropertyStore(csv_path=path)
+            generation = store.catalog.current()
+            filters = [parse_query(q) for q in queries]
+
+            t0 = time.perf_counter()
+            looped = [store._filter_indices(generation, **f) for f in filters]
+            loop_ms = (time.perf_counter() - t0) * 1000
+            t0 = time.perf_counter()
+            batched = [None] * len(filters)
+            for i, indices in filter_indices(generation, filters):
+                batched[i] = indices
+            batch_ms = (time.perf_counter() - t0) * 1000
+
+            t0 = time.perf_counter()
+            for q in queries:
+                store.search_faceted(q)
+            search_loop_ms = (time.perf_counter() - t0) * 1000
+            t0 = time.perf_counter()
+            store.search_batch(queries, limit=20)
+            search_batch_ms = (time.perf_counter() - t0) * 1000
+
+        same = all(np.array_equal(a, b) for a, b in zip(looped, batched))
+        print(f"[Batch] {len(generation)} listings, {len(queries)} queries")
+        print(f"[Batch] filters: per-query loop {loop_ms:.1f} ms vs batched pass {batch_ms:.1f} ms "
+              f"(identical results: {same})")
+        print(f"[Batch] search + facets: {len(queries)} single searches {search_loop_ms:.0f} ms "
+              f"vs search_batch(limit=20) {search_batch_ms:.0f} ms")
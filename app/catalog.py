@@ -0,0 +1,675 @@
+"""
+catalog.py — Shared, memory-mapped property catalog
+----------------------------------------------------
+Stores the catalog once per host instead of once per Uvicorn worker:
+ - listing records in an Arrow IPC file, memory-mapped read-only
+ - precomputed filter columns (numeric price, bhk, location/type codes)
+   as .npy files opened with mmap_mode='r'
+ - listing embeddings as a normalized float32 .npy matrix, mapped the same way
+
+Every worker maps the same files, so the pages live once in the OS page
+cache no matter how many workers are running.
+
+The listings table is a typed snapshot (see compile_frame): numeric
+`price_value` in lakh next to the display price, dictionary-encoded
+location/type/availability and compact integer columns, so loading it
+never re-parses text or infers dtypes.
+
+Layout:
+    CATALOG_DIR/
+        CURRENT                 -> "gen-000003"
+        gen-000003/
+            manifest.json
+            listings.arrow      (or listings-*.arrow segments, see below)
+            price_num.npy  bhk.npy  location_code.npy  type_code.npy
+            embeddings.npy      (when vectors are enabled)
+            vectors.faiss       (ANN index for large catalogs, see vector_index.py)
+            minhash.npy  lsh_keys.npy  lsh_rows.npy  dedup_attrs.npy  dup_group.npy
+                                (near-duplicate index, see dedup.py)
+            neighbors.npy  neighbor_scores.npy
+                                (similar listings per row, see neighbors.py)
+
+Writers build a complete new generation directory and then atomically
+replace CURRENT (append-and-swap). Readers never take a lock: they map
+whatever CURRENT names, and a generation stays valid for as long as any
+process still has it mapped, even after it is pruned from disk.
+
+Appends publish a delta generation: the previous generation's listing
+segments are hard-linked, the new rows go into one more Arrow segment, and
+the filter columns, dedup index and neighbour table only process the new
+rows. Past CATALOG_MAX_SEGMENTS segments an append compacts them into one.
+
+Switching a process to a new generation (refresh) maps it, warms its pages
+and runs the registered on_swap hooks *before* the reference is swapped,
+so queries never wait on a reload and in-flight ones finish on the
+generation they started with.
+"""
+
+import json
+import os
+import re
+import shutil
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from .config import settings
+from .startup import _rss_bytes
+from . import dedup, neighbors, vector_index
+from .vector_index import VectorIndex
+
+try:
+    import fcntl
+except ImportError:   # Windows: single-writer deployments only
+    fcntl = None
+
+try:
+    import numpy as np
+    import pyarrow as pa
+except Exception:
+    np = None
+    pa = None
+
+
+CURRENT_FILE = "CURRENT"
+LISTINGS_FILE = "listings.arrow"
+EMBEDDINGS_FILE = "embeddings.npy"
+MANIFEST_FILE = "manifest.json"
+FILTER_COLUMNS = ("price_num", "bhk", "location_code", "type_code")
+# Times refresh re-reads CURRENT when the generation it named was pruned before it could be mapped
+_OPEN_ATTEMPTS = 5
+
+# Low-cardinality text stored as Arrow dictionary<int, string>
+CATEGORICAL_COLUMNS = ("location", "type", "availability")
+# Smallest integer dtypes that fit real listings; nullable so missing values survive
+INTEGER_COLUMNS = {"id": "Int64", "bhk": "Int8", "bathrooms": "Int8", "bedrooms": "Int8",
+                   "area_sqft": "Int32"}
+# Digits-only values that must stay text (leading zeros, country codes)
+TEXT_COLUMNS = ("phone", "whatsapp", "contact_phone")
+
+
+def available() -> bool:
+    """The shared catalog needs numpy + pyarrow; callers fall back to pandas otherwise."""
+    return np is not None and pa is not None
+
+
+def _generation_name(number: int) -> str:
+    return f"gen-{number:06d}"
+
+
+def _read_current(root: str) -> Optional[str]:
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+@contextmanager
+def _writer_lock(root: str):
+    """Serializes writers across processes; readers never touch it."""
+    os.makedirs(root, exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(root, ".lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextmanager
+def _try_rebuild_lock(root: str):
+    """Non-blocking; yields False when another process is already rebuilding."""
+    os.makedirs(root, exist_ok=True)
+    if fcntl is None:
+        yield True
+        return
+    with open(os.path.join(root, ".rebuild.lock"), "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def parse_price(value) -> float:
+    """'1.2 Cr' -> 120.0, '75 Lakh' -> 75.0 (lakh); bare numbers pass through, unknown -> 0."""
+    if isinstance(value, (int, float)):
+        return 0.0 if value != value else float(value)
+    if not isinstance(value, str):
+        return 0.0
+    text = value.lower().replace(" ", "").replace(",", "").replace("₹", "").replace("rs.", "")
+    match = re.match(r"(\d+(?:\.\d+)?)(crore|cr|lakhs|lakh|lacs|lac|l)?", text)
+    if not match:
+        return 0.0
+    number = float(match.group(1))
+    unit = match.group(2) or ""
+    return number * 100 if unit.startswith("cr") else number
+
+
+def _to_text(value):
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def compile_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Normalize a raw catalog frame (CSV / MySQL / appended uploads) into the
+    typed snapshot schema: lower-case columns, numeric price_value, categorical
+    text columns, compact nullable integers and plain strings elsewhere.
+    """
+    df = df.copy()
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    df = df.reset_index(drop=True)
+
+    if "price" in df:
+        df["price"] = df["price"].map(_to_text)
+        df["price_value"] = df["price"].map(parse_price).astype("float32")
+    for col, dtype in INTEGER_COLUMNS.items():
+        if col in df:
+            numeric = pd.to_numeric(df[col], errors="coerce").round()
+            df[col] = numeric.astype(dtype)
+    for col in TEXT_COLUMNS:
+        if col in df:
+            df[col] = df[col].map(_to_text)
+    for col in CATEGORICAL_COLUMNS:
+        if col in df:
+            df[col] = df[col].map(_to_text).astype("category")
+    # Arrow needs one type per column; CSV object columns can mix str/float(NaN)
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].map(_to_text)
+    return df
+
+
+def document_text(row) -> str:
+    """Text embedded for a listing (row may be a pandas Series or a dict)."""
+    #id,title,location,type,bhk,price,area_sqft,contact_person,phone,availability,images,youtube,description,whatsapp
+    fields = ['title', 'location', 'type', 'bhk', 'price', 'area_sqft', 'contact_person', 'phone',
+              'availability', 'image', 'youtube', 'description', 'whatsapp']
+    return " ".join(str(row.get(f, '')) for f in fields)
+
+
+def default_embedder():
+    from chromadb.utils import embedding_functions
+    return embedding_functions.DefaultEmbeddingFunction()
+
+
+def embed_documents(df: pd.DataFrame, embedder, batch_size: int = 256):
+    texts = [document_text(row) for _, row in df.iterrows()]
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(embedder(texts[start:start + batch_size]))
+    print(f"[VectorDB] Embedded {len(texts)} listings")
+    return np.asarray(vectors, dtype=np.float32) if vectors else None
+
+
+def embed_delta(df: pd.DataFrame, base: Optional["CatalogGeneration"], embedder):
+    """
+    Embeddings for `df`, re-using vectors from `base` for listings whose
+    document text is unchanged; only new or edited listings are embedded.
+    """
+    texts = [document_text(row) for _, row in compile_frame(df).iterrows()]
+    reuse = {}
+    if base is not None and base.embeddings is not None:
+        base_texts = [document_text(row) for _, row in compile_frame(base.to_pandas()).iterrows()]
+        reuse = {text: i for i, text in enumerate(base_texts)}
+
+    missing = [i for i, text in enumerate(texts) if text not in reuse]
+    fresh = {}
+    if missing:
+        vectors = embed_documents(df.iloc[missing], embedder)
+        fresh = dict(zip(missing, vectors))
+    if not texts:
+        return None
+    print(f"[VectorDB] Delta: reused {len(texts) - len(missing)}, embedded {len(missing)}")
+    return np.vstack([
+        fresh[i] if i in fresh else np.asarray(base.embeddings[reuse[text]])
+        for i, text in enumerate(texts)
+    ]).astype(np.float32)
+
+
+def _filter_columns(df: pd.DataFrame) -> Dict[str, "np.ndarray"]:
+    n = len(df)
+    columns = {}
+    if "price_value" in df:
+        columns["price_num"] = df["price_value"].to_numpy(np.float32)
+    else:
+        columns["price_num"] = np.zeros(n, dtype=np.float32)
+    if "bhk" in df:
+        columns["bhk"] = pd.to_numeric(df["bhk"], errors="coerce").fillna(-1).to_numpy(np.int16)
+    else:
+        columns["bhk"] = np.full(n, -1, dtype=np.int16)
+    return columns
+
+
+def _category_codes(df: pd.DataFrame, column: str, categories: Optional[List[str]] = None):
+    """Codes into `categories` (extended with unseen values), or into fresh ones when None."""
+    if column not in df:
+        return np.zeros(len(df), dtype=np.int32), list(categories or [""])
+    values = df[column].astype(object).fillna("").astype(str)
+    if categories is None:
+        codes, uniques = pd.factorize(values)
+        return codes.astype(np.int32), [str(u) for u in uniques]
+    lookup = {c: i for i, c in enumerate(categories)}
+    codes = [lookup.setdefault(v, len(lookup)) for v in values]
+    return np.asarray(codes, dtype=np.int32), list(lookup)
+
+
+def assign_ids(new_rows: pd.DataFrame, current: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """
+    `new_rows` with missing ids, and ids already used in `current`, replaced
+    by fresh ones from the upload range (UPLOAD_ID_START and up), so uploads
+    never take an id the upstream source will hand out next.
+    """
+    new_rows = new_rows.copy()
+    new_rows.columns = [str(c).strip().lower() for c in new_rows.columns]
+    if "id" not in new_rows:
+        new_rows["id"] = None
+    ids = pd.to_numeric(new_rows["id"], errors="coerce").to_numpy(np.float64, na_value=np.nan, copy=True)
+    taken = (pd.to_numeric(current["id"], errors="coerce").to_numpy(np.float64, na_value=np.nan)
+             if current is not None and "id" in current else np.empty(0))
+    taken = taken[~np.isnan(taken)]
+    missing = np.isnan(ids) | np.isin(ids, taken)
+    if missing.any():
+        highest = max(taken.max() if len(taken) else 0, ids[~missing].max() if (~missing).any() else 0)
+        start = int(max(highest + 1, settings.UPLOAD_ID_START))
+        ids[missing] = np.arange(start, start + int(missing.sum()))
+    new_rows["id"] = ids.astype(np.int64)
+    return new_rows
+
+
+def _prune(root: str, keep: int):
+    generations = sorted(d for d in os.listdir(root) if d.startswith("gen-"))
+    for name in generations[:-keep]:
+        # Safe while other workers still map it: unlinked files stay readable through the mapping
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def _new_generation_dir(root: str) -> Tuple[str, str]:
+    """(name, temporary directory) of the generation after CURRENT."""
+    current = _read_current(root)
+    number = int(current.split("-")[1]) + 1 if current else 1
+    name = _generation_name(number)
+    tmp_dir = os.path.join(root, f".{name}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    return name, tmp_dir
+
+
+def _write_arrow(path: str, table: "pa.Table"):
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def _normalized(embeddings) -> "np.ndarray":
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _publish_locked(root: str, df: pd.DataFrame, embeddings=None, keep: int = 2,
+                    meta: Optional[Dict] = None) -> str:
+    name, tmp_dir = _new_generation_dir(root)
+
+    df = compile_frame(df)
+    _write_arrow(os.path.join(tmp_dir, LISTINGS_FILE), pa.Table.from_pandas(df, preserve_index=False))
+
+    columns = _filter_columns(df)
+    columns["location_code"], locations = _category_codes(df, "location")
+    columns["type_code"], types = _category_codes(df, "type")
+    for col, values in columns.items():
+        np.save(os.path.join(tmp_dir, f"{col}.npy"), values)
+
+    groups = None
+    if settings.DEDUP_ENABLED:
+        groups = dedup.write_index(tmp_dir, df)
+
+    embedding_dim = None
+    vector_backend = None
+    if embeddings is not None:
+        vectors = _normalized(embeddings)
+        np.save(os.path.join(tmp_dir, EMBEDDINGS_FILE), vectors)
+        embedding_dim = int(vectors.shape[1])
+        vector_backend = vector_index.write_index(tmp_dir, vectors)
+        neighbors.write_table(tmp_dir, vectors, columns["location_code"], columns["type_code"], groups)
+
+    manifest = {
+        "generation": name,
+        "rows": len(df),
+        "created": time.time(),
+        "segments": [LISTINGS_FILE],
+        "locations": locations,
+        "types": types,
+        "embedding_dim": embedding_dim,
+        "vector_backend": vector_backend,
+        **(meta or {}),
+    }
+    _swap_in(root, name, tmp_dir, manifest, keep)
+    print(f"[Catalog] Published {name} ({len(df)} rows)")
+    return name
+
+
+def _append_locked(root: str, base: "CatalogGeneration", new_rows: pd.DataFrame, new_embeddings=None,
+                   keep: int = 2, meta: Optional[Dict] = None) -> Optional[str]:
+    """
+    Publish `base` + compiled `new_rows` as a delta generation: listing
+    segments are hard-linked, only the new rows are encoded, hashed and
+    scored. None when the new rows don't fit the base schema (new columns,
+    incompatible types), which needs a full rewrite instead.
+    """
+    if set(new_rows.columns) - set(base.table.column_names):
+        return None
+    if settings.DEDUP_ENABLED and base.dedup is None:
+        return None
+    new_rows = new_rows.reindex(columns=base.table.column_names)
+    try:
+        delta = pa.Table.from_pandas(new_rows, schema=base.table.schema, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError, ValueError, TypeError):
+        return None
+
+    name, tmp_dir = _new_generation_dir(root)
+    segments = base.segments
+    if len(segments) + 1 > settings.CATALOG_MAX_SEGMENTS:
+        # Compact: one segment again, with dictionaries unified across the old ones
+        merged = pa.concat_tables([base.table, delta]).unify_dictionaries().combine_chunks()
+        _write_arrow(os.path.join(tmp_dir, LISTINGS_FILE), merged)
+        segments = [LISTINGS_FILE]
+    else:
+        for segment in segments:
+            _link_or_copy(os.path.join(base.path, segment), os.path.join(tmp_dir, segment))
+        segments = segments + [f"listings-{name}.arrow"]
+        _write_arrow(os.path.join(tmp_dir, segments[-1]), delta)
+
+    columns = _filter_columns(new_rows)
+    columns["location_code"], locations = _category_codes(new_rows, "location", base.locations)
+    columns["type_code"], types = _category_codes(new_rows, "type", base.types)
+    for col in FILTER_COLUMNS:
+        columns[col] = np.concatenate([np.asarray(getattr(base, col)), columns[col]])
+        np.save(os.path.join(tmp_dir, f"{col}.npy"), columns[col])
+
+    groups = None
+    if settings.DEDUP_ENABLED:
+        groups = dedup.write_index(tmp_dir, new_rows, base.dedup)
+
+    vector_backend = None
+    if base.embeddings is not None:
+        vectors = np.concatenate([np.asarray(base.embeddings), _normalized(new_embeddings)])
+        np.save(os.path.join(tmp_dir, EMBEDDINGS_FILE), vectors)
+        vector_backend = vector_index.write_index(tmp_dir, vectors, base.vector_index)
+        neighbors.write_table(tmp_dir, vectors, columns["location_code"], columns["type_code"], groups,
+                              base.neighbors)
+
+    rows = len(base) + len(new_rows)
+    manifest = {
+        **base.manifest,
+        "generation": name,
+        "rows": rows,
+        "created": time.time(),
+        "segments": segments,
+        "locations": locations,
+        "types": types,
+        "vector_backend": vector_backend,
+        **(meta or {}),
+    }
+    _swap_in(root, name, tmp_dir, manifest, keep)
+    print(f"[Catalog] Published {name} ({rows} rows, {len(new_rows)} appended, {len(segments)} segments)")
+    return name
+
+
+def _link_or_copy(src: str, dst: str):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _swap_in(root: str, name: str, tmp_dir: str, manifest: Dict, keep: int):
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f)
+
+    os.rename(tmp_dir, os.path.join(root, name))
+    # Atomic swap: readers see either the old or the new generation, never a partial one
+    pointer_tmp = os.path.join(root, f".{CURRENT_FILE}.tmp")
+    with open(pointer_tmp, "w") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer_tmp, os.path.join(root, CURRENT_FILE))
+    _prune(root, keep)
+
+
+class CatalogGeneration:
+    """Read-only, memory-mapped view of one published generation."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+        self.name = self.manifest["generation"]
+        self.locations: List[str] = self.manifest["locations"]
+        self.types: List[str] = self.manifest["types"]
+
+        # Generations published before segments existed have the single listings file
+        self.segments: List[str] = self.manifest.get("segments", [LISTINGS_FILE])
+        self.table = pa.concat_tables([   # zero-copy over the mappings
+            pa.ipc.open_file(pa.memory_map(os.path.join(path, segment), "r")).read_all()
+            for segment in self.segments
+        ])
+
+        for col in FILTER_COLUMNS:
+            setattr(self, col, np.load(os.path.join(path, f"{col}.npy"), mmap_mode="r"))
+
+        emb_path = os.path.join(path, EMBEDDINGS_FILE)
+        self.embeddings = np.load(emb_path, mmap_mode="r") if os.path.exists(emb_path) else None
+        self.vector_index = None
+        if self.embeddings is not None:
+            self.vector_index = VectorIndex(self.embeddings, path, self.manifest.get("vector_backend"))
+        self.dedup = dedup.DuplicateIndex.load(path)
+        self.neighbors = neighbors.NeighborTable.load(path)
+        self._id_order = None
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def rows(self, indices) -> List[Dict]:
+        """Materialize only the selected listings as dicts."""
+        if len(indices) == 0:
+            return []
+        return self.table.take(pa.array(np.asarray(indices, dtype=np.int64))).to_pylist()
+
+    def row_of(self, listing_id) -> Optional[int]:
+        """Row index of a listing id (sorted-id bisect, built on first use)."""
+        if "id" not in self.table.column_names:
+            return None
+        if self._id_order is None:
+            ids = pd.to_numeric(self.table.column("id").to_pandas(), errors="coerce").to_numpy(np.float64)
+            order = np.argsort(ids, kind="stable")
+            self._id_order = (ids[order], order)
+        ids, order = self._id_order
+        try:
+            i = int(np.searchsorted(ids, float(listing_id)))
+        except (TypeError, ValueError):
+            return None
+        return int(order[i]) if i < len(ids) and ids[i] == float(listing_id) else None
+
+    def to_pandas(self) -> pd.DataFrame:
+        return self.table.to_pandas()
+
+    def warm(self):
+        """Fault the mapped filter columns and embeddings into memory before serving."""
+        for col in FILTER_COLUMNS:
+            np.asarray(getattr(self, col)).sum()
+        if self.embeddings is not None:
+            np.asarray(self.embeddings).sum()
+
+
+class SharedCatalog:
+    """
+    Tracks CURRENT and hands out the latest mapped generation.
+
+    refresh_seconds > 0 re-reads CURRENT inline at most that often; pass 0
+    when a CatalogWatcher refreshes in the background instead.
+    """
+
+    def __init__(self, root: str, refresh_seconds: float = 1.0, keep: int = 2):
+        self.root = root
+        self.refresh_seconds = refresh_seconds
+        self.keep = keep
+        self.last_swap: Optional[Dict] = None
+        self._generation: Optional[CatalogGeneration] = None
+        self._checked_at = 0.0
+        self._hooks: List[Callable[[CatalogGeneration], None]] = []
+        self._refresh_lock = threading.Lock()
+
+    def on_swap(self, hook: Callable[[CatalogGeneration], None]):
+        """Run `hook(new_generation)` to build derived per-generation state before each swap."""
+        self._hooks.append(hook)
+
+    def exists(self) -> bool:
+        return _read_current(self.root) is not None
+
+    def current(self) -> Optional[CatalogGeneration]:
+        """Latest generation; re-reads CURRENT at most every `refresh_seconds`."""
+        if self._generation is None:
+            self.refresh()
+        elif self.refresh_seconds:
+            now = time.monotonic()
+            if now - self._checked_at >= self.refresh_seconds:
+                self._checked_at = now
+                self.refresh()
+        return self._generation
+
+    def refresh(self) -> bool:
+        """Map, warm and prepare the generation CURRENT names, then swap it in."""
+        with self._refresh_lock:
+            rss_before = _rss_bytes()
+            t0 = time.perf_counter()
+            for attempt in range(_OPEN_ATTEMPTS):
+                name = _read_current(self.root)
+                if not name or (self._generation is not None and self._generation.name == name):
+                    return False
+                try:
+                    generation = CatalogGeneration(os.path.join(self.root, name))
+                    break
+                except FileNotFoundError:
+                    # Pruned between reading CURRENT and mapping it (two appends back to back);
+                    # CURRENT names a newer generation by now
+                    if attempt == _OPEN_ATTEMPTS - 1:
+                        raise
+            generation.warm()
+            for hook in self._hooks:
+                hook(generation)
+            build_s = time.perf_counter() - t0
+            overlap_mb = (_rss_bytes() - rss_before) / (1024 * 1024)
+
+            # Swap the reference; in-flight readers keep the generation they already hold
+            t1 = time.perf_counter()
+            previous, self._generation = self._generation, generation
+            swap_s = time.perf_counter() - t1
+
+            self.last_swap = {
+                "from": previous.name if previous is not None else None,
+                "to": generation.name,
+                "rows": len(generation),
+                "prepare_s": round(build_s, 4),
+                "swap_us": round(swap_s * 1e6, 2),
+                "overlap_mb": round(overlap_mb, 2),
+                "at": time.time(),
+            }
+            print(f"[Catalog] Swapped to {generation.name} (prepare {build_s:.3f}s, "
+                  f"overlap +{overlap_mb:.1f}MB)")
+            return True
+
+    def publish(self, df: pd.DataFrame, embeddings=None, only_if_missing: bool = False,
+                meta: Optional[Dict] = None, rebase: Optional[Callable] = None) -> Optional[str]:
+        """
+        `rebase(latest, df, embeddings) -> (df, embeddings)` runs under the
+        writer lock against the generation current at that moment, so a
+        rebuild prepared off-lock can fold in what was appended meanwhile.
+        """
+        with _writer_lock(self.root):
+            # Several workers may race to build the first generation; only one does
+            if only_if_missing and _read_current(self.root):
+                return None
+            if rebase is not None:
+                self.refresh()
+                df, embeddings = rebase(self._generation, df, embeddings)
+            name = _publish_locked(self.root, df, embeddings, self.keep, meta)
+        self.refresh()
+        return name
+
+    def bootstrap(self, build: Callable[[], Tuple[pd.DataFrame, Optional["np.ndarray"], Optional[Dict]]]
+                  ) -> Optional[str]:
+        """
+        Publish the first generation from `build()` -> (df, embeddings, meta)
+        unless one exists. `build` runs under the writer lock, so on a cold
+        start one worker reads and embeds the source while the others wait
+        and then map its generation.
+        """
+        with _writer_lock(self.root):
+            if _read_current(self.root):
+                return None
+            df, embeddings, meta = build()
+            name = _publish_locked(self.root, df, embeddings, self.keep, meta)
+        self.refresh()
+        return name
+
+    def rebuild_lock(self):
+        """`with catalog.rebuild_lock() as acquired:` — one background rebuild per host."""
+        return _try_rebuild_lock(self.root)
+
+    def append(self, new_rows: pd.DataFrame, new_embeddings=None,
+               embedder: Optional[Callable] = None) -> Tuple[str, List[int]]:
+        """
+        Publish current rows + new rows as the next generation (a delta one,
+        see _append_locked); returns (generation name, ids of the new rows).
+        Rows without an id get the next free ones here, under the writer
+        lock, so concurrent appends from several workers never share an id.
+        When the catalog carries embeddings the new rows need them too: pass
+        `new_embeddings` or an `embedder` to compute them.
+        """
+        with _writer_lock(self.root):
+            self.refresh()
+            base = self._generation
+            has_ids = base is not None and "id" in base.table.column_names
+            new_rows = assign_ids(new_rows, base.table.select(["id"]).to_pandas() if has_ids else None)
+            if new_embeddings is None and base is not None and base.embeddings is not None:
+                if embedder is None:
+                    raise ValueError("catalog has embeddings; appended rows need new_embeddings or an embedder")
+                new_embeddings = embed_documents(new_rows, embedder)
+            new_rows = compile_frame(new_rows)
+            # Appends don't change the upstream source; keep its version so watchers don't rebuild
+            meta = {"source_version": base.manifest.get("source_version")} if base is not None else None
+
+            name = None
+            if base is not None:
+                name = _append_locked(self.root, base, new_rows, new_embeddings, self.keep, meta)
+            if name is None:
+                # First generation or a schema change: rewrite everything
+                frames = [base.to_pandas()] if base is not None else []
+                # Categoricals with different categories would concat to object anyway; make it explicit
+                frames = [f.astype({c: object for c in f.columns if f[c].dtype.name == "category"})
+                          for f in frames + [new_rows]]
+                combined = pd.concat(frames, ignore_index=True)
+                embeddings = None
+                if new_embeddings is not None and (base is None or base.embeddings is not None):
+                    parts = [np.asarray(base.embeddings)] if base is not None else []
+                    embeddings = np.vstack(parts + [np.asarray(new_embeddings, dtype=np.float32)])
+                name = _publish_locked(self.root, combined, embeddings, self.keep, meta)
+        self.refresh()
+        return name, [int(i) for i in new_rows["id"]]
@@ -0,0 +1,199 @@
+"""
+catalog_compiler.py — Compile the listings source into a typed catalog snapshot
+--------------------------------------------------------------------------------
+Reads the properties CSV (settings.PROPERTIES_CSV) or the MySQL `properties`
+table once, drops near-duplicate re-posts (see dedup.py), normalizes it with
+catalog.compile_frame (numeric price_value, categorical location/type, compact
+integer dtypes) and publishes it as a memory-mapped Arrow generation under
+CATALOG_DIR. Workers then map that snapshot at startup instead of re-parsing
+the CSV.
+
+Usage:
+    python -m app.catalog_compiler                         # settings source -> CATALOG_DIR
+    python -m app.catalog_compiler --csv listings.csv --out data/catalog
+    python -m app.catalog_compiler --mysql mysql+pymysql://user:pw@host/db --no-embeddings
+    python -m app.catalog_compiler --bench 100000          # CSV vs snapshot load time & memory
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from functools import lru_cache
+from typing import Optional
+
+import pandas as pd
+
+from app.config import settings
+from app import catalog, dedup
+from app.catalog import SharedCatalog
+
+BUNDLED_CSV = os.path.join(os.path.dirname(__file__), "data", "properties.csv")
+EMPTY_COLUMNS = ['id', 'title', 'description', 'price', 'location', 'bedrooms', 'type', 'bathrooms',
+                 'area', 'contact_email', 'contact_phone']
+
+
+@lru_cache(maxsize=8)
+def _engine(mysql_url: str):
+    """One SQLAlchemy engine (and connection pool) per URL, not one per read."""
+    from sqlalchemy import create_engine
+    return create_engine(mysql_url)
+
+
+def read_source(csv_path: Optional[str] = None, mysql_url: Optional[str] = None) -> pd.DataFrame:
+    """Configured CSV, then MySQL, then the CSV bundled with the app; near-duplicate re-posts dropped."""
+    if csv_path and os.path.exists(csv_path):
+        print(f"[Catalog] Reading CSV {csv_path}")
+        df = pd.read_csv(csv_path)
+    elif mysql_url:
+        print("[Catalog] Reading MySQL table properties")
+        df = pd.read_sql_table('properties', _engine(mysql_url))
+    elif os.path.exists(BUNDLED_CSV):
+        print(f"[Catalog] {csv_path or 'PROPERTIES_CSV'} not found; using bundled {BUNDLED_CSV}")
+        df = pd.read_csv(BUNDLED_CSV)
+    else:
+        return pd.DataFrame(columns=EMPTY_COLUMNS)
+    return dedup.drop_near_duplicates(df)
+
+
+def _file_version(path: str) -> str:
+    st = os.stat(path)
+    return f"csv:{os.path.abspath(path)}:{st.st_mtime_ns}:{st.st_size}"
+
+
+def source_version(csv_path: Optional[str] = None, mysql_url: Optional[str] = None) -> Optional[str]:
+    """
+    Cheap change marker for the source read_source would pick (mtime/size,
+    or CATALOG_VERSION_QUERY for snapshots compiled with --mysql).
+    """
+    if csv_path and os.path.exists(csv_path):
+        return _file_version(csv_path)
+    if mysql_url:
+        from sqlalchemy import text
+        with _engine(mysql_url).connect() as conn:
+            row = conn.execute(text(settings.CATALOG_VERSION_QUERY)).fetchone()
+        return f"mysql:{tuple(row)}"
+    if os.path.exists(BUNDLED_CSV):
+        return _file_version(BUNDLED_CSV)
+    return None
+
+
+def compile_catalog(csv_path: Optional[str] = None, mysql_url: Optional[str] = None,
+                    out_dir: Optional[str] = None, embeddings: bool = True) -> str:
+    """Build and publish a new snapshot generation; returns its name."""
+    version = source_version(csv_path, mysql_url)
+    df = read_source(csv_path, mysql_url)
+    shared = SharedCatalog(out_dir or settings.CATALOG_DIR, keep=settings.CATALOG_KEEP_GENERATIONS)
+    vectors = None
+    if embeddings and len(df):
+        # Re-use vectors from the previous snapshot for unchanged listings
+        base = shared.current() if shared.exists() else None
+        vectors = catalog.embed_delta(df, base, catalog.default_embedder())
+    return shared.publish(df, vectors, meta={"source_version": version})
+
+
+# ---------------------------
+# Benchmark: CSV vs snapshot
+# ---------------------------
+def _synthetic_csv(path: str, rows: int):
+    rng = random.Random(7)
+    localities = [f"Sector {n}, Noida" for n in range(1, 170)] + \
+                 [f"DLF Phase {n}, Gurugram" for n in range(1, 6)] + \
+                 ["Greater Noida West", "Andheri, Mumbai", "Whitefield, Bangalore", "Dwarka, Delhi"]
+    types = ["Apartment", "Villa", "Plot", "Builder Floor", "Penthouse"]
+    records = []
+    for i in range(1, rows + 1):
+        bhk = rng.randint(1, 5)
+        price = f"{rng.randint(25, 99)} Lakh" if rng.random() < 0.6 else f"{rng.randint(1, 9)}.{rng.randint(0, 9)} Cr"
+        kind = rng.choice(types)
+        records.append({
+            "id": i, "title": f"{bhk}BHK {kind}", "location": rng.choice(localities), "type": kind,
+            "bhk": bhk, "price": price, "area_sqft": rng.randint(450, 4500),
+            "contact_person": f"Agent {i % 997}", "phone": f"98{rng.randint(10000000, 99999999)}",
+            "availability": rng.choice(["Ready to move", "Under construction"]),
+            "image": f"https://img.example.com/{i}.jpg", "youtube": "",
+            "description": f"Spacious {bhk}BHK {kind.lower()} with parking and lift, listing {i}",
+            "whatsapp": f"98{rng.randint(10000000, 99999999)}",
+        })
+    pd.DataFrame(records).to_csv(path, index=False)
+
+
+def _measure(kind: str, path: str) -> dict:
+    """Runs in a fresh interpreter so RSS deltas are not polluted by the parent."""
+    from app.startup import _rss_bytes
+    rss_before = _rss_bytes()
+    t0 = time.perf_counter()
+    if kind == "csv":
+        df = pd.read_csv(path)
+        # The CSV path also pays price parsing before it can filter by budget
+        price = df["price"].map(catalog.parse_price)
+        loaded = time.perf_counter() - t0
+        t1 = time.perf_counter()
+        hits = int(((df["bhk"] == 3) & df["location"].str.contains("noida", case=False) & (price <= 200)).sum())
+        filter_s = time.perf_counter() - t1
+    else:
+        import numpy as np
+        shared = SharedCatalog(path)
+        gen = shared.current()
+        loaded = time.perf_counter() - t0
+        t1 = time.perf_counter()
+        codes = [i for i, loc in enumerate(gen.locations) if "noida" in loc.lower()]
+        hits = int(((gen.bhk == 3) & np.isin(gen.location_code, codes) & (gen.price_num <= 200)).sum())
+        filter_s = time.perf_counter() - t1
+    return {
+        "load_s": round(loaded, 4),
+        "first_filter_s": round(filter_s, 4),
+        "rss_mb": round((_rss_bytes() - rss_before) / (1024 * 1024), 1),
+        "hits": hits,
+    }
+
+
+def benchmark(rows: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "properties.csv")
+        out_dir = os.path.join(tmp, "catalog")
+        _synthetic_csv(csv_path, rows)
+
+        t0 = time.perf_counter()
+        shared = SharedCatalog(out_dir)
+        shared.publish(read_source(csv_path))
+        compile_s = time.perf_counter() - t0
+
+        results = {}
+        for kind, path in (("csv", csv_path), ("snapshot", out_dir)):
+            out = subprocess.run(
+                [sys.executable, "-m", "app.catalog_compiler", "--measure", kind, path],
+                capture_output=True, text=True, check=True,
+            )
+            results[kind] = json.loads(out.stdout.strip().splitlines()[-1])
+
+        gen_dir = os.path.join(out_dir, open(os.path.join(out_dir, "CURRENT")).read().strip())
+        disk = sum(os.path.getsize(os.path.join(gen_dir, f)) for f in os.listdir(gen_dir))
+        print(f"[Catalog] rows={rows} csv={os.path.getsize(csv_path) / 1e6:.1f}MB "
+              f"snapshot={disk / 1e6:.1f}MB compile={compile_s:.2f}s")
+        for kind, r in results.items():
+            print(f"[Catalog] {kind:9s} load={r['load_s']}s first_filter={r['first_filter_s']}s "
+                  f"rss=+{r['rss_mb']}MB hits={r['hits']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile the property catalog snapshot")
+    parser.add_argument("--csv", default=settings.PROPERTIES_CSV)
+    parser.add_argument("--mysql", default=None, help="SQLAlchemy URL; read the properties table")
+    parser.add_argument("--out", default=settings.CATALOG_DIR)
+    parser.add_argument("--no-embeddings", action="store_true")
+    parser.add_argument("--bench", type=int, default=0, help="benchmark with N synthetic rows")
+    parser.add_argument("--measure", nargs=2, metavar=("KIND", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(_measure(*args.measure)))
+    elif args.bench:
+        benchmark(args.bench)
+    else:
+        name = compile_catalog(args.csv, args.mysql, args.out, embeddings=not args.no_embeddings)
+        print(f"[Catalog] Snapshot ready: {os.path.join(args.out, name)}")
\ No newline at end of file
@@ -0,0 +1,148 @@
+"""
+catalog_watcher.py — Hot catalog reload without restarting workers
+------------------------------------------------------------------
+A daemon thread per worker that:
+ - polls the listings CSV (mtime/size) and, when it changed, rebuilds the
+   next catalog generation in the background: new typed frame, filter
+   columns and only the vector deltas for new/edited listings (one worker
+   per host does this, the others skip)
+ - polls CURRENT and swaps newly published generations in off the request
+   path (SharedCatalog.refresh prepares everything before the swap)
+
+Listings uploaded through the API (source == "upload") are not in the
+upstream source, so they are carried over into rebuilt generations: the
+ones in the generation the rebuild started from, and, re-read under the
+writer lock just before publishing, any appended while it ran. Uploads
+keep their ids (numbered from UPLOAD_ID_START); one that collides with a
+source id is renumbered rather than dropped.
+"""
+
+import threading
+import time
+from typing import Dict, Optional
+
+import pandas as pd
+
+from app import catalog
+from app.catalog_compiler import read_source, source_version
+from app.metrics import span
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+
+class CatalogWatcher:
+    def __init__(self, store, interval: float):
+        self.store = store
+        self.interval = interval
+        self.last_rebuild: Optional[Dict] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="catalog-watcher", daemon=True)
+            self._thread.start()
+            print(f"[Catalog] Watching source every {self.interval}s")
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"[Catalog] Watcher error: {e}")
+
+    def check(self):
+        """One poll: rebuild if the source moved on, then pick up any new CURRENT."""
+        shared = self.store.catalog
+        version = source_version(self.store.csv_path)
+        generation = shared.current()
+        if version is not None and version != generation.manifest.get("source_version"):
+            self.rebuild(version)
+        shared.refresh()
+
+    def rebuild(self, version: str):
+        shared = self.store.catalog
+        with shared.rebuild_lock() as acquired:
+            if not acquired:
+                return   # another worker is rebuilding; we'll swap when it publishes
+            shared.refresh()
+            base = shared.current()
+            if base.manifest.get("source_version") == version:
+                return
+
+            t0 = time.perf_counter()
+            with span("catalog.rebuild"):
+                df = read_source(self.store.csv_path)
+                df = self._carry_over_uploads(df, base)
+                embeddings = None
+                if self.store.vector_enabled:
+                    embeddings = catalog.embed_delta(df, base, self.store.embedder)
+
+                def merge_late_uploads(latest, df, embeddings):
+                    return self._merge_late_uploads(base, latest, df, embeddings)
+
+                name = shared.publish(df, embeddings, meta={"source_version": version},
+                                      rebase=merge_late_uploads)
+            self.last_rebuild = {
+                "generation": name,
+                "rows": len(df),
+                "rebuild_s": round(time.perf_counter() - t0, 3),
+                "at": time.time(),
+            }
+            print(f"[Catalog] Rebuilt {name} from changed source in {self.last_rebuild['rebuild_s']}s")
+
+    @staticmethod
+    def _uploads(generation) -> pd.DataFrame:
+        if "source" not in generation.table.column_names:
+            return pd.DataFrame()
+        current = generation.to_pandas()
+        uploads = current[current["source"] == "upload"]
+        return uploads.astype({c: object for c in uploads.columns if uploads[c].dtype.name == "category"})
+
+    @staticmethod
+    def _concat_uploads(df: pd.DataFrame, uploads: pd.DataFrame) -> pd.DataFrame:
+        renumbered = catalog.assign_ids(uploads, df)
+        moved = int((renumbered["id"].to_numpy() != pd.to_numeric(uploads["id"], errors="coerce").to_numpy()).sum())
+        if moved:
+            print(f"[Catalog] Renumbered {moved} uploads whose ids were already taken")
+        return pd.concat([df, renumbered], ignore_index=True)
+
+    def _carry_over_uploads(self, df: pd.DataFrame, base) -> pd.DataFrame:
+        uploads = self._uploads(base)
+        return df if uploads.empty else self._concat_uploads(df, uploads)
+
+    def _merge_late_uploads(self, base, latest, df: pd.DataFrame, embeddings):
+        """Under the writer lock: add uploads published after `base` was read."""
+        if latest is None or latest.name == base.name:
+            return df, embeddings
+        uploads = self._uploads(latest)
+        if uploads.empty:
+            return df, embeddings
+        # Ids are unique per generation, so anything not in `base` arrived during the rebuild
+        base_ids = pd.to_numeric(base.table.column("id").to_pandas(), errors="coerce")
+        late = uploads[~pd.to_numeric(uploads["id"], errors="coerce").isin(base_ids.dropna())]
+        if late.empty:
+            return df, embeddings
+        print(f"[Catalog] Merging {len(late)} uploads published during the rebuild")
+        if embeddings is not None:
+            # Their vectors are already in `latest` (the frame index is the row number there)
+            late_vectors = (np.asarray(latest.embeddings)[late.index.to_numpy()] if latest.embeddings is not None
+                            else catalog.embed_documents(late, self.store.embedder))
+            embeddings = np.vstack([np.asarray(embeddings), late_vectors]).astype(np.float32)
+        return self._concat_uploads(df, late), embeddings
+
+    def status(self) -> Dict:
+        generation = self.store.catalog.current()
+        return {
+            "generation": generation.name,
+            "rows": len(generation),
+            "source_version": generation.manifest.get("source_version"),
+            "last_swap": self.store.catalog.last_swap,
+            "last_rebuild": self.last_rebuild,
+        }
\ No newline at end of file
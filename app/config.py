@@ -5,22 +5,120 @@ from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     APP_HOST: str = '0.0.0.0'
     APP_PORT: int = 8000
+    # Skip the warmup stage and build heavy components on first use
+    FAST_STARTUP: bool = os.getenv('FAST_STARTUP', 'false').lower() == 'true'
     # LLM
     LLM_API_URL: str = os.getenv('LLM_API_URL', 'https://api.groq.com/openai/v1/chat/completions')
     LLM_API_KEY: str = os.getenv('LLM_API_KEY', '')
+    LLM_MODEL: str = os.getenv('LLM_MODEL', 'llama-3.3-70b-versatile')
+    # Provider routing (app/llm_providers.py): optional alternate endpoint and local model server
+    LLM_ALT_API_URL: str = os.getenv('LLM_ALT_API_URL', '')
+    LLM_ALT_API_KEY: str = os.getenv('LLM_ALT_API_KEY', '')
+    LLM_ALT_MODEL: str = os.getenv('LLM_ALT_MODEL', '')
+    LLM_LOCAL_URL: str = os.getenv('LLM_LOCAL_URL', '')
+    LLM_LOCAL_MODEL: str = os.getenv('LLM_LOCAL_MODEL', 'llama3.2:1b')
+    # Hedge after the provider's own p95 (default delay until it has samples)
+    LLM_HEDGE_ENABLED: bool = os.getenv('LLM_HEDGE_ENABLED', 'true').lower() == 'true'
+    LLM_HEDGE_PERCENTILE: float = float(os.getenv('LLM_HEDGE_PERCENTILE', 95))
+    LLM_HEDGE_MIN_DELAY_MS: float = float(os.getenv('LLM_HEDGE_MIN_DELAY_MS', 200))
+    LLM_HEDGE_DEFAULT_DELAY_MS: float = float(os.getenv('LLM_HEDGE_DEFAULT_DELAY_MS', 2000))
+    LLM_HEALTH_WINDOW: int = int(os.getenv('LLM_HEALTH_WINDOW', 200))
+    LLM_CIRCUIT_FAILURES: int = int(os.getenv('LLM_CIRCUIT_FAILURES', 5))
+    LLM_CIRCUIT_COOLDOWN_SECONDS: float = float(os.getenv('LLM_CIRCUIT_COOLDOWN_SECONDS', 30))
+    # Prompt token budgets (app/prompts.py): listing rows per summary, seller text per extraction
+    LLM_PROMPT_TOKEN_BUDGET: int = int(os.getenv('LLM_PROMPT_TOKEN_BUDGET', 600))
+    LLM_EXTRACT_INPUT_TOKENS: int = int(os.getenv('LLM_EXTRACT_INPUT_TOKENS', 400))
+    # Per-request deadline for /query (app/deadline.py); X-Deadline-Ms overrides, up to the max
+    QUERY_DEADLINE_SECONDS: float = float(os.getenv('QUERY_DEADLINE_SECONDS', 10))
+    QUERY_DEADLINE_MAX_SECONDS: float = float(os.getenv('QUERY_DEADLINE_MAX_SECONDS', 60))
+    # Least time left for a stage to be attempted rather than skipped / degraded
+    DEADLINE_SEMANTIC_MIN_SECONDS: float = float(os.getenv('DEADLINE_SEMANTIC_MIN_SECONDS', 0.2))
+    DEADLINE_LLM_MIN_SECONDS: float = float(os.getenv('DEADLINE_LLM_MIN_SECONDS', 1.0))
     # Email / Twilio
     SMTP_HOST: str = os.getenv('SMTP_HOST', 'smtp.gmail.com')
     SMTP_PORT: int = int(os.getenv('SMTP_PORT', 587))
     SMTP_USER: str = os.getenv('SMTP_USER', '')
     SMTP_PASS: str = os.getenv('SMTP_PASS', '')
+    SMTP_STARTTLS: bool = os.getenv('SMTP_STARTTLS', 'true').lower() == 'true'
+    SMTP_POOL_SIZE: int = int(os.getenv('SMTP_POOL_SIZE', 2))
+    SMTP_BATCH: int = int(os.getenv('SMTP_BATCH', 20))
+    SMTP_IDLE_SECONDS: float = float(os.getenv('SMTP_IDLE_SECONDS', 60))
     # Data sources
     PROPERTIES_CSV: str = os.getenv('PROPERTIES_CSV', '/data/properties.csv')
     MYSQL_URL: str = os.getenv('MYSQL_URL', '')
+    # Shared memory-mapped catalog (one copy per host, see app/catalog.py); empty disables it
+    CATALOG_DIR: str = os.getenv('CATALOG_DIR', 'data/catalog')
+    CATALOG_REFRESH_SECONDS: float = float(os.getenv('CATALOG_REFRESH_SECONDS', 1.0))
+    CATALOG_KEEP_GENERATIONS: int = int(os.getenv('CATALOG_KEEP_GENERATIONS', 2))
+    # Appends add an Arrow segment per generation; past this many they are compacted into one
+    CATALOG_MAX_SEGMENTS: int = int(os.getenv('CATALOG_MAX_SEGMENTS', 32))
+    # Background hot reload: poll interval for source changes (0 disables the watcher)
+    CATALOG_WATCH_SECONDS: float = float(os.getenv('CATALOG_WATCH_SECONDS', 5))
+    # Change marker recorded for snapshots compiled from MySQL (catalog_compiler --mysql)
+    CATALOG_VERSION_QUERY: str = os.getenv('CATALOG_VERSION_QUERY', 'CHECKSUM TABLE properties')
+    # API uploads are numbered from here, clear of the source's own ids
+    UPLOAD_ID_START: int = int(os.getenv('UPLOAD_ID_START', 1000000000))
+    # Vector search backend: exact | hnsw | ivfpq (see app/vector_index.py)
+    VECTOR_BACKEND: str = os.getenv('VECTOR_BACKEND', 'hnsw')
+    ANN_MIN_ROWS: int = int(os.getenv('ANN_MIN_ROWS', 20000))
+    ANN_PREFILTER_EXACT_ROWS: int = int(os.getenv('ANN_PREFILTER_EXACT_ROWS', 5000))
+    HNSW_M: int = int(os.getenv('HNSW_M', 32))
+    HNSW_EF_CONSTRUCTION: int = int(os.getenv('HNSW_EF_CONSTRUCTION', 80))
+    HNSW_EF_SEARCH: int = int(os.getenv('HNSW_EF_SEARCH', 64))
+    IVF_NLIST: int = int(os.getenv('IVF_NLIST', 0))
+    IVF_NPROBE: int = int(os.getenv('IVF_NPROBE', 16))
+    PQ_M: int = int(os.getenv('PQ_M', 0))
+    ANN_REFINE_FACTOR: int = int(os.getenv('ANN_REFINE_FACTOR', 4))
+    # Precomputed similar-listings table (app/neighbors.py)
+    SIMILAR_K: int = int(os.getenv('SIMILAR_K', 20))
+    # Query spelling correction (app/spelling.py)
+    SPELL_MAX_DISTANCE: int = int(os.getenv('SPELL_MAX_DISTANCE', 2))
+    SPELL_MIN_LENGTH: int = int(os.getenv('SPELL_MIN_LENGTH', 4))
+    SPELL_CACHE_SIZE: int = int(os.getenv('SPELL_CACHE_SIZE', 65536))
+    # Facet counts in /query responses (app/facets.py)
+    FACET_MAX_LOCATIONS: int = int(os.getenv('FACET_MAX_LOCATIONS', 20))
+    # Batch query API (/query/batch, app/batch_query.py)
+    BATCH_MAX_QUERIES: int = int(os.getenv('BATCH_MAX_QUERIES', 200))
+    BATCH_MAX_RESULTS: int = int(os.getenv('BATCH_MAX_RESULTS', 20))
+    BATCH_SUMMARY_GROUP: int = int(os.getenv('BATCH_SUMMARY_GROUP', 10))
+    # Query embedding service (app/embedding_service.py)
+    EMBED_BATCH_WINDOW_MS: float = float(os.getenv('EMBED_BATCH_WINDOW_MS', 2))
+    EMBED_MAX_BATCH: int = int(os.getenv('EMBED_MAX_BATCH', 32))
+    EMBED_CACHE_SIZE: int = int(os.getenv('EMBED_CACHE_SIZE', 4096))
     # Redis
     REDIS_URL: str = os.getenv('REDIS_URL', 'redis://redis:6379/0')
+    HISTORY_MAX_ITEMS: int = int(os.getenv('HISTORY_MAX_ITEMS', 50))
+    HISTORY_COMPACT_BATCH: int = int(os.getenv('HISTORY_COMPACT_BATCH', 25))
+    HISTORY_SUMMARY_TERMS: int = int(os.getenv('HISTORY_SUMMARY_TERMS', 20))
     TWILIO_SID: str = os.getenv('TWILIO_SID', '')
     TWILIO_TOKEN: str = os.getenv('TWILIO_TOKEN', '')
     TWILIO_FROM: str = os.getenv('TWILIO_FROM', '')
+    # Notification dispatch (app/notifier.py)
+    EMAIL_RATE_PER_SEC: float = float(os.getenv('EMAIL_RATE_PER_SEC', 5))
+    WHATSAPP_RATE_PER_SEC: float = float(os.getenv('WHATSAPP_RATE_PER_SEC', 1))
+    NOTIFY_MAX_ATTEMPTS: int = int(os.getenv('NOTIFY_MAX_ATTEMPTS', 4))
+    NOTIFY_RETRY_BASE_SECONDS: float = float(os.getenv('NOTIFY_RETRY_BASE_SECONDS', 2))
+    NOTIFY_STATUS_KEEP: int = int(os.getenv('NOTIFY_STATUS_KEEP', 10000))
+    ADVERTISER_EMAIL: str = os.getenv('ADVERTISER_EMAIL', '')
+    ADVERTISER_WHATSAPP: str = os.getenv('ADVERTISER_WHATSAPP', '')
+    # Site visits (app/scheduler.py); hours are local time
+    VISIT_MINUTES: int = int(os.getenv('VISIT_MINUTES', 60))
+    VISIT_SLOT_MINUTES: int = int(os.getenv('VISIT_SLOT_MINUTES', 30))
+    VISIT_DAY_START: int = int(os.getenv('VISIT_DAY_START', 10))
+    VISIT_DAY_END: int = int(os.getenv('VISIT_DAY_END', 19))
+    # Saved-search alerts (app/saved_searches.py)
+    SAVED_SEARCHES_PATH: str = os.getenv('SAVED_SEARCHES_PATH', 'data/saved_searches.jsonl')
+    SAVED_SEARCH_DIGEST_SECONDS: float = float(os.getenv('SAVED_SEARCH_DIGEST_SECONDS', 60))
+    SAVED_SEARCH_DIGEST_MAX: int = int(os.getenv('SAVED_SEARCH_DIGEST_MAX', 10))
+    # Near-duplicate listing detection (app/dedup.py)
+    DEDUP_ENABLED: bool = os.getenv('DEDUP_ENABLED', 'true').lower() == 'true'
+    DEDUP_NUM_PERM: int = int(os.getenv('DEDUP_NUM_PERM', 64))
+    DEDUP_BANDS: int = int(os.getenv('DEDUP_BANDS', 16))
+    DEDUP_THRESHOLD: float = float(os.getenv('DEDUP_THRESHOLD', 0.7))
+    DEDUP_NUMERIC_TOLERANCE: float = float(os.getenv('DEDUP_NUMERIC_TOLERANCE', 0.02))
+    # Admin endpoints (profiling); disabled when no token is set
+    ADMIN_TOKEN: str = os.getenv('ADMIN_TOKEN', '')
+    PROFILE_MAX_SECONDS: int = int(os.getenv('PROFILE_MAX_SECONDS', 120))
     
 class Config:
     env_file = '.env'
@@ -0,0 +1,156 @@
+"""
+deadline.py — Per-request time budget for the query pipeline
+-------------------------------------------------------------
+A /query gets one budget (X-Deadline-Ms header, else QUERY_DEADLINE_SECONDS)
+instead of each stage carrying its own 30s timeout. The Deadline lives in a
+context variable, like the metrics trace, so it follows the request into
+asyncio.to_thread workers without being threaded through every signature:
+ - stages size their own timeouts from it (deadline.timeout(cap)) — the LLM
+   HTTP call, the query-embedding wait
+ - stages that can't fit skip or fall back to a cheaper path and record
+   it (Deadline.degrade), e.g. semantic search is skipped and the template
+   summary replaces the LLM one
+The recorded degradations are returned with the response.
+    python -m app.deadline --bench     # /query-style summarize against a slow mock LLM
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from app.config import settings
+from app.metrics import FALLBACKS
+
+_current: contextvars.ContextVar = contextvars.ContextVar("realestate_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+# What a stage raises when its share of the budget runs out (distinct classes before Python 3.11)
+TIMEOUTS = (TimeoutError, asyncio.TimeoutError, concurrent.futures.TimeoutError)
+
+
+class Deadline:
+    def __init__(self, seconds: Optional[float] = None):
+        self.budget = float(seconds if seconds is not None else settings.QUERY_DEADLINE_SECONDS)
+        self.expires = time.monotonic() + self.budget
+        self.degraded: List[Dict] = []
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def allows(self, seconds: float) -> bool:
+        """Whether a stage needing about `seconds` can still finish."""
+        return self.remaining() >= seconds
+
+    def degrade(self, stage: str, reason: str):
+        """Record that `stage` was skipped or replaced by its fallback."""
+        FALLBACKS.labels(f"deadline.{stage}").inc()
+        self.degraded.append({"stage": stage, "reason": reason,
+                              "remaining_ms": round(self.remaining() * 1000, 1)})
+
+
+def current() -> Optional[Deadline]:
+    return _current.get()
+
+
+@contextmanager
+def scope(deadline: Deadline):
+    """Make `deadline` the current one for the block (and threads started from it)."""
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def timeout(cap: float) -> float:
+    """A stage's timeout: `cap`, shortened to what is left of the current deadline."""
+    deadline = _current.get()
+    if deadline is None:
+        return cap
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        raise DeadlineExceeded("request deadline exceeded")
+    return min(cap, remaining)
+
+
+def allows(seconds: float) -> bool:
+    deadline = _current.get()
+    return deadline is None or deadline.allows(seconds)
+
+
+def degrade(stage: str, reason: str):
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.degrade(stage, reason)
+
+
+# ---------------------------
+# Benchmark: summarize against a mock LLM with injected latency
+# ---------------------------
+if __name__ == "__main__":
+    import argparse
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    parser = argparse.ArgumentParser(description="Deadline propagation benchmark")
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--budget", type=float, default=2.0)
+    args = parser.parse_args()
+
+    latency = {"seconds": 0.0}
+
+    class MockLLM(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(latency["seconds"])
+            body = json.dumps({"choices": [{"message": {"content": "Two good options in Noida."}}],
+                               "usage": {"prompt_tokens": 120, "completion_tokens": 8}}).encode()
+            try:
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except OSError:
+                pass                                # client gave up at its deadline
+
+        def log_message(self, *a):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockLLM)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    from app.llm_client import GroqLllmClient
+    # The client reads app.deadline's context variable, not this __main__ copy's
+    from app.deadline import Deadline, scope
+    llm = GroqLllmClient(base_url=f"http://127.0.0.1:{server.server_port}/v1/chat/completions")
+    properties = [{"title": "3BHK Apartment", "location": "Sector 62, Noida", "bhk": 3, "price": "85 Lakh"},
+                  {"title": "2BHK Flat", "location": "Sector 76, Noida", "bhk": 2, "price": "60 Lakh"}]
+
+    print(f"[Deadline] budget {args.budget:.1f}s per request")
+    for delay in (0.1, 1.5, 5.0):
+        latency["seconds"] = delay
+        deadline = Deadline(args.budget)
+        t0 = time.perf_counter()
+        with scope(deadline):
+            summary = llm.summarize(properties)
+        elapsed = time.perf_counter() - t0
+        kind = "template" if summary.startswith("Here are") else "LLM"
+        print(f"[Deadline] LLM latency {delay:.1f}s -> answered in {elapsed:.2f}s with the {kind} summary, "
+              f"degraded: {[d['stage'] + ':' + d['reason'] for d in deadline.degraded]}")
+    latency["seconds"] = 5.0
+    t0 = time.perf_counter()
+    llm.summarize(properties)
+    print(f"[Deadline] without a deadline the same call takes {time.perf_counter() - t0:.2f}s")
+    server.shutdown()
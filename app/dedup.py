@@ -0,0 +1,402 @@
+"""
+dedup.py — Near-duplicate listing detection (MinHash + LSH)
+------------------------------------------------------------
+Brokers re-post the same flat with slightly edited text. Listings are
+compared in two parts:
+ - text: title, type and description, cut into character 5-gram shingles
+   and summarised by a DEDUP_NUM_PERM-value MinHash signature (matching
+   signature positions estimate the Jaccard similarity of the shingle sets)
+ - facts: locality and bhk must be equal, and price / area (when both
+   sides have them) must be within DEDUP_NUMERIC_TOLERANCE of each other
+
+Templated listings ("Spacious 3BHK apartment with parking and lift") have
+near-identical text, so the facts are what tells two different flats apart.
+
+Candidates come from LSH banding: the signature is split into DEDUP_BANDS
+bands and each band hash is salted with the (locality, bhk) block, so only
+listings in the same block that share a band are ever compared (with 16
+bands of 4 rows a pair at Jaccard 0.8 collides with probability > 0.999,
+one at 0.3 about 0.12). Candidates are confirmed when the estimated
+similarity is at least DEDUP_THRESHOLD and the facts agree.
+
+Catalog generations persist the signatures, the per-band sorted hashes, the
+numeric facts and each row's duplicate-cluster id (minhash.npy,
+lsh_keys.npy, lsh_rows.npy, dedup_attrs.npy, dup_group.npy), so an upload
+check is one searchsorted per band over memory-mapped arrays and results
+can be collapsed per cluster without any extra work.
+    python -m app.dedup --bench 100000     # throughput, lookup latency, precision/recall
+"""
+
+import os
+import re
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from . import catalog
+from .config import settings
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+MINHASH_FILE = "minhash.npy"
+LSH_KEYS_FILE = "lsh_keys.npy"
+LSH_ROWS_FILE = "lsh_rows.npy"
+ATTRS_FILE = "dedup_attrs.npy"
+DUP_GROUP_FILE = "dup_group.npy"
+
+SHINGLE = 5
+_MAX_BUCKET = 64
+_TEXT_FIELDS = ('title', 'type', 'description')
+
+
+def _normalize(value) -> str:
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    return re.sub(r"[^a-z0-9]+", " ", str(value).lower()).strip()
+
+
+def dedup_text(record: Dict) -> str:
+    """
+    Text compared for duplicates, letters and digits only so spacing and
+    punctuation edits ("3BHK" vs "3 BHK!") don't count; contact details and
+    media links are ignored.
+    """
+    return "".join(_normalize(record.get(f)) for f in _TEXT_FIELDS).replace(" ", "")
+
+
+def _block(record: Dict) -> int:
+    try:
+        bhk = int(record.get("bhk"))
+    except (TypeError, ValueError):
+        bhk = ""
+    return zlib.crc32(f"{_normalize(record.get('location'))}|{bhk}".encode())
+
+
+def _attrs(record: Dict) -> Tuple[float, float]:
+    price = catalog.parse_price(record.get("price_value", record.get("price")))
+    try:
+        area = float(record.get("area_sqft", record.get("area")))
+    except (TypeError, ValueError):
+        area = np.nan
+    return (price or np.nan), (area if area > 0 else np.nan)
+
+
+# ---------------------------
+# Signatures
+# ---------------------------
+def _shingle_codes(texts: List[str]):
+    """Every SHINGLE-byte window packed exactly into a uint64, plus the window count per text."""
+    data = [t.encode("utf-8").ljust(SHINGLE) for t in texts]
+    lengths = np.array([len(d) for d in data], dtype=np.int64)
+    counts = lengths - SHINGLE + 1
+    buf = np.frombuffer(b"".join(data), dtype=np.uint8).astype(np.uint64)
+    text_starts = np.cumsum(lengths) - lengths
+    first = np.cumsum(counts) - counts
+    pos = np.arange(counts.sum()) - np.repeat(first, counts) + np.repeat(text_starts, counts)
+    codes = np.zeros(len(pos), dtype=np.uint64)
+    for k in range(SHINGLE):
+        codes |= buf[pos + k] << np.uint64(8 * k)
+    return codes, counts
+
+
+def _permutations(num_perm: int, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 63, num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+    return a[:, None], b[:, None]
+
+
+def signatures(texts: List[str], num_perm: Optional[int] = None, chunk: int = 512) -> "np.ndarray":
+    """MinHash signatures, shape (len(texts), num_perm), uint32."""
+    num_perm = num_perm or settings.DEDUP_NUM_PERM
+    a, b = _permutations(num_perm)
+    out = np.empty((len(texts), num_perm), dtype=np.uint32)
+    for start in range(0, len(texts), chunk):
+        codes, counts = _shingle_codes(texts[start:start + chunk])
+        # Multiply-shift hashing: (a*x + b) mod 2^64, keep the high 32 bits
+        permuted = (a * codes + b) >> np.uint64(32)
+        out[start:start + len(counts)] = np.minimum.reduceat(permuted, np.cumsum(counts) - counts, axis=1).T
+    return out
+
+
+def features(records: List[Dict]):
+    """(signatures, blocks, attrs) for a list of listing dicts."""
+    sigs = signatures([dedup_text(r) for r in records])
+    blocks = np.fromiter((_block(r) for r in records), dtype=np.uint64, count=len(records))
+    attrs = np.array([_attrs(r) for r in records], dtype=np.float32).reshape(len(records), 2)
+    return sigs, blocks, attrs
+
+
+def frame_features(df: pd.DataFrame):
+    return features(df.to_dict("records"))
+
+
+def band_keys(sigs: "np.ndarray", blocks: "np.ndarray", bands: Optional[int] = None) -> "np.ndarray":
+    """One uint64 hash per (band, row), salted with the row's block: shape (bands, n)."""
+    bands = bands or settings.DEDUP_BANDS
+    n, num_perm = sigs.shape
+    rows = num_perm // bands
+    keys = np.zeros((bands, n), dtype=np.uint64)
+    sigs = sigs.astype(np.uint64)
+    for band in range(bands):
+        h = np.asarray(blocks, dtype=np.uint64) + np.uint64(band + 1)
+        for j in range(band * rows, (band + 1) * rows):
+            h = h * np.uint64(0x100000001B3) ^ sigs[:, j]    # FNV-style mix, wraps mod 2^64
+        keys[band] = h
+    return keys
+
+
+def similarity(sig: "np.ndarray", others: "np.ndarray") -> "np.ndarray":
+    """Estimated Jaccard between one signature and each row of `others`."""
+    return (np.asarray(others) == sig).mean(axis=1)
+
+
+def _facts_agree(attr: "np.ndarray", others: "np.ndarray") -> "np.ndarray":
+    """Price/area within tolerance wherever both sides know them (row-wise, broadcasting)."""
+    others = np.asarray(others)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rel = np.abs(others - attr) / np.maximum(np.abs(others), np.abs(attr))
+    return ~(rel > settings.DEDUP_NUMERIC_TOLERANCE).any(axis=1)
+
+
+def _candidate_pairs(keys: "np.ndarray", n: int) -> "np.ndarray":
+    """Unique (i, j) row pairs, i < j, sharing at least one band bucket; encoded as i * n + j."""
+    triu = {}
+    pairs = []
+    for band in keys:
+        order = np.argsort(band, kind="stable")
+        sorted_keys = band[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        sizes = np.diff(np.r_[starts, n])
+        for s, m in zip(starts[sizes > 1], sizes[sizes > 1]):
+            # Buckets are small (same locality + bhk + band); cap pathological ones
+            m = min(int(m), _MAX_BUCKET)
+            if m not in triu:
+                triu[m] = np.triu_indices(m, 1)
+            members = order[s:s + m].astype(np.int64)
+            a, b = members[triu[m][0]], members[triu[m][1]]
+            pairs.append(np.minimum(a, b) * n + np.maximum(a, b))
+    return np.unique(np.concatenate(pairs)) if pairs else np.empty(0, dtype=np.int64)
+
+
+def clusters(sigs, blocks, attrs, keys=None, threshold: Optional[float] = None,
+             chunk: int = 65536) -> "np.ndarray":
+    """
+    Duplicate-cluster id per row (the smallest row index in its cluster):
+    LSH candidate pairs are verified in bulk, then joined with union-find.
+    """
+    threshold = settings.DEDUP_THRESHOLD if threshold is None else threshold
+    n = len(sigs)
+    parent = np.arange(n)
+    if n < 2:
+        return parent.astype(np.int32)
+    keys = band_keys(sigs, blocks) if keys is None else keys
+    sigs, attrs = np.asarray(sigs), np.asarray(attrs)
+
+    candidates = _candidate_pairs(keys, n)
+    confirmed = []
+    for start in range(0, len(candidates), chunk):
+        a, b = np.divmod(candidates[start:start + chunk], n)
+        ok = ((sigs[a] == sigs[b]).mean(axis=1) >= threshold) & _facts_agree(attrs[a], attrs[b])
+        confirmed.append(np.stack([a[ok], b[ok]], axis=1))
+
+    def find(i):
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+        while parent[i] != root:
+            parent[i], i = root, parent[i]
+        return root
+
+    for a, b in (np.concatenate(confirmed) if confirmed else ()):
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+    return np.array([find(i) for i in range(n)], dtype=np.int32)
+
+
+def drop_near_duplicates(df: pd.DataFrame) -> pd.DataFrame:
+    """Bulk ingestion: keep the first listing of each near-duplicate cluster."""
+    if not settings.DEDUP_ENABLED or len(df) < 2:
+        return df
+    groups = clusters(*frame_features(df))
+    keep = groups == np.arange(len(df))
+    if not keep.all():
+        print(f"[Dedup] Dropped {int((~keep).sum())} near-duplicate listings from {len(df)}")
+    return df[keep].reset_index(drop=True)
+
+
+def collapse(indices, groups) -> "np.ndarray":
+    """Keep the first (best-ranked) result of each duplicate cluster, preserving order."""
+    indices = np.asarray(indices, dtype=np.int64)
+    if len(indices) < 2 or groups is None:
+        return indices
+    _, first = np.unique(np.asarray(groups)[indices], return_index=True)
+    return indices[np.sort(first)]
+
+
+def write_index(directory: str, df: pd.DataFrame, base: Optional["DuplicateIndex"] = None) -> "np.ndarray":
+    """
+    Called while publishing a generation; returns the duplicate-cluster ids.
+    With `base` (the previous generation) `df` holds only the rows appended
+    after it, which are hashed and matched against it.
+    """
+    if base is not None:
+        n0 = len(base.sigs)
+        n = n0 + len(df)
+        new_sigs, new_blocks, new_attrs = frame_features(df)
+        sigs = np.concatenate([np.asarray(base.sigs), new_sigs])
+        attrs = np.concatenate([np.asarray(base.attrs), new_attrs])
+        groups = np.concatenate([np.asarray(base.groups), np.arange(n0, n, dtype=np.int32)])
+        for j in range(len(new_sigs)):
+            hit = base.match(new_sigs[j], int(new_blocks[j]), new_attrs[j])
+            if hit is not None:
+                groups[n0 + j] = groups[hit[0]]
+        # Merge the new rows' band hashes into the sorted ones
+        keys = np.concatenate([np.asarray(base.keys), band_keys(new_sigs, new_blocks, len(base.keys))], axis=1)
+        rows = np.concatenate([np.asarray(base.rows),
+                               np.broadcast_to(np.arange(n0, n), (len(base.keys), n - n0))], axis=1)
+        order = np.argsort(keys, axis=1, kind="stable")
+        sorted_keys, rows = np.take_along_axis(keys, order, axis=1), np.take_along_axis(rows, order, axis=1)
+    else:
+        sigs, blocks, attrs = frame_features(df)
+        keys = band_keys(sigs, blocks)
+        rows = np.argsort(keys, axis=1, kind="stable")
+        sorted_keys = np.take_along_axis(keys, rows, axis=1)
+        groups = clusters(sigs, blocks, attrs, keys)
+    np.save(os.path.join(directory, MINHASH_FILE), sigs)
+    np.save(os.path.join(directory, LSH_KEYS_FILE), sorted_keys)
+    np.save(os.path.join(directory, LSH_ROWS_FILE), rows.astype(np.int32))
+    np.save(os.path.join(directory, ATTRS_FILE), attrs)
+    np.save(os.path.join(directory, DUP_GROUP_FILE), groups)
+    return groups
+
+
+class DuplicateIndex:
+    """LSH lookup over a fixed set of listings (a catalog generation or an in-memory frame)."""
+
+    def __init__(self, sigs, attrs, sorted_keys, rows, groups):
+        self.sigs = sigs
+        self.attrs = attrs
+        self.keys = sorted_keys
+        self.rows = rows
+        self.groups = groups
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["DuplicateIndex"]:
+        if not os.path.exists(os.path.join(directory, MINHASH_FILE)):
+            return None
+        load = lambda name: np.load(os.path.join(directory, name), mmap_mode="r")
+        return cls(load(MINHASH_FILE), load(ATTRS_FILE), load(LSH_KEYS_FILE), load(LSH_ROWS_FILE),
+                   load(DUP_GROUP_FILE))
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "DuplicateIndex":
+        sigs, blocks, attrs = frame_features(df)
+        keys = band_keys(sigs, blocks)
+        rows = np.argsort(keys, axis=1, kind="stable")
+        return cls(sigs, attrs, np.take_along_axis(keys, rows, axis=1), rows,
+                   clusters(sigs, blocks, attrs, keys))
+
+    def candidates(self, sig: "np.ndarray", block: int) -> "np.ndarray":
+        if len(self.sigs) == 0:
+            return np.empty(0, dtype=np.int64)
+        found = []
+        probe = band_keys(sig.reshape(1, -1), np.array([block], dtype=np.uint64), len(self.keys))[:, 0]
+        for band, key in enumerate(probe):
+            lo = np.searchsorted(self.keys[band], key, side="left")
+            hi = np.searchsorted(self.keys[band], key, side="right")
+            if hi > lo:
+                found.append(np.asarray(self.rows[band][lo:hi]))
+        return np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
+
+    def find(self, record: Dict, threshold: Optional[float] = None) -> Optional[Tuple[int, float]]:
+        """(row, estimated similarity) of the closest near-duplicate of `record`, if any."""
+        sigs, blocks, attrs = features([record])
+        return self.match(sigs[0], int(blocks[0]), attrs[0], threshold)
+
+    def match(self, sig, block: int, attr, threshold: Optional[float] = None) -> Optional[Tuple[int, float]]:
+        threshold = settings.DEDUP_THRESHOLD if threshold is None else threshold
+        rows = self.candidates(sig, block)
+        if len(rows) == 0:
+            return None
+        scores = similarity(sig, np.asarray(self.sigs)[rows])
+        scores[~_facts_agree(attr, np.asarray(self.attrs)[rows])] = 0
+        best = int(np.argmax(scores))
+        if scores[best] < threshold:
+            return None
+        return int(rows[best]), float(scores[best])
+
+
+# ---------------------------
+# Benchmark
+# ---------------------------
+def _reposts(df: pd.DataFrame, fraction: float, seed: int = 11) -> Tuple[pd.DataFrame, Dict[int, int]]:
+    """Append edited copies of a fraction of listings; returns (frame, copy row -> original row)."""
+    import random
+    rng = random.Random(seed)
+    originals = rng.sample(range(len(df)), int(len(df) * fraction))
+    copies, truth = [], {}
+    for i in originals:
+        row = df.iloc[i].to_dict()
+        words = str(row["description"]).split()
+        j = rng.randrange(len(words))
+        words[j] = words[j].upper() + rng.choice(["!", " - call now", ", best deal", ""])
+        row["description"] = " ".join(words)
+        row["title"] = str(row["title"]).replace("BHK", " BHK")
+        row["phone"] = f"97{rng.randint(10000000, 99999999)}"
+        truth[len(df) + len(copies)] = i
+        copies.append(row)
+    return pd.concat([df, pd.DataFrame(copies)], ignore_index=True), truth
+
+
+def benchmark(rows: int):
+    import tempfile
+    import time
+    from .catalog_compiler import _synthetic_csv
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "properties.csv")
+        _synthetic_csv(path, rows)
+        df, truth = _reposts(pd.read_csv(path), 0.05)
+
+    t0 = time.perf_counter()
+    sigs, blocks, attrs = frame_features(df)
+    sig_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    groups = clusters(sigs, blocks, attrs)
+    cluster_s = time.perf_counter() - t0
+
+    flagged = {i for i in range(len(df)) if groups[i] != i}
+    true_pos = sum(1 for i in flagged if i in truth and groups[i] == groups[truth[i]])
+    print(f"[Dedup] rows={len(df)} features {sig_s:.2f}s ({len(df) / sig_s:.0f} rows/s), "
+          f"clustering {cluster_s:.2f}s")
+    print(f"[Dedup] reposts={len(truth)} flagged={len(flagged)} "
+          f"recall={true_pos / max(1, len(truth)):.3f} precision={true_pos / max(1, len(flagged)):.3f}")
+
+    index = DuplicateIndex.from_frame(df.iloc[:rows])
+    probes = [df.iloc[i].to_dict() for i in list(truth)[:500]]
+    t0 = time.perf_counter()
+    hits = sum(1 for p in probes if index.find(p) is not None)
+    lookup_ms = (time.perf_counter() - t0) / len(probes) * 1000
+    t0 = time.perf_counter()
+    for p in probes[:50]:
+        sig, _, attr = features([p])
+        scores = similarity(sig[0], index.sigs)
+        scores[~_facts_agree(attr[0], index.attrs)] = 0
+        scores.max()
+    scan_ms = (time.perf_counter() - t0) / 50 * 1000
+    print(f"[Dedup] upload check: LSH lookup {lookup_ms:.3f} ms vs full scan {scan_ms:.2f} ms "
+          f"({hits}/{len(probes)} reposts caught)")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Near-duplicate detection benchmark")
+    parser.add_argument("--bench", type=int, default=100000)
+    args = parser.parse_args()
+    benchmark(args.bench)
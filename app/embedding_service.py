@@ -0,0 +1,221 @@
+"""
+embedding_service.py — In-process query embedding service
+----------------------------------------------------------
+Query embeddings go through one dedicated worker thread per process:
+ - concurrent requests are micro-batched: the worker takes the first
+   queued text, waits up to EMBED_BATCH_WINDOW_MS for more (max
+   EMBED_MAX_BATCH) and embeds them in a single model call
+ - vectors are cached in a bounded LRU keyed by normalized text, so
+   repeated queries skip the model entirely
+
+Callers block on a future (call it from a worker thread, e.g. via
+asyncio.to_thread, so the event loop keeps accepting requests to batch).
+    python -m app.embedding_service --bench      # QPS and added batching latency
+"""
+
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, List
+
+from app.config import settings
+from app.metrics import QUEUE_DEPTH, cache_lookup, registry
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+BATCH_SIZE = registry.histogram(
+    "realestate_embedding_batch_size", "Query texts embedded per model call",
+    buckets=(1, 2, 4, 8, 16, 32, 64))
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", str(text).lower()).strip()
+
+
+class EmbeddingService:
+    def __init__(self, embedder_factory: Callable, window_ms: float = None,
+                 max_batch: int = None, cache_size: int = None):
+        self._factory = embedder_factory
+        self._embedder = None
+        self.window = (window_ms if window_ms is not None else settings.EMBED_BATCH_WINDOW_MS) / 1000.0
+        self.max_batch = max_batch or settings.EMBED_MAX_BATCH
+        self.cache_size = cache_size if cache_size is not None else settings.EMBED_CACHE_SIZE
+        self._cache: "OrderedDict[str, object]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._pending = {}              # text -> Future, so identical in-flight texts share one slot
+        self._worker = None
+        self._start_lock = threading.Lock()
+        QUEUE_DEPTH.labels("embedding").set_function(self._queue.qsize)
+
+    # ---------------------------
+    # Cache
+    # ---------------------------
+    def _cached(self, key: str):
+        with self._cache_lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+        cache_lookup("query_embedding", vector is not None)
+        return vector
+
+    def _remember(self, key: str, vector):
+        if not self.cache_size:
+            return
+        with self._cache_lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # ---------------------------
+    # Public API
+    # ---------------------------
+    def embed(self, text: str, timeout: float = 30.0):
+        """Embedding for one query text (cached or micro-batched)."""
+        key = normalize_text(text)
+        vector = self._cached(key)
+        if vector is not None:
+            return vector
+        return self._submit(key).result(timeout=timeout)
+
+    def embed_many(self, texts: List[str], timeout: float = 30.0) -> List:
+        keys = [normalize_text(t) for t in texts]
+        # Hits are kept from the single lookup per key: waiting on the misses may evict them
+        hits, futures = {}, {}
+        for key in dict.fromkeys(keys):
+            vector = self._cached(key)
+            if vector is not None:
+                hits[key] = vector
+            else:
+                futures[key] = self._submit(key)
+        return [hits[k] if k in hits else futures[k].result(timeout=timeout) for k in keys]
+
+    def _submit(self, key: str) -> Future:
+        self._ensure_worker()
+        with self._start_lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pending[key] = Future()
+                self._queue.put(key)
+        return future
+
+    # ---------------------------
+    # Worker
+    # ---------------------------
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._start_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="embedding-service", daemon=True)
+                    self._worker.start()
+
+    def _collect(self) -> List[str]:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                if self._embedder is None:
+                    self._embedder = self._factory()
+                vectors = self._embedder(batch)
+                BATCH_SIZE.observe(len(batch))
+                results = [(key, np.asarray(vec, dtype=np.float32), None) for key, vec in zip(batch, vectors)]
+            except Exception as e:
+                results = [(key, None, e) for key in batch]
+            for key, vector, error in results:
+                if error is None:
+                    self._remember(key, vector)
+                with self._start_lock:
+                    future = self._pending.pop(key, None)
+                if future is None:
+                    continue
+                if error is None:
+                    future.set_result(vector)
+                else:
+                    future.set_exception(error)
+
+
+# Benchmark: sequential single-text calls vs concurrent micro-batched calls
+if __name__ == "__main__":
+    import argparse
+    from concurrent.futures import ThreadPoolExecutor
+
+    parser = argparse.ArgumentParser(description="Embedding service benchmark")
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--real", action="store_true", help="use chromadb's default ONNX model")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    if args.real:
+        from app.catalog import default_embedder
+        factory = default_embedder
+    else:
+        class _SimulatedModel:
+            """Fixed per-call overhead + per-text cost, roughly a small ONNX encoder on CPU."""
+            def __call__(self, texts):
+                time.sleep(0.004 + 0.0005 * len(texts))
+                return [np.full(384, len(t), dtype=np.float32) for t in texts]
+        factory = _SimulatedModel
+
+    texts = [f"{i % 5 + 1}bhk flat in sector {i} noida under {i % 90 + 10} lakh" for i in range(args.requests)]
+
+    model = factory()
+    t0 = time.perf_counter()
+    for t in texts:
+        model([t])
+    seq_s = time.perf_counter() - t0
+    print(f"[Embed] unbatched sequential: {args.requests / seq_s:.0f} QPS, {seq_s / args.requests * 1000:.2f} ms/query")
+
+    service = EmbeddingService(factory, cache_size=0)
+    service.embed("warmup")
+    latencies = []
+
+    def one(text):
+        start = time.perf_counter()
+        service.embed(text)
+        latencies.append(time.perf_counter() - start)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(one, texts))
+    batched_s = time.perf_counter() - t0
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(f"[Embed] batched x{args.concurrency}: {args.requests / batched_s:.0f} QPS, "
+          f"p50 {p50:.2f} ms, p99 {p99:.2f} ms (window {service.window * 1000:.1f} ms)")
+
+    solo = []
+    for t in texts[:50]:
+        start = time.perf_counter()
+        service.embed(t + " solo")
+        solo.append(time.perf_counter() - start)
+    solo_ms = sorted(solo)[len(solo) // 2] * 1000
+    print(f"[Embed] single uncontended query: {solo_ms:.2f} ms "
+          f"(+{solo_ms - seq_s / args.requests * 1000:.2f} ms over a direct model call)")
+
+    service.cache_size = 1024
+    service.embed(texts[0])
+    cached = time.perf_counter()
+    for _ in range(1000):
+        service.embed(texts[0])
+    print(f"[Embed] cache hit: {(time.perf_counter() - cached) / 1000 * 1e6:.1f} µs")
\ No newline at end of file
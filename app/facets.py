@@ -0,0 +1,159 @@
+"""
+facets.py — Result facet counts (bhk, type, price bucket, locality)
+--------------------------------------------------------------------
+On the shared catalog, facets come from the row indices the filters
+already selected: each facet is one gather of an integer-coded column
+(bhk, type_code, location_code, and a price-bucket code derived once per
+generation from price_num) and an np.bincount, with no pandas groupby and
+no second query. Other sources (MySQL rows, the in-memory frame, semantic matches) count the
+returned records.
+
+Facets are keyed by display label and ordered by count; localities are
+capped at FACET_MAX_LOCATIONS.
+    python -m app.facets --bench 100000     # facet overhead relative to the plain filter
+"""
+
+from collections import Counter
+from typing import Dict, List
+
+from app.config import settings
+from app.catalog import parse_price
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+# Price bucket upper edges in lakh, and their labels (one more label than edges)
+PRICE_EDGES = (25, 50, 100, 200, 500)
+PRICE_LABELS = ("Under 25 L", "25-50 L", "50 L-1 Cr", "1-2 Cr", "2-5 Cr", "5 Cr+")
+
+
+def _ranked(labels: List[str], counts, limit: int = 0) -> Dict[str, int]:
+    """Non-zero counts by label, largest first (only the top `limit` are materialized)."""
+    counts = np.asarray(counts)
+    nonzero = np.flatnonzero(counts)
+    order = nonzero[np.argsort(-counts[nonzero], kind="stable")]
+    if limit:
+        order = order[:limit]
+    return {str(labels[i]): int(counts[i]) for i in order if str(labels[i])}
+
+
+def _price_facet(counts) -> Dict[str, int]:
+    # Buckets keep their natural order rather than count order
+    return {label: int(c) for label, c in zip(PRICE_LABELS, counts) if c}
+
+
+def _price_codes(generation) -> "np.ndarray":
+    """Per-row price bucket (0 = unknown price), derived once per generation."""
+    codes = getattr(generation, "_price_bucket", None)
+    if codes is None:
+        price = np.asarray(generation.price_num)
+        codes = np.where(price > 0, np.searchsorted(PRICE_EDGES, price, side="right") + 1, 0).astype(np.int8)
+        generation._price_bucket = codes
+    return codes
+
+
+def from_codes(generation, indices) -> Dict[str, Dict[str, int]]:
+    """Facets for the selected rows of a catalog generation."""
+    indices = np.asarray(indices, dtype=np.int64)
+    # bhk is -1 when unknown; shift so it can be bincounted and drop the unknown/0 slots
+    bhk_counts = np.bincount(np.asarray(generation.bhk)[indices] + 1)[2:]
+    type_counts = np.bincount(np.asarray(generation.type_code)[indices], minlength=len(generation.types))
+    location_counts = np.bincount(np.asarray(generation.location_code)[indices],
+                                  minlength=len(generation.locations))
+    price_counts = np.bincount(_price_codes(generation)[indices], minlength=len(PRICE_LABELS) + 1)[1:]
+    return {
+        "bhk": {str(b + 1): int(c) for b, c in enumerate(bhk_counts) if c},
+        "type": _ranked(generation.types, type_counts),
+        "price": _price_facet(price_counts),
+        "location": _ranked(generation.locations, location_counts, settings.FACET_MAX_LOCATIONS),
+    }
+
+
+def from_records(records: List[Dict]) -> Dict[str, Dict[str, int]]:
+    """Facets for already materialized rows (MySQL, in-memory frame, semantic matches)."""
+    bhk, types, locations = Counter(), Counter(), Counter()
+    prices = [0] * len(PRICE_LABELS)
+    edges = np.asarray(PRICE_EDGES)
+    for record in records:
+        try:
+            value = int(record.get("bhk"))
+            if value > 0:
+                bhk[value] += 1
+        except (TypeError, ValueError):
+            pass
+        for counter, key in ((types, "type"), (locations, "location")):
+            if record.get(key):
+                counter[str(record[key])] += 1
+        price = parse_price(record.get("price_value", record.get("price")))
+        if price > 0:
+            prices[int(np.searchsorted(edges, price, side="right"))] += 1
+    return {
+        "bhk": {str(b): bhk[b] for b in sorted(bhk)},
+        "type": dict(types.most_common()),
+        "price": _price_facet(prices),
+        "location": dict(locations.most_common(settings.FACET_MAX_LOCATIONS)),
+    }
+
+
+# ---------------------------
+# Benchmark: filter vs filter + facets
+# ---------------------------
+if __name__ == "__main__":
+    import argparse
+    import contextlib
+    import io
+    import os
+    import tempfile
+    import time
+
+    from app.catalog_compiler import _synthetic_csv
+
+    parser = argparse.ArgumentParser(description="Facet overhead benchmark")
+    parser.add_argument("--bench", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    queries = [{"location": "noida"}, {"location": "noida", "bhk": 3}, {"prop_type": "villa", "max_price": 200},
+               {"location": "gurugram", "max_price": 90}, {"bhk": 2}]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "properties.csv")
+        _synthetic_csv(path, args.bench)
+        settings.CATALOG_DIR = os.path.join(tmp, "catalog")
+        settings.CATALOG_WATCH_SECONDS = 0
+        os.environ["USE_VECTOR"] = "false"
+        from app.store import PropertyStore
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            store = PropertyStore(csv_path=path)
+            generation = store.catalog.current()
+
+            def timed_run(fn, repeat=args.repeat):
+                t0 = time.perf_counter()
+                for _ in range(repeat):
+                    for q in queries:
+                        fn(q)
+                return (time.perf_counter() - t0) / (repeat * len(queries)) * 1000
+
+            filter_ms = timed_run(lambda q: store._filter_indices(generation, **q))
+            codes_ms = timed_run(lambda q: from_codes(generation, store._filter_indices(generation, **q)))
+            # Materializing tens of thousands of rows dominates; fewer rounds suffice
+            search_ms = timed_run(lambda q: store.search_properties(**q), 3)
+            rows = store.search_properties(**queries[0])
+            t0 = time.perf_counter()
+            from_records(rows)
+            records_ms = (time.perf_counter() - t0) * 1000
+            df = generation.to_pandas()
+            t0 = time.perf_counter()
+            result = store._filter_df(df, **queries[0])
+            [result.groupby(col, observed=True).size() for col in ("bhk", "type", "location")]
+            groupby_ms = (time.perf_counter() - t0) * 1000
+
+        print(f"[Facets] {len(generation)} listings, {len(queries)} query shapes")
+        print(f"[Facets] filter {filter_ms:.3f} ms -> filter + bincount facets {codes_ms:.3f} ms "
+              f"(+{codes_ms - filter_ms:.3f} ms)")
+        print(f"[Facets] full search incl. materializing rows {search_ms:.2f} ms; "
+              f"facets add {(codes_ms - filter_ms) / search_ms * 100:.1f}% to it")
+        print(f"[Facets] alternatives for {len(rows)} rows: counting records {records_ms:.1f} ms, "
+              f"pandas filter + groupby {groupby_ms:.1f} ms")
@@ -1,34 +1,43 @@
 import os
 import json
-import requests
 import re
 from .config import settings
+from .metrics import timed, LLM_TOKENS, LLM_CALL_TOKENS, FALLBACKS
+from . import deadline, prompts
+from .llm_providers import ProviderRouter, default_router
 from typing import List, Dict, Optional, Any
 
 
 class GroqLllmClient:
-    """Simple REST client for Groq Llama-3.3-like endpoints. Adapt to your server API."""
-
-    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None):
+    """
+    Simple REST client for Groq Llama-3.3-like endpoints. Adapt to your server API.
+    Requests are routed (hedged, health-scored, with a local fallback) by
+    llm_providers.ProviderRouter; clients built from settings share one router.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None,
+                 router: Optional[ProviderRouter] = None):
         self.base_url = base_url or settings.LLM_API_URL
         self.api_key = api_key or settings.LLM_API_KEY
-        self.headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+        if router is None:
+            router = ProviderRouter.from_settings(base_url, api_key) if base_url or api_key else default_router()
+        self.router = router
         
-    def generate(self, prompt: str, max_tokens: int = 200, temperature: float = 0.7) -> dict:
-        payload = {"prompt": prompt, "max_tokens": max_tokens, "temperature": temperature}
-        data = {"model": "llama-3.3-70b-versatile","messages": [
-            {"role": "system", "content": "You are a helpful real estate assistant."},
+    def generate(self, prompt: str, max_tokens: int = 200, temperature: float = 0.7,
+                 system: Optional[str] = None, call: str = "generate", estimated: Optional[int] = None) -> dict:
+        """
+        `system` carries a static instruction prefix (prompts.py) so repeated
+        calls share a cacheable prefix; `call` and `estimated` label the
+        per-call token report.
+        """
+        messages = [
+            {"role": "system", "content": system or "You are a helpful real estate assistant."},
             {"role": "user", "content": prompt}
-            ],
-            "temperature": temperature,
-            "max_tokens": max_tokens
-        }
-        r = requests.post(self.base_url, json=data, headers=self.headers, timeout=30)
-        r.raise_for_status()
-        data = r.json()
+        ]
+        # 30s, or what is left of the request's deadline
+        data = self.router.complete(messages, timeout=deadline.timeout(30),
+                                    temperature=temperature, max_tokens=max_tokens)
+        self._record_usage(data, call, estimated)
 
         # expect data contains 'text' or similar — adapt based on your server
         #text = data.get("text") or data.get("output") or data.get("response")
@@ -38,18 +47,8 @@ class GroqLllmClient:
 
         return data
     
-    def generate_str(self, prompt: str, max_tokens: int = 200, temperature: float = 0.7) -> str:
-        payload = {"prompt": prompt, "max_tokens": max_tokens, "temperature": temperature}
-        data = {"model": "llama-3.3-70b-versatile","messages": [
-            {"role": "system", "content": "You are a helpful real estate assistant."},
-            {"role": "user", "content": prompt}
-            ],
-            "temperature": temperature,
-            "max_tokens": max_tokens
-        }
-        r = requests.post(self.base_url, json=data, headers=self.headers, timeout=30)
-        r.raise_for_status()
-        data = r.json()
+    def generate_str(self, prompt: str, max_tokens: int = 200, temperature: float = 0.7, **kwargs) -> str:
+        data = self.generate(prompt, max_tokens, temperature, **kwargs)
 
         # expect data contains 'text' or similar — adapt based on your server
         text = data.get("text") or data.get("output") or data.get("response")
@@ -59,17 +58,35 @@ class GroqLllmClient:
 
         return text
 
+    def _record_usage(self, data: dict, call: str = "generate", estimated: Optional[int] = None):
+        """Count prompt/completion tokens from an OpenAI-style `usage` block, per call type."""
+        usage = data.get("usage") if isinstance(data, dict) else None
+        if not usage:
+            return
+        tokens_in = usage.get("prompt_tokens", 0) or 0
+        tokens_out = usage.get("completion_tokens", 0) or 0
+        LLM_TOKENS.labels("prompt").inc(tokens_in)
+        LLM_TOKENS.labels("completion").inc(tokens_out)
+        LLM_CALL_TOKENS.labels(call, "prompt").observe(tokens_in)
+        LLM_CALL_TOKENS.labels(call, "completion").observe(tokens_out)
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        print(f"[LLM] {call}: tokens in {tokens_in}"
+              + (f" (estimated {estimated})" if estimated is not None else "")
+              + (f", cached {cached}" if cached else "")
+              + f", out {tokens_out}")
+
     # ---------------------------
     # 1️⃣ Core request handler
     # ---------------------------
     
-    def _post(self, prompt: str) -> str:
+    def _post(self, prompt: str, **kwargs) -> str:
         try:
-            data = self.generate(prompt,200,0.7)
+            data = self.generate(prompt,200,0.7, **kwargs)
             print(data)
-            # For OpenAI-like schema
+            # For OpenAI-like schema (chat completions carry message.content, completions carry text)
             if "choices" in data and len(data["choices"]) > 0:
-                return data["choices"][0].get("text", "").strip()
+                choice = data["choices"][0]
+                return ((choice.get("message") or {}).get("content") or choice.get("text") or "").strip()
             # For Ollama / Groq with "response" field
             elif "response" in data:
                 return data["response"].strip()
@@ -85,44 +102,9 @@ class GroqLllmClient:
         Attempts to parse JSON from the model; if parsing fails, falls back to regex.
         Returns keys: title, location, price, area, amenities (amenities as comma-separated string or list).
         """
-        # few-shot prompt to improve structured JSON output
-        prompt = f"""
-You are an extraction assistant. Extract property listing fields from the user's text and return ONLY valid JSON.
-Fields to extract (if present):
-- title (e.g., "3BHK Apartment", "2BHK Flat")
-- location (city/area)
-- price (string, include units like 'Lakh' or 'Crore' if present)
-- area (string, include units like 'sqft' if present)
-- amenities (comma-separated string or list, e.g., "Lift, Parking")
-
-Example 1:
-Text: "I want to list my 2BHK flat in Sector 76 Noida, 950 sqft, price around 75 lakh, has parking and lift."
-Output JSON:
-{{
-  "title": "2BHK Flat",
-  "location": "Sector 76 Noida",
-  "price": "75 lakh",
-  "area": "950 sqft",
-  "amenities": "Parking, Lift"
-}}
-
-Example 2:
-Text: "Selling a 4BHK villa in Gurugram near Golf Course Road. Asking 2.1 Crore, 2200 sq ft, garden and pool."
-Output JSON:
-{{
-  "title": "4BHK Villa",
-  "location": "Gurugram, Golf Course Road",
-  "price": "2.1 Crore",
-  "area": "2200 sqft",
-  "amenities": "Garden, Pool"
-}}
-
-Now extract from this text:
-\"\"\"{text}\"\"\"
-
-Return JSON only.
-"""
-        raw = self._post(prompt)
+        # Static few-shot prefix (cacheable) + the seller's text, cut to LLM_EXTRACT_INPUT_TOKENS
+        system, prompt, stats = prompts.extraction_prompt(text)
+        raw = self._post(prompt, system=system, call="extract", estimated=stats["tokens"])
 
         # Try to parse model output as JSON
         try:
@@ -178,37 +160,45 @@ Return JSON only.
 
             return fallback
     
+    @timed("llm.summarize")
     def summarize(self, properties: List[Dict]) -> str:
         """
         Summarizes a list of property dicts into a human-readable text using LLM.
-        If LLM is unavailable, returns a manual summary.
+        If LLM is unavailable, or can't answer within the request's deadline,
+        returns a manual summary.
         """
         if not properties:
             return "No matching properties found."
+        if not deadline.allows(settings.DEADLINE_LLM_MIN_SECONDS):
+            deadline.degrade("summarize", "budget")
+            FALLBACKS.labels("llm.summarize").inc()
+            return self.template_summary(properties)
 
-        # Convert property list into a readable summary prompt
-        property_text = "\n".join([
-            f"- {p.get('title', 'Property')} in {p.get('location', '')}, "
-            f"{p.get('bhk', '')} BHK, Price: {p.get('price', '')}, Type: {p.get('type', '')}"
-            for p in properties
-        ])
-
-        prompt = (
-            "You are a real estate assistant. "
-            "Summarize the following property listings for a client in a friendly, concise way.\n\n"
-            f"Property List:\n{property_text}\n\n"
-            "Provide a short summary highlighting the best options and their key features."
-        )
+        # Ranked, compact listing rows under LLM_PROMPT_TOKEN_BUDGET after a static prefix
+        system, prompt, stats = prompts.summary_prompt(properties)
 
         # Try to use remote LLM if available
         try:
-            summary = self.generate_str(prompt)
+            summary = self.generate_str(prompt, system=system, call="summarize", estimated=stats["tokens"])
             if summary and not summary.startswith("Sorry"):
                 return summary
+            deadline.degrade("summarize", "empty")
+        except deadline.TIMEOUTS as e:
+            print(f"[LLM] Summarization timed out: {e}")
+            deadline.degrade("summarize", "timeout")
         except Exception as e:
             print(f"[LLM] Summarization fallback: {e}")
+            deadline.degrade("summarize", "error")
 
         # Fallback: simple text-based summary
+        FALLBACKS.labels("llm.summarize").inc()
+        return self.template_summary(properties)
+
+    @staticmethod
+    def template_summary(properties: List[Dict]) -> str:
+        """Deterministic summary used when the LLM is unavailable or out of time."""
+        if not properties:
+            return "No matching properties found."
         summary_lines = [
             f"🏠 {p.get('title', 'Property')} ({p.get('bhk', '?')} BHK, {p.get('type', 'N/A')}) "
             f"in {p.get('location', 'Unknown')} at {p.get('price', 'N/A')}"
@@ -216,5 +206,49 @@ Return JSON only.
         ]
         return "Here are the top properties I found:\n" + "\n".join(summary_lines)
 
+    @timed("llm.summarize_many")
+    def summarize_many(self, result_lists: List[List[Dict]]) -> List[str]:
+        """
+        One summary per result list from a single LLM call: the lists are
+        numbered in one prompt (sharing the token budget) and the model
+        answers with a JSON object keyed by request number. Lists the reply
+        doesn't cover get the manual summary; a bare array is only trusted
+        when it has exactly one entry per list, since a skipped or merged
+        entry would shift every later summary onto the wrong query.
+        """
+        summaries = [None] * len(result_lists)
+        sections = []
+        for i, properties in enumerate(result_lists):
+            if properties:
+                sections.append(properties)
+            else:
+                summaries[i] = "No matching properties found."
+        if sections:
+            system, prompt, stats = prompts.batch_summary_prompt(sections)
+            try:
+                data = self.generate(prompt, max_tokens=120 * len(sections), system=system,
+                                     call="summarize_many", estimated=stats["tokens"])
+                content = data["choices"][0]["message"]["content"]
+                match = re.search(r"\{.*\}|\[.*\]", content, re.DOTALL)
+                replies = json.loads(match.group(0)) if match else {}
+            except Exception as e:
+                print(f"[LLM] Batch summarization fallback: {e}")
+                replies = {}
+            if isinstance(replies, list):
+                replies = {str(n): r for n, r in enumerate(replies, 1)} if len(replies) == len(sections) else {}
+            if not isinstance(replies, dict):
+                replies = {}
+            # Request n in the prompt is the n-th non-empty list
+            numbers = iter(range(1, len(sections) + 1))
+            for i, properties in enumerate(result_lists):
+                if summaries[i] is None:
+                    reply = replies.get(str(next(numbers)))
+                    summaries[i] = reply if isinstance(reply, str) and reply.strip() else None
+        for i, summary in enumerate(summaries):
+            if summary is None:
+                FALLBACKS.labels("llm.summarize").inc()
+                summaries[i] = self.template_summary(result_lists[i])
+        return summaries
+
 # convenience
-client = GroqLllmClient()
\ No newline at end of file
+client = GroqLllmClient()
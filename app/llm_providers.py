@@ -0,0 +1,370 @@
+"""
+llm_providers.py — Hedged, health-scored routing over several LLM endpoints
+----------------------------------------------------------------------------
+GroqLllmClient sends chat completions through a ProviderRouter instead of
+a single URL:
+ - providers: the primary (LLM_API_URL), an optional alternate
+   (LLM_ALT_API_URL) and an optional local model server (LLM_LOCAL_URL,
+   e.g. an OpenAI-compatible Ollama / llama.cpp endpoint), all speaking
+   the chat-completions schema
+ - health: each remote provider keeps a window of recent latencies
+   (LLM_HEALTH_WINDOW) and an EWMA success rate; the expected cost
+   (median latency / success rate) orders them. LLM_CIRCUIT_FAILURES
+   consecutive failures take a provider out of rotation for
+   LLM_CIRCUIT_COOLDOWN_SECONDS, after which it gets one probe request
+ - hedging: the best provider gets the request; if it hasn't answered
+   within its own LLM_HEDGE_PERCENTILE latency (floored at
+   LLM_HEDGE_MIN_DELAY_MS), the same request goes to the next provider.
+   The first success wins and the other request is cancelled. A failure
+   fails over to the next provider immediately
+ - local fallback: when every remote provider fails, the local model is
+   tried; without one, the caller's own fallback (template summary, regex
+   extraction) takes over
+
+Requests run on one background event loop with pooled httpx clients, so a
+losing hedge is really cancelled (its connection is closed) rather than
+left to finish in a thread. Callers block on the result like they did on
+requests.post.
+    python -m app.llm_providers --bench     # p50/p99 against mock servers with injected latency
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+import httpx
+
+from app.config import settings
+from app.deadline import DeadlineExceeded
+from app.metrics import FALLBACKS, registry
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+DEFAULT_MODEL = "llama-3.3-70b-versatile"
+# Latency samples before a provider's own percentile replaces LLM_HEDGE_DEFAULT_DELAY_MS
+_MIN_SAMPLES = 20
+_SUCCESS_ALPHA = 0.1
+
+PROVIDER_SECONDS = registry.histogram(
+    "realestate_llm_provider_seconds", "LLM request latency by provider and outcome", ["provider", "outcome"])
+HEDGES = registry.counter(
+    "realestate_llm_hedges_total", "Hedged LLM requests sent, and how many the hedge won", ["result"])
+PROVIDER_COST = registry.gauge(
+    "realestate_llm_provider_cost_seconds", "Expected latency / success rate used for routing", ["provider"])
+
+
+class ProviderError(RuntimeError):
+    pass
+
+
+class Provider:
+    """One chat-completions endpoint and its health."""
+
+    def __init__(self, name: str, url: str, api_key: str = "", model: Optional[str] = None):
+        self.name = name
+        self.url = url
+        self.model = model or DEFAULT_MODEL
+        self.headers = {"Content-Type": "application/json"}
+        if api_key:
+            self.headers["Authorization"] = f"Bearer {api_key}"
+        self.latencies = deque(maxlen=settings.LLM_HEALTH_WINDOW)
+        self.success = 1.0
+        self.failures = 0
+        self.open_until = 0.0
+        PROVIDER_COST.labels(name).set_function(self.cost)
+
+    def available(self) -> bool:
+        return time.monotonic() >= self.open_until
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self.latencies) < _MIN_SAMPLES:
+            return None
+        return float(np.percentile(np.fromiter(self.latencies, dtype=np.float64), q))
+
+    def cost(self) -> float:
+        """Expected seconds per successful answer; unmeasured providers rank by the default delay."""
+        median = self.percentile(50)
+        latency = median if median is not None else settings.LLM_HEDGE_DEFAULT_DELAY_MS / 1000
+        return latency / max(self.success, 0.05)
+
+    def record(self, seconds: float, outcome: str):
+        """outcome: ok / error / cancelled (lost a hedge race; only its elapsed time is known)."""
+        PROVIDER_SECONDS.labels(self.name, outcome).observe(seconds)
+        # A cancelled request took at least this long; keeping the censored sample keeps the tail visible
+        self.latencies.append(seconds)
+        if outcome == "cancelled":
+            return
+        ok = outcome == "ok"
+        self.success += _SUCCESS_ALPHA * (float(ok) - self.success)
+        self.failures = 0 if ok else self.failures + 1
+        if self.failures >= settings.LLM_CIRCUIT_FAILURES:
+            self.open_until = time.monotonic() + settings.LLM_CIRCUIT_COOLDOWN_SECONDS
+            print(f"[LLM] Provider {self.name} out of rotation for {settings.LLM_CIRCUIT_COOLDOWN_SECONDS}s "
+                  f"after {self.failures} failures")
+
+    def payload(self, messages: List[Dict], params: Dict) -> Dict:
+        return {"model": self.model, "messages": messages, **params}
+
+
+class ProviderRouter:
+    def __init__(self, providers: List[Provider], local: Optional[Provider] = None, hedge: Optional[bool] = None):
+        self.providers = providers
+        self.local = local
+        self.hedge = settings.LLM_HEDGE_ENABLED if hedge is None else hedge
+        self._loop = None
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._start_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, base_url: Optional[str] = None, api_key: Optional[str] = None) -> "ProviderRouter":
+        providers = [Provider("primary", base_url or settings.LLM_API_URL,
+                              settings.LLM_API_KEY if api_key is None else api_key, settings.LLM_MODEL)]
+        if settings.LLM_ALT_API_URL:
+            providers.append(Provider("alternate", settings.LLM_ALT_API_URL, settings.LLM_ALT_API_KEY,
+                                      settings.LLM_ALT_MODEL or settings.LLM_MODEL))
+        local = Provider("local", settings.LLM_LOCAL_URL, "", settings.LLM_LOCAL_MODEL) if settings.LLM_LOCAL_URL else None
+        return cls(providers, local)
+
+    # ---------------------------
+    # Routing
+    # ---------------------------
+    def ranked(self) -> List[Provider]:
+        """Remote providers in rotation, cheapest first."""
+        return sorted((p for p in self.providers if p.available()), key=Provider.cost)
+
+    def hedge_delay(self, provider: Provider) -> float:
+        p = provider.percentile(settings.LLM_HEDGE_PERCENTILE)
+        delay = p if p is not None else settings.LLM_HEDGE_DEFAULT_DELAY_MS / 1000
+        return max(delay, settings.LLM_HEDGE_MIN_DELAY_MS / 1000)
+
+    async def _attempt(self, provider: Provider, messages: List[Dict], params: Dict) -> Dict:
+        client = self._clients.get(provider.name)
+        if client is None:
+            client = self._clients[provider.name] = httpx.AsyncClient(timeout=None)
+        start = time.perf_counter()
+        try:
+            r = await client.post(provider.url, json=provider.payload(messages, params), headers=provider.headers)
+            r.raise_for_status()
+            data = r.json()
+        except asyncio.CancelledError:
+            provider.record(time.perf_counter() - start, "cancelled")
+            raise
+        except Exception as e:
+            provider.record(time.perf_counter() - start, "error")
+            raise ProviderError(f"{provider.name}: {type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}") from e
+        provider.record(time.perf_counter() - start, "ok")
+        data.setdefault("provider", provider.name)
+        return data
+
+    async def _race(self, messages: List[Dict], params: Dict, timeout: float) -> Dict:
+        expires = time.monotonic() + timeout
+        queue = self.ranked()
+        running: Dict[asyncio.Task, Provider] = {}
+        errors = []
+
+        def launch() -> asyncio.Task:
+            provider = queue.pop(0)
+            task = asyncio.ensure_future(self._attempt(provider, messages, params))
+            running[task] = provider
+            return task
+
+        if not queue:
+            raise ProviderError("every provider is out of rotation")
+        launch()
+        hedge = None
+        try:
+            while running:
+                remaining = expires - time.monotonic()
+                if remaining <= 0:
+                    raise DeadlineExceeded(f"no LLM answer within {timeout:.1f}s")
+                # Until the hedge is out, wake up at the first provider's hedge point
+                wait = remaining
+                if self.hedge and queue and hedge is None:
+                    first = next(iter(running.values()))
+                    wait = min(remaining, self.hedge_delay(first))
+                done, _ = await asyncio.wait(set(running), timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if self.hedge and queue and hedge is None:
+                        HEDGES.labels("sent").inc()
+                        hedge = launch()
+                    continue
+                for task in done:
+                    running.pop(task)
+                    if task.exception() is None:
+                        if task is hedge:
+                            HEDGES.labels("won").inc()
+                        return task.result()
+                    errors.append(str(task.exception()))
+                # Fail over right away rather than waiting for a hedge point
+                if not running and queue:
+                    launch()
+            raise ProviderError("; ".join(errors) or "no LLM provider available")
+        finally:
+            for task in running:
+                task.cancel()
+
+    async def _complete(self, messages: List[Dict], params: Dict, timeout: float) -> Dict:
+        start = time.monotonic()
+        try:
+            return await self._race(messages, params, timeout)
+        except ProviderError as e:
+            if self.local is None:
+                raise
+            remaining = timeout - (time.monotonic() - start)
+            if remaining <= 0:
+                raise DeadlineExceeded(str(e))
+            print(f"[LLM] Remote providers failed ({e}); using local model")
+            FALLBACKS.labels("llm.local").inc()
+            return await asyncio.wait_for(self._attempt(self.local, messages, params), remaining)
+
+    # ---------------------------
+    # Sync entry point (called from request threads)
+    # ---------------------------
+    def _ensure_loop(self):
+        if self._loop is None:
+            with self._start_lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name="llm-router", daemon=True).start()
+                    self._loop = loop
+        return self._loop
+
+    def complete(self, messages: List[Dict], timeout: float = 30.0, **params) -> Dict:
+        """Chat-completion response dict from the first provider to answer within `timeout`."""
+        future = asyncio.run_coroutine_threadsafe(self._complete(messages, params, timeout), self._ensure_loop())
+        try:
+            return future.result(timeout + 1.0)
+        except TimeoutError:
+            future.cancel()
+            raise DeadlineExceeded(f"no LLM answer within {timeout:.1f}s")
+
+    def health(self) -> List[Dict]:
+        return [{"provider": p.name, "available": p.available(), "cost_s": round(p.cost(), 3),
+                 "success": round(p.success, 3), "p50_s": p.percentile(50),
+                 "p95_s": p.percentile(settings.LLM_HEDGE_PERCENTILE), "samples": len(p.latencies)}
+                for p in self.providers + ([self.local] if self.local else [])]
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_router() -> ProviderRouter:
+    """The process-wide router for settings-configured clients, so they share health and hedging state."""
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = ProviderRouter.from_settings()
+    return _default
+
+
+# ---------------------------
+# Benchmark: mock providers with injected latency
+# ---------------------------
+class MockLLMServer:
+    """Local chat-completions server; `latency()` returns seconds to stall per request, or None to fail."""
+
+    def __init__(self, latency):
+        import json
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True          # headers and body go out as separate writes
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                delay = owner.latency()
+                owner.requests += 1
+                if delay is None:
+                    self.send_response(503)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                time.sleep(delay)
+                body = json.dumps({"choices": [{"message": {"content": f"ok after {delay:.3f}s"}}]}).encode()
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except OSError:
+                    pass                    # the router cancelled this request
+
+            def log_message(self, *a):
+                pass
+
+        self.latency = latency
+        self.requests = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1/chat/completions"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+
+    parser = argparse.ArgumentParser(description="Hedged LLM routing benchmark")
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    state = {"primary_down": False}
+
+    def primary_latency():
+        if state["primary_down"]:
+            return None
+        # Usually fast, with a 5% slow tail
+        return rng.uniform(0.8, 1.2) if rng.random() < 0.05 else rng.uniform(0.03, 0.06)
+
+    primary = MockLLMServer(primary_latency)
+    alternate = MockLLMServer(lambda: rng.uniform(0.05, 0.09) if rng.random() >= 0.05 else rng.uniform(0.8, 1.2))
+    local = MockLLMServer(lambda: 0.02)
+    messages = [{"role": "user", "content": "Summarize: 3BHK|Sector 62, Noida|85L"}]
+
+    def run(router, n):
+        latencies = []
+        for _ in range(n):
+            t0 = time.perf_counter()
+            router.complete(messages, timeout=10, max_tokens=50)
+            latencies.append(time.perf_counter() - t0)
+        return np.percentile(latencies, [50, 95, 99]) * 1000
+
+    def router(hedge, with_local=False):
+        return ProviderRouter([Provider("primary", primary.url), Provider("alternate", alternate.url)],
+                              Provider("local", local.url) if with_local else None, hedge=hedge)
+
+    for hedge in (False, True):
+        r = router(hedge)
+        sent_before = primary.requests + alternate.requests
+        p50, p95, p99 = run(r, args.requests)
+        extra = (primary.requests + alternate.requests - sent_before) / args.requests - 1
+        print(f"[LLM] {'hedged  ' if hedge else 'unhedged'}: p50 {p50:.0f} ms, p95 {p95:.0f} ms, "
+              f"p99 {p99:.0f} ms, extra requests {extra * 100:.1f}%")
+
+    r = router(True, with_local=True)
+    run(r, 30)
+    state["primary_down"] = True
+    p50, _, p99 = run(r, 50)
+    print(f"[LLM] primary outage: p50 {p50:.0f} ms, p99 {p99:.0f} ms; "
+          f"routing {[(h['provider'], h['available']) for h in r.health()]}")
+    alternate.latency = lambda: None
+    served = run(r, 10)
+    print(f"[LLM] both remotes down: local model answered, p50 {served[0]:.0f} ms")
+    for server in (primary, alternate, local):
+        server.close()
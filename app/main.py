@@ -1,29 +1,95 @@
 from fastapi import FastAPI, Form
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from app.agent import RealEstateAgent
-from fastapi import File, UploadFile, Request
+from fastapi import File, UploadFile, Request, Header, HTTPException
 from app.upload_agent import UploadAgent
+from app.config import settings
+from app.startup import startup
+from app import deadline, metrics
+from app.profiler import profiler
+from app.notifier import notifier
+from app.saved_searches import SavedSearchIndex
+from app.llm_providers import default_router
+from contextlib import asynccontextmanager
+import asyncio
+import hmac
+import time
 import tempfile
 import os
 from pydantic import BaseModel
 import ast
+import json
+from typing import List, Optional
 
-# Instantiate upload agent
-upload_agent = UploadAgent()
+# Agents are built by the startup registry (warmup or first use), not at import
+startup.register("agent", RealEstateAgent)
+startup.register("saved_searches", lambda: SavedSearchIndex(notifier=notifier))
+startup.register("upload_agent", lambda: UploadAgent(store=startup.get("agent").store,
+                                                     saved_searches=startup.get("saved_searches")))
+
+
+async def get_agent() -> RealEstateAgent:
+    # Built in a worker thread so a cold start never blocks the event loop
+    return await asyncio.to_thread(startup.get, "agent")
+
+
+async def get_upload_agent() -> UploadAgent:
+    return await asyncio.to_thread(startup.get, "upload_agent")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.FAST_STARTUP:
+        # Serve immediately; components are built lazily on first request
+        startup.mark_ready()
+    else:
+        # Warm up in the background so /health answers while /ready stays false
+        app.state.warmup_task = asyncio.create_task(asyncio.to_thread(startup.warmup))
+    yield
+    # Give queued notifications a chance to go out, then close pooled SMTP sessions
+    await asyncio.to_thread(notifier.close)
 
 class QueryRequest(BaseModel):
     query: str
     
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    summarize: bool = False
+    limit: int = 20
+
 class PropertyInput(BaseModel):
     text: str
 
-app = FastAPI(title="Real Estate Agentic AI")
+class SavedSearchRequest(BaseModel):
+    query: str
+    email: str = None
+    whatsapp: str = None
+
+app = FastAPI(title="Real Estate Agentic AI", lifespan=lifespan)
+
+# Monitoring and admin traffic doesn't count toward a `requests=N` profiling session
+PROFILE_SKIP_PREFIXES = ("/metrics", "/health", "/ready", "/startup-profile", "/admin")
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    # Label by route template (/properties/{id}) rather than raw path to bound cardinality
+    metrics.INFLIGHT.inc()
+    start = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        metrics.INFLIGHT.dec()
+        if not request.url.path.startswith(PROFILE_SKIP_PREFIXES):
+            profiler.request_finished()
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        metrics.HTTP_SECONDS.labels(request.method, path).observe(time.perf_counter() - start)
 
 
-# Initialize the main agent instance
 # python -m uvicorn app.main:app --reload
-agent = RealEstateAgent()
+# FAST_STARTUP=true python -m uvicorn app.main:app --reload   (skip warmup)
 
 # Mount the static directory for assets
 app.mount("/static", StaticFiles(directory="ui"), name="static")
@@ -32,39 +98,215 @@ app.mount("/static", StaticFiles(directory="ui"), name="static")
 def home():
     return FileResponse("ui/index.html")
 
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
+@app.get("/ready")
+def ready():
+    """Flips to ready once warmup has built every heavy component."""
+    if not startup.ready:
+        return JSONResponse(status_code=503, content={"status": "warming_up", "error": startup.error})
+    return {"status": "ready"}
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus text exposition of stage latencies, counters and gauges."""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/startup-profile")
+def startup_profile():
+    """Import time per heavy module and memory per component for this worker."""
+    return startup.report()
+
+def require_admin(token):
+    if not settings.ADMIN_TOKEN or not token or not hmac.compare_digest(token, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+@app.get("/admin/catalog")
+async def admin_catalog(x_admin_token: str = Header(None)):
+    """Current catalog generation plus the last background rebuild and swap timings."""
+    require_admin(x_admin_token)
+    store = (await get_agent()).store
+    if store.watcher is not None:
+        return store.watcher.status()
+    if store.catalog is not None:
+        return {"generation": store.catalog.current().name, "last_swap": store.catalog.last_swap}
+    return {"generation": None, "detail": "Shared catalog disabled"}
+
+
+@app.get("/admin/llm")
+async def admin_llm(x_admin_token: str = Header(None)):
+    """LLM provider health (success rate, latency percentiles, rotation) driving hedged routing."""
+    require_admin(x_admin_token)
+    return {"hedging": default_router().hedge, "providers": default_router().health()}
+
+
+@app.post("/admin/profile")
+async def admin_profile(seconds: float = None, requests: int = None,
+                        x_admin_token: str = Header(None)):
+    """
+    Samples this worker's stacks for `seconds`, or until the next `requests`
+    requests finish, and returns collapsed stacks for flamegraph tools.
+    """
+    require_admin(x_admin_token)
+    if not seconds and not requests:
+        raise HTTPException(status_code=400, detail="Pass seconds or requests")
+    if not profiler.start(requests=requests):
+        raise HTTPException(status_code=409, detail="A profiling session is already running")
+    limit = settings.PROFILE_MAX_SECONDS
+    if requests:
+        stacks = await profiler.profile_requests(timeout=min(seconds or limit, limit))
+    else:
+        stacks = await profiler.profile_for(min(seconds, limit))
+    return PlainTextResponse(stacks)
+
+
+@app.get("/admin/notifications/{job_id}")
+async def admin_notification(job_id: str, x_admin_token: str = Header(None)):
+    """Delivery status of a queued email/WhatsApp notification."""
+    require_admin(x_admin_token)
+    status = notifier.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown notification")
+    return status
+
+
+@app.get("/visits/slots")
+async def visit_slots(property_id: str = None, agent_name: str = None, n: int = 5):
+    """Next `n` start times when both the property and the agent are free."""
+    scheduler = (await get_agent()).scheduler
+    # Takes the scheduler's file lock and replays its log, so off the event loop
+    slots = await asyncio.to_thread(scheduler.next_free_slots, property_id, agent_name, n=max(1, min(n, 50)))
+    return {"slots": [slot.isoformat() for slot in slots]}
+
+
+@app.get("/visits/{visit_id}.ics")
+async def visit_ics(visit_id: str):
+    """Calendar invite for a booked visit, rendered on request."""
+    ics = await asyncio.to_thread((await get_agent()).scheduler.ics, visit_id)
+    if ics is None:
+        raise HTTPException(status_code=404, detail="Unknown visit")
+    return PlainTextResponse(ics, media_type="text/calendar")
+
+
+@app.get("/autocomplete")
+async def autocomplete(q: str, limit: int = 8):
+    """Typeahead for localities, property types and titles, ranked by listing count."""
+    store = (await get_agent()).store
+    return {"query": q, "suggestions": store.autocomplete(q, max(1, min(limit, 20)))}
+
+
+@app.get("/properties/{property_id}/similar")
+async def similar_properties(property_id: str, k: int = 10):
+    """Listings similar to an opened property, from the precomputed neighbour table."""
+    store = (await get_agent()).store
+    matches = await asyncio.to_thread(store.similar, property_id, max(1, min(k, settings.SIMILAR_K)))
+    if matches is None:
+        raise HTTPException(status_code=404, detail="Unknown property")
+    return {"property_id": property_id, "count": len(matches), "properties": matches}
+
+
+def request_deadline(deadline_ms: Optional[float]) -> deadline.Deadline:
+    """The request's budget: the X-Deadline-Ms header when given, else QUERY_DEADLINE_SECONDS."""
+    if deadline_ms and deadline_ms > 0:
+        return deadline.Deadline(min(deadline_ms / 1000, settings.QUERY_DEADLINE_MAX_SECONDS))
+    return deadline.Deadline()
+
+
+def summary_text(summary: str) -> str:
+    """Chat-completion content from the raw LLM reply; template summaries pass through."""
+    try:
+        return ast.literal_eval(summary)["choices"][0]["message"]["content"]
+    except (ValueError, SyntaxError, TypeError, KeyError, IndexError):
+        return summary
+
+
+async def transcribe(agent: RealEstateAgent, audio_bytes: bytes, budget: deadline.Deadline) -> str:
+    """STT within the request's budget; there is no cheaper transcript to fall back to."""
+    try:
+        with deadline.scope(budget):
+            return await asyncio.wait_for(asyncio.to_thread(agent.stt_to_text, audio_bytes), budget.remaining())
+    except deadline.TIMEOUTS:
+        raise HTTPException(status_code=504, detail="Speech recognition did not finish within the request deadline")
+
+
 #show me 3bhk flat in noida location for the budget 2 crore
 @app.post("/query")
-async def handle_query(data: QueryRequest):
-    """Accepts text query from user."""
-    response = await agent.handle_query(data.query)
-    return {
-        "query": data.query,
-        "count": {len(response["properties"])},
-        "properties": response["properties"],
-        #"summarize":response["summarize"]
-        "summarize":ast.literal_eval(response["summarize"])["choices"][0]["message"]["content"]
-    }
+async def handle_query(data: QueryRequest, profile: bool = False,
+                       x_deadline_ms: Optional[float] = Header(None)):
+    """
+    Accepts text query from user. `?profile=1` adds a per-stage timing breakdown.
+    An `X-Deadline-Ms` header bounds the request; stages that would overrun
+    it are skipped or degraded, and listed under "degraded".
+    """
+    trace = metrics.start_trace() if profile else None
+    start = time.perf_counter()
+    budget = request_deadline(x_deadline_ms)
+    agent = await get_agent()
+    response = await agent.handle_query(data.query, budget)
+    if response is None or "properties" not in response:
+        # Visit booking / advertiser notification replies carry their own fields
+        result = {"query": data.query, **(response or {"message": "Sorry, I can't help with that yet."})}
+    else:
+        result = {
+            "query": data.query,
+            "count": {len(response["properties"])},
+            "properties": response["properties"],
+            "facets": response.get("facets"),
+            #"summarize":response["summarize"]
+            "summarize":summary_text(response["summarize"]),
+            "degraded": response.get("degraded", []),
+        }
+    if trace is not None:
+        result["profile"] = {
+            "total_ms": round((time.perf_counter() - start) * 1000, 3),
+            "stages": metrics.stop_trace(trace),
+        }
+    return result
     #return {"response": response}
 
 
+@app.post("/query/batch")
+async def handle_query_batch(data: BatchQueryRequest):
+    """
+    Many requirement strings in one request. Results stream back as NDJSON,
+    one line per query with its position in "index", as each is ready.
+    Example body: {"queries": ["2bhk in noida under 90 lakh", "villa in gurugram"], "summarize": false}
+    """
+    if len(data.queries) > settings.BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {settings.BATCH_MAX_QUERIES} queries per batch")
+    agent = await get_agent()
+    limit = max(1, min(data.limit, settings.BATCH_MAX_RESULTS))
+
+    async def lines():
+        async for result in agent.handle_batch(data.queries, data.summarize, limit):
+            yield json.dumps(result, default=str) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 @app.post("/voice-query")
-async def handle_voice_query(audio_file: bytes = Form(...)):
+async def handle_voice_query(audio_file: bytes = Form(...), x_deadline_ms: Optional[float] = Header(None)):
     """Accepts a voice query (to be processed by STT)."""
     print(audio_file)
+    budget = request_deadline(x_deadline_ms)
     audio_bytes = await audio_file.read()
     
-        
-    text_query = agent.stt_to_text(audio_bytes)
-    response = await agent.handle_query(text_query)
+    agent = await get_agent()
+    text_query = await transcribe(agent, audio_bytes, budget)
+    response = await agent.handle_query(text_query, budget)
     
     return {"query": text_query, "response": response}
 
 @app.post("/voice-query-upload")
-async def handle_voice_query(audio_file: UploadFile = File(...)):
+async def handle_voice_query(audio_file: UploadFile = File(...), x_deadline_ms: Optional[float] = Header(None)):
     """Accepts a voice query (to be processed by STT)."""
+    budget = request_deadline(x_deadline_ms)
     audio_bytes = await audio_file.read()
-    text_query = agent.stt_to_text(audio_bytes)
-    response = await agent.handle_query(text_query)
+    agent = await get_agent()
+    text_query = await transcribe(agent, audio_bytes, budget)
+    response = await agent.handle_query(text_query, budget)
     return {"query": text_query, "response": response}
 
 @app.post("/upload-property")
@@ -80,13 +322,36 @@ async def upload_property(input_data: PropertyInput, request: Request):
     session_id = request.headers.get("session-id", "default-user")
     print("Input details for upload")
     print(text)
+    upload_agent = await get_upload_agent()
     result = await upload_agent.process_input(text, session_id)
     return result
 
 
+@app.post("/saved-searches")
+async def save_search(data: SavedSearchRequest):
+    """
+    Alert the buyer when a new upload matches their search.
+    Example body: {"query": "3bhk flat in noida under 2 crore", "email": "buyer@example.com"}
+    """
+    index = await asyncio.to_thread(startup.get, "saved_searches")
+    try:
+        return index.subscribe(data.query, email=data.email, whatsapp=data.whatsapp)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.delete("/saved-searches/{search_id}")
+async def delete_saved_search(search_id: str):
+    index = await asyncio.to_thread(startup.get, "saved_searches")
+    if not index.unsubscribe(search_id):
+        raise HTTPException(status_code=404, detail="Unknown saved search")
+    return {"status": "deleted"}
+
+
 @app.post("/reset-session")
 async def reset_session(request: Request):
     """Resets property upload memory for a session"""
     session_id = request.headers.get("session-id", "default-user")
+    upload_agent = await get_upload_agent()
     upload_agent.memory.clear(session_id)
-    return {"status": "reset", "message": "Session cleared. You can start fresh."}
\ No newline at end of file
+    return {"status": "reset", "message": "Session cleared. You can start fresh."}
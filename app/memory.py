@@ -1,25 +1,168 @@
 import redis
 import json
+import re
+import time
 from .config import settings
+from .metrics import timed
 import datetime
 
+try:
+    import msgpack
+except Exception:
+    msgpack = None
+
+
+# Words that carry no signal in the compacted summary
+_STOPWORDS = {
+    "the", "and", "for", "with", "show", "find", "want", "need", "please",
+    "any", "are", "can", "you", "me", "my", "in", "of", "to", "a", "an",
+    "under", "below", "near", "some", "that", "this", "have", "has",
+}
+
 
 class MemoryStore:
-def __init__(self, url: str = None):
-url = url or settings.REDIS_URL
-self.client = redis.from_url(url)
+    """
+    Per-user conversation history in Redis.
+
+    History lives in a capped list (``user:{id}:history``). Once it grows past
+    ``max_items + compact_batch`` entries the oldest ``compact_batch`` turns are
+    folded into a single summary record (``user:{id}:summary``), so Redis
+    memory per user stays bounded no matter how long the user has been active.
+    Entries are msgpack-encoded when msgpack is installed (JSON otherwise);
+    legacy JSON entries are still readable.
+    """
+
+    def __init__(self, url: str = None, max_items: int = None, compact_batch: int = None):
+        url = url or settings.REDIS_URL
+        self.client = redis.from_url(url)
+        self.max_items = max_items or settings.HISTORY_MAX_ITEMS
+        self.compact_batch = compact_batch or settings.HISTORY_COMPACT_BATCH
+        self.summary_terms = settings.HISTORY_SUMMARY_TERMS
+
+    # ---------------------------
+    # Keys & encoding
+    # ---------------------------
+    def _history_key(self, user_id: str) -> str:
+        return f'user:{user_id}:history'
+
+    def _summary_key(self, user_id: str) -> str:
+        return f'user:{user_id}:summary'
+
+    def _encode(self, obj) -> bytes:
+        if msgpack is not None:
+            return msgpack.packb(obj, use_bin_type=True)
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def _decode(self, raw):
+        if raw is None:
+            return None
+        # Legacy / fallback entries are JSON objects; msgpack maps never start with '{'
+        if raw[:1] in (b'{', '{'):
+            return json.loads(raw)
+        return msgpack.unpackb(raw, raw=False)
+
+    def _to_public(self, entry: dict) -> dict:
+        """Map a stored entry (compact or legacy) to the {'ts', 'msg'} shape callers expect."""
+        if 'ts' in entry:
+            return entry
+        ts = datetime.datetime.utcfromtimestamp(entry['t']).isoformat()
+        return {'ts': ts, 'msg': entry['m']}
+
+    # ---------------------------
+    # History
+    # ---------------------------
+    @timed("redis.add_interaction")
+    def add_interaction(self, user_id: str, message: str):
+        key = self._history_key(user_id)
+        item = self._encode({'t': int(time.time()), 'm': message})
+        hard_cap = self.max_items + self.compact_batch
+
+        pipe = self.client.pipeline()
+        pipe.rpush(key, item)
+        # Hard cap in the same round trip, so the list is bounded even if compaction fails
+        pipe.ltrim(key, -hard_cap, -1)
+        length, _ = pipe.execute()
+
+        if length >= hard_cap:
+            self.compact(user_id)
+
+    @timed("redis.get_history")
+    def get_history(self, user_id: str, limit: int = 10):
+        key = self._history_key(user_id)
+        items = self.client.lrange(key, -limit, -1)
+        return [self._to_public(self._decode(x)) for x in items]
+
+    # ---------------------------
+    # Compaction
+    # ---------------------------
+    def _fold(self, summary: dict, entry: dict) -> dict:
+        entry = self._to_public(entry)
+        summary['n'] = summary.get('n', 0) + 1
+        summary.setdefault('first', entry['ts'])
+        summary['last'] = entry['ts']
+
+        terms = summary.setdefault('terms', {})
+        for word in re.findall(r"[a-z0-9]+", str(entry['msg']).lower()):
+            if len(word) < 3 or word in _STOPWORDS:
+                continue
+            terms[word] = terms.get(word, 0) + 1
+        return summary
+
+    def compact(self, user_id: str):
+        """Fold the oldest turns beyond ``max_items`` into the user's summary record."""
+        key = self._history_key(user_id)
+        skey = self._summary_key(user_id)
+
+        def _compact(pipe):
+            overflow = pipe.llen(key) - self.max_items
+            if overflow <= 0:
+                return
+            old = pipe.lrange(key, 0, overflow - 1)
+            summary = self._decode(pipe.get(skey)) or {}
+            for raw in old:
+                summary = self._fold(summary, self._decode(raw))
+            # Keep only the strongest terms so the summary itself stays small
+            top = sorted(summary.get('terms', {}).items(), key=lambda kv: -kv[1])
+            summary['terms'] = dict(top[:self.summary_terms])
+
+            pipe.multi()
+            pipe.set(skey, self._encode(summary))
+            pipe.ltrim(key, overflow, -1)
+
+        self.client.transaction(_compact, key, skey)
+
+    def get_summary(self, user_id: str) -> dict:
+        """Compacted record of turns that have rolled out of the history list."""
+        return self._decode(self.client.get(self._summary_key(user_id))) or {}
+
+    def memory_usage(self, user_id: str) -> int:
+        """Bytes Redis reports for this user's history and summary keys."""
+        total = 0
+        for key in (self._history_key(user_id), self._summary_key(user_id)):
+            total += self.client.memory_usage(key) or 0
+        return total
 
 
-def add_interaction(self, user_id: str, message: str):
-key = f'user:{user_id}:history'
-item = json.dumps({'ts': datetime.datetime.utcnow().isoformat(), 'msg': message})
-self.client.rpush(key, item)
+memory = MemoryStore()
 
 
-def get_history(self, user_id: str, limit: int = 10):
-key = f'user:{user_id}:history'
-items = self.client.lrange(key, -limit, -1)
-return [json.loads(x) for x in items]
+# Memory report: unbounded JSON history vs capped/compacted history
+if __name__ == "__main__":
+    turns = 2000
+    store = MemoryStore()
+    before_user, after_user = "memreport-before", "memreport-after"
+    for uid in (before_user, after_user):
+        store.client.delete(store._history_key(uid), store._summary_key(uid))
 
+    for i in range(turns):
+        msg = f"show me {i % 4 + 1}bhk flat in noida under {i % 90 + 10} lakh"
+        legacy = json.dumps({'ts': datetime.datetime.utcnow().isoformat(), 'msg': msg})
+        store.client.rpush(store._history_key(before_user), legacy)
+        store.add_interaction(after_user, msg)
 
-memory = MemoryStore()
\ No newline at end of file
+    before = store.memory_usage(before_user)
+    after = store.memory_usage(after_user)
+    print(f"[Memory] {turns} turns, encoding={'msgpack' if msgpack else 'json'}")
+    print(f"[Memory] before (unbounded json): {before} bytes")
+    print(f"[Memory] after (capped {store.max_items}+{store.compact_batch}, compacted): {after} bytes")
+    print(f"[Memory] summary: {store.get_summary(after_user)}")
\ No newline at end of file
@@ -7,6 +7,7 @@ Stores and retrieves property details across chat turns.
 import redis
 import json
 from typing import Dict, Any
+from app.metrics import timed, cache_lookup
 
 
 class PropertyMemory:
@@ -18,13 +19,16 @@ class PropertyMemory:
             print(f"[Warning] Redis connection failed: {e}")
             self.redis = None
 
+    @timed("redis.session_get")
     def get(self, session_id: str) -> Dict[str, Any]:
         """Fetch saved property details for user session"""
         if not self.redis:
             return {}
         data = self.redis.get(session_id)
+        cache_lookup("session_memory", data is not None)
         return json.loads(data) if data else {}
 
+    @timed("redis.session_update")
     def update(self, session_id: str, new_data: Dict[str, Any]) -> Dict[str, Any]:
         """Merge new details into existing memory"""
         if not self.redis:
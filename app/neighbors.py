@@ -0,0 +1,211 @@
+"""
+neighbors.py — Precomputed "similar listings" table
+----------------------------------------------------
+Every catalog generation with embeddings stores each listing's SIMILAR_K
+most similar listings (cosine over the normalized embeddings) as two
+row-aligned arrays:
+    neighbors.npy         int32 row ids, best first, -1 padded
+    neighbor_scores.npy   float16 cosine scores
+so /properties/{id}/similar is a single memory-mapped row read.
+
+Blocking keeps the build tractable: a listing's neighbours are searched
+only among listings with the same location and type, or the same location
+when that block has fewer than SIMILAR_K other listings. Each block is
+scored with chunked matrix products, so a build costs sum(block_size^2)
+dot products instead of n^2. Re-posts from the same duplicate cluster
+(dedup.py) are never each other's neighbours.
+
+Appends are incremental: rows keep their position across generations, so
+only the new rows are scored against their blocks, and existing rows in
+those blocks merge the new rows into their lists.
+    python -m app.neighbors --bench 100000    # full build vs append vs per-click query
+"""
+
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from app.config import settings
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+NEIGHBORS_FILE = "neighbors.npy"
+SCORES_FILE = "neighbor_scores.npy"
+
+# Scores materialized per matrix product (query chunk x block candidates)
+_CHUNK_CELLS = 1 << 24
+
+
+def _block_keys(location_code, type_code):
+    return (np.asarray(location_code, dtype=np.int64) << 32) | np.asarray(type_code, dtype=np.int64)
+
+
+def _split(keys) -> Dict[int, "np.ndarray"]:
+    """Row ids per distinct key."""
+    if len(keys) == 0:
+        return {}
+    order = np.argsort(keys, kind="stable")
+    bounds = np.flatnonzero(np.diff(keys[order])) + 1
+    return dict(zip(keys[order][np.r_[0, bounds]].tolist(), np.split(order, bounds)))
+
+
+def _top_neighbors(vectors, queries, candidates, groups, k: int) -> Tuple:
+    """Top-k candidates per query row: (ids int32 (q, k), scores float32 (q, k)), -1 / -inf padded."""
+    ids = np.full((len(queries), k), -1, dtype=np.int32)
+    scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    if len(queries) == 0 or len(candidates) == 0:
+        return ids, scores
+    kk = min(k, len(candidates))
+    cand_vectors = np.asarray(vectors[candidates])
+    chunk = max(1, _CHUNK_CELLS // len(candidates))
+    for start in range(0, len(queries), chunk):
+        q = queries[start:start + chunk]
+        sims = np.asarray(vectors[q]) @ cand_vectors.T
+        excluded = q[:, None] == candidates[None, :]
+        if groups is not None:
+            excluded |= groups[q][:, None] == groups[candidates][None, :]
+        sims[excluded] = -np.inf
+        top = np.argpartition(-sims, kk - 1, axis=1)[:, :kk]
+        top_sims = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_sims, axis=1, kind="stable")
+        top, top_sims = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_sims, order, axis=1)
+        top_ids = candidates[top].astype(np.int32)
+        top_ids[~np.isfinite(top_sims)] = -1
+        ids[start:start + len(q), :kk] = top_ids
+        scores[start:start + len(q), :kk] = top_sims
+    return ids, scores
+
+
+def _merge(ids, scores, more_ids, more_scores, k: int) -> Tuple:
+    """Best k of two neighbour lists per row."""
+    all_ids = np.concatenate([ids, more_ids], axis=1)
+    all_scores = np.concatenate([scores, more_scores], axis=1)
+    order = np.argsort(-all_scores, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(all_ids, order, axis=1), np.take_along_axis(all_scores, order, axis=1)
+
+
+def build(vectors, location_code, type_code, groups=None, k: Optional[int] = None,
+          base: Optional["NeighborTable"] = None) -> Tuple:
+    """
+    (ids, scores) for every row. With `base` (the previous generation's
+    table, whose rows are a prefix of `vectors`) only appended rows are scored.
+    """
+    k = k or settings.SIMILAR_K
+    n = len(vectors)
+    location_code = np.asarray(location_code)
+    by_location = _split(location_code.astype(np.int64))
+    by_block = _split(_block_keys(location_code, type_code))
+
+    def candidates(rows):
+        return rows if len(rows) > k else by_location[int(location_code[rows[0]])]
+
+    n0 = 0
+    ids = np.full((n, k), -1, dtype=np.int32)
+    scores = np.full((n, k), -np.inf, dtype=np.float32)
+    if base is not None and len(base) <= n and base.ids.shape[1] == k:
+        n0 = len(base)
+        ids[:n0] = base.ids
+        scores[:n0] = np.asarray(base.scores, dtype=np.float32)
+        scores[:n0][ids[:n0] < 0] = -np.inf
+
+    for rows in by_block.values():
+        cands = candidates(rows)
+        if not n0:
+            ids[rows], scores[rows] = _top_neighbors(vectors, rows, cands, groups, k)
+            continue
+        new_cands = cands[cands >= n0]
+        if len(new_cands) == 0:
+            continue
+        new_rows, old_rows = rows[rows >= n0], rows[rows < n0]
+        ids[new_rows], scores[new_rows] = _top_neighbors(vectors, new_rows, cands, groups, k)
+        more_ids, more_scores = _top_neighbors(vectors, old_rows, new_cands, groups, k)
+        ids[old_rows], scores[old_rows] = _merge(ids[old_rows], scores[old_rows], more_ids, more_scores, k)
+    return ids, scores
+
+
+def write_table(directory: str, vectors, location_code, type_code, groups=None,
+                base: Optional["NeighborTable"] = None):
+    """Called while publishing a generation with embeddings."""
+    t0 = time.perf_counter()
+    ids, scores = build(vectors, location_code, type_code, groups, base=base)
+    np.save(os.path.join(directory, NEIGHBORS_FILE), ids)
+    np.save(os.path.join(directory, SCORES_FILE), np.where(ids >= 0, scores, 0).astype(np.float16))
+    mode = f"appended {len(vectors) - len(base)} rows" if base is not None else "built"
+    print(f"[Similar] Neighbor table {mode} over {len(vectors)} listings in {time.perf_counter() - t0:.2f}s")
+
+
+class NeighborTable:
+    """Memory-mapped neighbour lists of one generation."""
+
+    def __init__(self, ids, scores):
+        self.ids = ids
+        self.scores = scores
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["NeighborTable"]:
+        path = os.path.join(directory, NEIGHBORS_FILE)
+        if not os.path.exists(path):
+            return None
+        return cls(np.load(path, mmap_mode="r"), np.load(os.path.join(directory, SCORES_FILE), mmap_mode="r"))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def similar(self, row: int, k: Optional[int] = None) -> Tuple:
+        """(row ids, scores) of the `k` most similar listings."""
+        ids = np.asarray(self.ids[row][:k or self.ids.shape[1]])
+        keep = ids >= 0
+        return ids[keep], np.asarray(self.scores[row][:len(ids)], dtype=np.float32)[keep]
+
+
+# ---------------------------
+# Benchmark: full build, incremental append, per-click lookup
+# ---------------------------
+def benchmark(n: int, d: int = 384, appended: int = 100, clicks: int = 1000):
+    from app.vector_index import VectorIndex, _synthetic
+
+    rng = np.random.default_rng(5)
+    vectors, _ = _synthetic(n + appended, d, 0)
+    location_code = rng.integers(0, 180, n + appended).astype(np.int32)
+    type_code = rng.integers(0, 5, n + appended).astype(np.int32)
+    k = settings.SIMILAR_K
+
+    t0 = time.perf_counter()
+    ids, scores = build(vectors[:n], location_code[:n], type_code[:n], k=k)
+    build_s = time.perf_counter() - t0
+
+    base = NeighborTable(ids, scores)
+    t0 = time.perf_counter()
+    inc_ids, _ = build(vectors, location_code, type_code, k=k, base=base)
+    append_s = time.perf_counter() - t0
+    full_ids, _ = build(vectors, location_code, type_code, k=k)
+    same = (inc_ids == full_ids).all(axis=1).mean()
+
+    table = NeighborTable(inc_ids, scores)
+    picks = rng.integers(0, n, clicks)
+    t0 = time.perf_counter()
+    for row in picks:
+        table.similar(int(row))
+    table_us = (time.perf_counter() - t0) / clicks * 1e6
+
+    index = VectorIndex(vectors)
+    t0 = time.perf_counter()
+    for row in picks[:100]:
+        mask = (location_code == location_code[row]) & (type_code == type_code[row])
+        index.search(vectors[row], k + 1, mask)
+    query_us = (time.perf_counter() - t0) / 100 * 1e6
+    print(f"[Similar] n={n} k={k}: full build {build_s:.2f}s, append {appended} rows {append_s:.3f}s "
+          f"(rows identical to a full rebuild: {same:.4f})")
+    print(f"[Similar] per click: table {table_us:.1f} µs vs filtered vector query {query_us:.0f} µs")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Similar-listings table benchmark")
+    parser.add_argument("--bench", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    args = parser.parse_args()
+    benchmark(args.bench, args.dim)
@@ -1,7 +1,7 @@
 # app/nlu.py
 import re
-from autocorrect import Speller
 from typing import Dict
+from app.metrics import timed
 
 class NLUProcessor:
     """
@@ -11,8 +11,9 @@ class NLUProcessor:
       - Entity extraction using regex
     """
 
-    def __init__(self):
-        self.spell = Speller(lang='en')
+    def __init__(self, corrector=None):
+        # Domain-vocabulary typo correction (app/spelling.py); the agent passes the catalog-backed one
+        self._corrector = corrector
 
         # Simple keyword-based intent map
         self.intent_keywords = {
@@ -22,17 +23,26 @@ class NLUProcessor:
             "price_query": ["price", "cost", "budget", "rate", "demand"],
         }
 
+    @property
+    def corrector(self):
+        if self._corrector is None:
+            from app.spelling import SpellCorrector
+            self._corrector = SpellCorrector()
+        return self._corrector
+
+    @timed("nlu.normalize")
     def normalize(self, text: str) -> str:
         """Lowercase, remove extra spaces, correct spelling."""
         print('Input query '+text);
         text = text.lower().strip()
         text = re.sub(r"[^a-z0-9\s]", "", text)
         print('Query post normalize '+text)
-        #corrected = " ".join([self.spell(word) for word in text.split()])
-        #print('Normalized query '+corrected);
-        #return corrected
-        return text
+        # Memoized per token against the catalog vocabulary; "noyda" -> "noida"
+        corrected = self.corrector.correct(text)
+        print('Normalized query '+corrected);
+        return corrected
 
+    @timed("nlu.classify_intent")
     def classify_intent(self, text: str) -> str:
         """Classify intent based on keywords."""
         for intent, keywords in self.intent_keywords.items():
@@ -47,11 +57,15 @@ class NLUProcessor:
         # Example patterns
         price_match = re.search(r"(\d+(?:\.\d+)?\s*(?:lakh|cr|crore))", text)
         location_match = re.search(r"in\s+([a-z\s]+)", text)
+        # "visit property 42", "listing id 42", "property no 42"
+        property_match = re.search(r"\b(?:property|listing)\s+(?:id\s+|no\s+|number\s+)?(\d+)\b", text)
 
         if price_match:
             entities["price"] = price_match.group(1)
         if location_match:
             entities["location"] = location_match.group(1).strip()
+        if property_match:
+            entities["property_id"] = property_match.group(1)
         return entities
 
     def process(self, text: str) -> Dict[str, any]:
@@ -5,24 +5,29 @@ Extracts property details from natural language input.
 """
 
 import re
-import spacy
 from typing import Dict, Any
 from app.llm_client import GroqLllmClient
 
 
 class HybridExtractor:
     def __init__(self):
-        # Load SpaCy model (run once)
-        try:
-            self.nlp = spacy.load("en_core_web_sm")
-        except OSError:
-            # if not downloaded, auto download
-            from spacy.cli import download
-            download("en_core_web_sm")
-            self.nlp = spacy.load("en_core_web_sm")
-
+        self._nlp = None
         self.llm = GroqLllmClient()
 
+    @property
+    def nlp(self):
+        # Load SpaCy model on first extraction (run once)
+        if self._nlp is None:
+            import spacy
+            try:
+                self._nlp = spacy.load("en_core_web_sm")
+            except OSError:
+                # if not downloaded, auto download
+                from spacy.cli import download
+                download("en_core_web_sm")
+                self._nlp = spacy.load("en_core_web_sm")
+        return self._nlp
+
     def extract(self, text: str) -> Dict[str, Any]:
         """
         Extract property details using NER + Regex + LLM hybrid.
@@ -1,50 +1,500 @@
+"""
+notifier.py — Background email / WhatsApp dispatch
+---------------------------------------------------
+Requests only enqueue notifications; per-channel worker threads deliver them:
+ - email goes over a pool of authenticated SMTP connections (STARTTLS +
+   login once per connection, NOOP-checked after idling); each worker drains
+   up to SMTP_BATCH queued messages and sends them over one connection
+ - WhatsApp goes through the Twilio client
+ - each channel has a token-bucket rate limit (EMAIL_RATE_PER_SEC,
+   WHATSAPP_RATE_PER_SEC)
+ - transient failures are retried with exponential backoff up to
+   NOTIFY_MAX_ATTEMPTS; 5xx SMTP replies and 4xx Twilio errors fail at once
+ - every job has a status record (queued/sending/retrying/sent/failed)
+
+Attachments are read once and cached by (path, mtime, size).
+Both transports are injectable: point SMTP at a local sink and pass a stub
+`twilio_client` to test without sending anything.
+    python -m app.notifier --bench     # pooled dispatcher vs connect-per-message
+"""
+
+import heapq
+import itertools
+import os
+import queue
 import smtplib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
 from email.message import EmailMessage
-from twilio.rest import Client as TwilioClient
+from functools import lru_cache
+from typing import Dict, List, Optional
+
 from .config import settings
+from .metrics import QUEUE_DEPTH, registry
+
+NOTIFICATIONS = registry.counter(
+    "realestate_notifications_total", "Notification deliveries by channel and outcome", ["channel", "status"])
+
+CHANNELS = ("email", "whatsapp")
+
+
+@lru_cache(maxsize=64)
+def _attachment_bytes(path: str, mtime_ns: int, size: int) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _read_attachment(path: str) -> bytes:
+    st = os.stat(path)
+    return _attachment_bytes(path, st.st_mtime_ns, st.st_size)
+
+
+def _is_permanent(error: Exception) -> bool:
+    """5xx SMTP replies and 4xx Twilio API errors (except 429) won't succeed on retry."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    smtp_code = getattr(error, "smtp_code", None)
+    if isinstance(smtp_code, int):
+        return smtp_code >= 500
+    status = getattr(error, "status", None)
+    return isinstance(status, int) and 400 <= status < 500 and status != 429
+
+
+class RateLimiter:
+    """Token bucket; acquire() blocks until a send is allowed. rate <= 0 disables it."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class SMTPPool:
+    """Bounded pool of logged-in SMTP connections, reused across messages."""
+
+    def __init__(self, host: str, port: int, user: str = '', password: str = '',
+                 size: int = 2, starttls: bool = True, idle_seconds: float = 60.0):
+        self.host, self.port = host, port
+        self.user, self.password = user, password
+        self.starttls = starttls
+        self.idle_seconds = idle_seconds
+        self._idle: List = []                      # [(conn, last_used)], LIFO
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.connects = 0
+
+    def _connect(self) -> smtplib.SMTP:
+        conn = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.starttls:
+            conn.starttls()
+        if self.user and self.password:
+            conn.login(self.user, self.password)
+        self.connects += 1
+        return conn
+
+    def _alive(self, conn, last_used: float) -> bool:
+        if time.monotonic() - last_used < self.idle_seconds:
+            return True
+        try:
+            return conn.noop()[0] == 250
+        except Exception:
+            return False
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        conn = None
+        try:
+            with self._lock:
+                while self._idle and conn is None:
+                    candidate, last_used = self._idle.pop()
+                    if self._alive(candidate, last_used):
+                        conn = candidate
+                    else:
+                        self._quit(candidate)
+            if conn is None:
+                conn = self._connect()
+            try:
+                yield conn
+            except Exception:
+                self._quit(conn)
+                conn = None
+                raise
+            finally:
+                if conn is not None:
+                    with self._lock:
+                        self._idle.append((conn, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    def _quit(conn):
+        try:
+            conn.quit()
+        except Exception:
+            conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._quit(conn)
 
 
 class Notifier:
-    def __init__(self):
-        self.smtp_host = settings.SMTP_HOST
-        self.smtp_port = settings.SMTP_PORT
-        self.smtp_user = settings.SMTP_USER
-        self.smtp_pass = settings.SMTP_PASS
-        if settings.TWILIO_SID and settings.TWILIO_TOKEN:
-            self.twilio = TwilioClient(settings.TWILIO_SID, settings.TWILIO_TOKEN)
-        else:
-            self.twilio = None
+    def __init__(self, smtp_host: Optional[str] = None, smtp_port: Optional[int] = None,
+                 smtp_user: Optional[str] = None, smtp_pass: Optional[str] = None,
+                 starttls: Optional[bool] = None, twilio_client=None):
+        self.smtp_host = smtp_host or settings.SMTP_HOST
+        self.smtp_port = smtp_port or settings.SMTP_PORT
+        self.smtp_user = settings.SMTP_USER if smtp_user is None else smtp_user
+        self.smtp_pass = settings.SMTP_PASS if smtp_pass is None else smtp_pass
+        self.pool = SMTPPool(self.smtp_host, self.smtp_port, self.smtp_user, self.smtp_pass,
+                             size=settings.SMTP_POOL_SIZE,
+                             starttls=settings.SMTP_STARTTLS if starttls is None else starttls,
+                             idle_seconds=settings.SMTP_IDLE_SECONDS)
+        self._twilio = twilio_client
+        self.limits = {
+            "email": RateLimiter(settings.EMAIL_RATE_PER_SEC),
+            "whatsapp": RateLimiter(settings.WHATSAPP_RATE_PER_SEC),
+        }
+        self._queues = {channel: queue.Queue() for channel in CHANNELS}
+        self._delayed: List = []                   # heap of (due, seq, job) waiting to retry
+        self._seq = itertools.count()
+        self._jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._workers: List[threading.Thread] = []
+        self._stop = threading.Event()
+        QUEUE_DEPTH.labels("notifications").set_function(self.pending)
 
-    def send_email(self, to_email: str, subject: str, body: str, attachments: list = None):
+    @property
+    def twilio(self):
+        """Twilio client, imported and built on first WhatsApp send."""
+        if self._twilio is None and settings.TWILIO_SID and settings.TWILIO_TOKEN:
+            from twilio.rest import Client as TwilioClient
+            self._twilio = TwilioClient(settings.TWILIO_SID, settings.TWILIO_TOKEN)
+        return self._twilio
+
+    # ---------------------------
+    # Building and sending one message
+    # ---------------------------
+    def _build_email(self, to_email: str, subject: str, body: str, attachments: list = None) -> EmailMessage:
         msg = EmailMessage()
         msg['Subject'] = subject
         msg['From'] = self.smtp_user
         msg['To'] = to_email
         msg.set_content(body)
+        for path in attachments or ():
+            msg.add_attachment(
+                _read_attachment(path),
+                maintype='application',
+                subtype='octet-stream',
+                filename=os.path.basename(path)
+            )
+        return msg
 
-        if attachments:
-            for path in attachments:
-                with open(path, 'rb') as f:
-                    data = f.read()
-                    msg.add_attachment(
-                        data,
-                        maintype='application',
-                        subtype='octet-stream',
-                        filename=path.split('/')[-1]
-                    )
-
-        with smtplib.SMTP(self.smtp_host, self.smtp_port) as s:
-            s.starttls()
-            s.login(self.smtp_user, self.smtp_pass)
-            s.send_message(msg)
+    def send_email(self, to_email: str, subject: str, body: str, attachments: list = None):
+        """Send now, on the caller's thread (pooled connection); prefer enqueue_email."""
+        msg = self._build_email(to_email, subject, body, attachments)
+        with self.pool.connection() as conn:
+            conn.send_message(msg)
 
     def send_whatsapp(self, to_number: str, body: str):
+        """Send now, on the caller's thread; prefer enqueue_whatsapp."""
         if not self.twilio:
             raise RuntimeError('Twilio not configured')
         from_w = f'whatsapp:{settings.TWILIO_FROM}'
         to_w = f'whatsapp:{to_number}'
         self.twilio.messages.create(body=body, from_=from_w, to=to_w)
 
+    # ---------------------------
+    # Queueing API
+    # ---------------------------
+    def enqueue_email(self, to_email: str, subject: str, body: str, attachments: list = None) -> str:
+        return self._enqueue("email", to_email, {"subject": subject, "body": body, "attachments": attachments})
+
+    def enqueue_whatsapp(self, to_number: str, body: str) -> str:
+        if not self.twilio:
+            raise RuntimeError('Twilio not configured')
+        return self._enqueue("whatsapp", to_number, {"body": body})
+
+    def notify_advertiser(self, message: str, email: Optional[str] = None,
+                          whatsapp: Optional[str] = None) -> List[str]:
+        """Queue `message` to the advertiser's email/WhatsApp (defaults from settings); returns job ids."""
+        email = email or settings.ADVERTISER_EMAIL
+        whatsapp = whatsapp or settings.ADVERTISER_WHATSAPP
+        jobs = []
+        if email:
+            jobs.append(self.enqueue_email(email, "New enquiry from a client", message))
+        if whatsapp and self.twilio:
+            jobs.append(self.enqueue_whatsapp(whatsapp, message))
+        if not jobs:
+            print("[Notifier] No advertiser contact configured; notification dropped")
+        return jobs
+
+    def _enqueue(self, channel: str, to: str, payload: Dict) -> str:
+        job = {
+            "id": uuid.uuid4().hex,
+            "channel": channel,
+            "to": to,
+            "status": "queued",
+            "attempts": 0,
+            "error": None,
+            "queued_at": time.time(),
+            "sent_at": None,
+            "payload": payload,
+        }
+        with self._lock:
+            self._jobs[job["id"]] = job
+            while len(self._jobs) > settings.NOTIFY_STATUS_KEEP:
+                self._jobs.popitem(last=False)
+        self._ensure_workers()
+        self._queues[channel].put(job)
+        return job["id"]
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return {k: v for k, v in job.items() if k != "payload"} if job else None
+
+    def pending(self) -> int:
+        return sum(q.qsize() for q in self._queues.values()) + len(self._delayed)
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Wait until nothing is queued, retrying or in flight."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                busy = any(j["status"] in ("queued", "sending", "retrying") for j in self._jobs.values())
+            if not busy:
+                return True
+            time.sleep(0.01)
+        return False
+
+    def close(self, timeout: float = 10.0):
+        self.flush(timeout)
+        self._stop.set()
+        self.pool.close()
+
+    # ---------------------------
+    # Workers
+    # ---------------------------
+    def _ensure_workers(self):
+        if self._workers:
+            return
+        with self._lock:
+            if self._workers:
+                return
+            for i in range(max(1, settings.SMTP_POOL_SIZE)):
+                self._workers.append(threading.Thread(target=self._run, args=("email",),
+                                                      name=f"notify-email-{i}", daemon=True))
+            self._workers.append(threading.Thread(target=self._run, args=("whatsapp",),
+                                                  name="notify-whatsapp", daemon=True))
+            for worker in self._workers:
+                worker.start()
+
+    def _release_due(self):
+        now = time.monotonic()
+        with self._lock:
+            due = []
+            while self._delayed and self._delayed[0][0] <= now:
+                due.append(heapq.heappop(self._delayed)[2])
+        for job in due:
+            self._queues[job["channel"]].put(job)
+
+    def _collect(self, channel: str) -> List[Dict]:
+        q = self._queues[channel]
+        try:
+            batch = [q.get(timeout=0.2)]
+        except queue.Empty:
+            return []
+        while len(batch) < settings.SMTP_BATCH:
+            try:
+                batch.append(q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, channel: str):
+        send_batch = self._send_email_batch if channel == "email" else self._send_whatsapp_batch
+        while not self._stop.is_set():
+            self._release_due()
+            batch = self._collect(channel)
+            if not batch:
+                continue
+            for job in batch:
+                job["status"] = "sending"
+            try:
+                send_batch(batch)
+            except Exception as e:
+                print(f"[Notifier] {channel} worker error: {e}")
+
+    def _send_email_batch(self, jobs: List[Dict]):
+        pending = []
+        for job in jobs:
+            # Built (attachments read) before taking a connection: a missing or
+            # unreadable file fails its own job and never costs a healthy connection
+            try:
+                pending.append((job, self._build_email(job["to"], **job["payload"])))
+            except Exception as e:
+                self._failed(job, e, permanent=True)
+        while pending:
+            try:
+                with self.pool.connection() as conn:
+                    while pending:
+                        job, msg = pending[0]
+                        self.limits["email"].acquire()
+                        try:
+                            conn.send_message(msg)
+                        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused,
+                                smtplib.SMTPDataError) as e:
+                            # Rejected message, connection still usable
+                            pending.pop(0)
+                            self._failed(job, e)
+                            continue
+                        pending.pop(0)
+                        self._sent(job)
+            except Exception as e:
+                # Connection-level failure: the pool drops the connection; the
+                # head job is charged an attempt and the rest get a new connection
+                self._failed(pending.pop(0)[0], e)
+
+    def _send_whatsapp_batch(self, jobs: List[Dict]):
+        # Twilio has no bulk send; batching here only saves worker wake-ups
+        for job in jobs:
+            self.limits["whatsapp"].acquire()
+            try:
+                self.send_whatsapp(job["to"], job["payload"]["body"])
+            except Exception as e:
+                self._failed(job, e)
+            else:
+                self._sent(job)
+
+    def _sent(self, job: Dict):
+        job["attempts"] += 1
+        job["status"], job["sent_at"], job["error"] = "sent", time.time(), None
+        NOTIFICATIONS.labels(job["channel"], "sent").inc()
+
+    def _failed(self, job: Dict, error: Exception, permanent: bool = False):
+        job["attempts"] += 1
+        job["error"] = str(error) or type(error).__name__
+        if permanent or _is_permanent(error) or job["attempts"] >= settings.NOTIFY_MAX_ATTEMPTS:
+            job["status"] = "failed"
+            NOTIFICATIONS.labels(job["channel"], "failed").inc()
+            print(f"[Notifier] {job['channel']} to {job['to']} failed: {job['error']}")
+            return
+        job["status"] = "retrying"
+        NOTIFICATIONS.labels(job["channel"], "retried").inc()
+        due = time.monotonic() + settings.NOTIFY_RETRY_BASE_SECONDS * 2 ** (job["attempts"] - 1)
+        with self._lock:
+            heapq.heappush(self._delayed, (due, next(self._seq), job))
+
 
 # convenience instance
 notifier = Notifier()
+
+
+# ---------------------------
+# Local SMTP sink + stub Twilio for tests and the benchmark
+# ---------------------------
+def smtp_sink(handshake_delay: float = 0.0):
+    """Threaded plain-SMTP server on 127.0.0.1 that accepts and counts every message."""
+    import socketserver
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            time.sleep(handshake_delay)          # stands in for TCP + TLS + AUTH round trips
+            self.wfile.write(b"220 sink\r\n")
+            for line in self.rfile:
+                cmd = line[:4].upper()
+                if cmd == b"DATA":
+                    self.wfile.write(b"354 end with .\r\n")
+                    for data in self.rfile:
+                        if data == b".\r\n":
+                            break
+                    with self.server.lock:
+                        self.server.received += 1
+                    self.wfile.write(b"250 queued\r\n")
+                elif cmd == b"QUIT":
+                    self.wfile.write(b"221 bye\r\n")
+                    return
+                else:
+                    self.wfile.write(b"250 ok\r\n")
+
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.received, server.lock = 0, threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class StubTwilio:
+    """Drop-in for twilio.rest.Client that records messages instead of sending them."""
+
+    def __init__(self):
+        self.sent = []
+        self.messages = self
+
+    def create(self, body: str, from_: str, to: str):
+        self.sent.append({"body": body, "from": from_, "to": to})
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Notification dispatcher benchmark")
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--handshake-ms", type=float, default=30.0)
+    args = parser.parse_args()
+
+    settings.EMAIL_RATE_PER_SEC = 0
+    settings.WHATSAPP_RATE_PER_SEC = 0
+    sink = smtp_sink(args.handshake_ms / 1000)
+    host, port = sink.server_address
+    n = args.messages
+
+    message = EmailMessage()
+    message['From'], message['To'], message['Subject'] = "bench@example.com", "lead@example.com", "New listing"
+    message.set_content("body")
+    t0 = time.perf_counter()
+    for i in range(n):
+        with smtplib.SMTP(host, port) as s:          # previous behaviour: new session per message
+            s.send_message(message)
+    direct_s = time.perf_counter() - t0
+    print(f"[Notify] connect per message: {n / direct_s:.0f} msg/s")
+    sink.received = 0
+
+    twilio = StubTwilio()
+    pooled = Notifier(smtp_host=host, smtp_port=port, smtp_user="bench@example.com", smtp_pass="",
+                      starttls=False, twilio_client=twilio)
+    t0 = time.perf_counter()
+    enqueue = [pooled.enqueue_email(f"lead{i}@example.com", "New listing", "body") for i in range(n)]
+    enqueue_ms = (time.perf_counter() - t0) / n * 1000
+    wa = [pooled.enqueue_whatsapp("+919800000000", f"msg {i}") for i in range(10)]
+    pooled.flush()
+    pooled_s = time.perf_counter() - t0
+    print(f"[Notify] pooled dispatcher: {n / pooled_s:.0f} msg/s, {pooled.pool.connects} SMTP sessions, "
+          f"enqueue {enqueue_ms * 1000:.0f} µs on the request path")
+    sent = sum(pooled.status(j)["status"] == "sent" for j in enqueue + wa)
+    print(f"[Notify] sink received {sink.received} emails, stub Twilio {len(twilio.sent)}, {sent} jobs sent")
+    pooled.close()
+    sink.shutdown()
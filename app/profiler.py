@@ -0,0 +1,134 @@
+"""
+profiler.py — On-demand sampling profiler for a live worker
+-----------------------------------------------------------
+Samples every thread's Python stack at a fixed interval (no tracing hooks,
+so request overhead is negligible) and aggregates them into the collapsed
+stack format understood by flamegraph.pl / speedscope / inferno:
+
+    handle_query (main.py:95);search (store.py:180);_filter_df (store.py:120) 42
+
+A session runs either for N seconds or until the next N requests finish.
+Only one session can run per worker at a time.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005, max_depth: int = 128):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._requests_left: Optional[int] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    # ---------------------------
+    # Sampling
+    # ---------------------------
+    def _frame_label(self, frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _sample(self, own_ident: int):
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                stack.append(self._frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self._sample(own_ident)
+
+    # ---------------------------
+    # Session control
+    # ---------------------------
+    def start(self, requests: Optional[int] = None) -> bool:
+        """Start sampling; False if a session is already running on this worker."""
+        with self._lock:
+            if self.running:
+                return False
+            self.stacks = Counter()
+            self.samples = 0
+            self._stop.clear()
+            self._done.clear()
+            self._requests_left = requests
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self) -> str:
+        with self._lock:
+            if self._thread is not None:
+                self._stop.set()
+                self._thread.join()
+                self._thread = None
+            self._requests_left = None
+        return self.collapsed()
+
+    def request_finished(self):
+        """Called by the HTTP middleware; ends a request-count session once N have finished."""
+        if self._requests_left is None:
+            return
+        with self._lock:
+            if self._requests_left is None:
+                return
+            self._requests_left -= 1
+            if self._requests_left <= 0:
+                self._done.set()
+
+    async def profile_for(self, seconds: float) -> str:
+        # Stopped even when the request is cancelled, or the sampler would hold the session forever
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            collapsed = self.stop()
+        return collapsed
+
+    async def profile_requests(self, timeout: float) -> str:
+        """Wait until the requested number of requests finish (or timeout), then stop."""
+        try:
+            await asyncio.to_thread(self._done.wait, timeout)
+        finally:
+            collapsed = self.stop()
+        return collapsed
+
+    def collapsed(self) -> str:
+        lines = [f"{stack} {count}" for stack, count in self.stacks.most_common()]
+        return "\n".join(lines) + "\n"
+
+
+profiler = SamplingProfiler()
+
+
+# Example usage test
+if __name__ == "__main__":
+    def busy():
+        end = time.time() + 0.5
+        while time.time() < end:
+            sum(i * i for i in range(1000))
+
+    profiler.start()
+    busy()
+    print(profiler.stop()[:500])
+    print(f"[Profiler] {profiler.samples} samples")
\ No newline at end of file
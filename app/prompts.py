@@ -0,0 +1,249 @@
+"""
+prompts.py — Token-budgeted prompt construction for the LLM calls
+------------------------------------------------------------------
+Every prompt is split into a static prefix and a variable part:
+ - the prefix (instructions, field legend, few-shot examples) is a module
+   constant sent as the system message, byte-identical on every call, so
+   provider-side prompt caching can reuse it
+ - the variable part (the listings, the seller's text) goes last, in the
+   user message, and is packed under a token budget
+
+Listings are encoded as one compact pipe-separated row each
+("3BHK apartment|Sector 62, Noida|85L|1200 sqft|Lift, Parking") instead of a
+labelled sentence, ranked (rows carrying price, location and bhk first,
+result order otherwise) and de-duplicated, then added until
+LLM_PROMPT_TOKEN_BUDGET is reached. Listings that don't fit are folded into
+one aggregate line (count, price range, top localities), so the model still
+knows how many matched.
+
+Token counts are estimated without a tokenizer (word pieces and
+punctuation, roughly BPE-sized); the provider's `usage` block remains the
+source of truth and both are logged per call by GroqLllmClient.
+    python -m app.prompts --bench     # prompt tokens and build time, old vs budgeted
+"""
+
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.catalog import parse_price
+
+SUMMARY_SYSTEM = (
+    "You are a real estate assistant. Summarize property listings for a client in a friendly, "
+    "concise way, highlighting the best options and their key features.\n"
+    "Listings are one per line: bhk+type|location|price|area|amenities (L = lakh, Cr = crore). "
+    "Empty fields are omitted. A final 'Others:' line aggregates listings not shown."
+)
+
+BATCH_SUMMARY_SYSTEM = SUMMARY_SYSTEM + (
+    "\nYou will receive several numbered client requests. Return ONLY a JSON object mapping each "
+    "request number to one short summary, e.g. {\"1\": \"...\", \"2\": \"...\"}."
+)
+
+EXTRACTION_SYSTEM = """You are an extraction assistant. Extract property listing fields from the user's text and return ONLY valid JSON.
+Fields to extract (if present):
+- title (e.g., "3BHK Apartment", "2BHK Flat")
+- location (city/area)
+- price (string, include units like 'Lakh' or 'Crore' if present)
+- area (string, include units like 'sqft' if present)
+- amenities (comma-separated string or list, e.g., "Lift, Parking")
+
+Example 1:
+Text: "I want to list my 2BHK flat in Sector 76 Noida, 950 sqft, price around 75 lakh, has parking and lift."
+Output JSON:
+{"title": "2BHK Flat", "location": "Sector 76 Noida", "price": "75 lakh", "area": "950 sqft", "amenities": "Parking, Lift"}
+
+Example 2:
+Text: "Selling a 4BHK villa in Gurugram near Golf Course Road. Asking 2.1 Crore, 2200 sq ft, garden and pool."
+Output JSON:
+{"title": "4BHK Villa", "location": "Gurugram, Golf Course Road", "price": "2.1 Crore", "area": "2200 sqft", "amenities": "Garden, Pool"}
+
+Return JSON only."""
+
+_PIECES = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+_MAX_AMENITIES = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate BPE token count: one per short word, digit run or symbol, more for long words."""
+    return sum(1 + len(piece) // 6 for piece in _PIECES.findall(text))
+
+
+def compact_price(value) -> str:
+    """'1.2 Crore' / 85.0 (lakh) -> '1.2Cr' / '85L'; the raw text when it doesn't parse."""
+    lakh = parse_price(value)
+    if lakh <= 0:
+        return str(value or "").strip()
+    if lakh >= 100:
+        return f"{lakh / 100:.2f}".rstrip("0").rstrip(".") + "Cr"
+    return f"{lakh:.1f}".rstrip("0").rstrip(".") + "L"
+
+
+def _field(p: Dict, key: str) -> str:
+    value = p.get(key)
+    if value is None or value != value:           # None / NaN
+        return ""
+    return str(value).strip()
+
+
+def compact_listing(p: Dict) -> str:
+    bhk, kind = _field(p, "bhk"), _field(p, "type")
+    head = " ".join(filter(None, [f"{bhk.split('.')[0]}BHK" if bhk and bhk not in ("0", "-1") else "", kind]))
+    title = _field(p, "title")
+    # The title only earns its tokens when it says more than bhk + type
+    if title and set(re.findall(r"[a-z]+", title.lower())) - set(re.findall(r"[a-z]+", head.lower())) - {"bhk"}:
+        head = f"{head} {title}".strip() if head else title
+    amenities = _field(p, "amenities")
+    if amenities:
+        amenities = ", ".join(a.strip() for a in amenities.split(",")[:_MAX_AMENITIES] if a.strip())
+    price = compact_price(p.get("price_value") if p.get("price_value") not in (None, "") else p.get("price"))
+    return "|".join(filter(None, [head, _field(p, "location"), price, _field(p, "area"), amenities]))
+
+
+def _rank(properties: List[Dict]) -> List[Tuple[Dict, str]]:
+    """Distinct (listing, row) pairs, complete rows first, result order otherwise."""
+    seen, ranked = set(), []
+    for p in properties:
+        row = compact_listing(p)
+        if row and row not in seen:
+            seen.add(row)
+            ranked.append((p, row))
+
+    def completeness(item):
+        p = item[0]
+        return -sum(bool(_field(p, k)) for k in ("price", "location", "bhk"))
+
+    return sorted(ranked, key=completeness)
+
+
+def _others_line(left: List[Dict]) -> str:
+    if not left:
+        return ""
+    prices = [parse_price(p.get("price_value") if p.get("price_value") not in (None, "") else p.get("price"))
+              for p in left]
+    prices = [v for v in prices if v > 0]
+    parts = [f"Others: {len(left)} more"]
+    if prices:
+        parts.append(f"{compact_price(min(prices))}-{compact_price(max(prices))}")
+    places = Counter(_field(p, "location") for p in left if _field(p, "location"))
+    if places:
+        parts.append("mostly " + ", ".join(name for name, _ in places.most_common(3)))
+    return ", ".join(parts)
+
+
+def listing_block(properties: List[Dict], budget: Optional[int] = None) -> Tuple[str, Dict]:
+    """
+    The listings packed into `budget` tokens, plus stats
+    {"listings", "included", "tokens"}.
+    """
+    budget = budget or settings.LLM_PROMPT_TOKEN_BUDGET
+    ranked = _rank(properties)
+    rows, used, included = [], 0, set()
+    for p, row in ranked:
+        cost = estimate_tokens(row) + 1
+        if used + cost > budget:
+            break
+        rows.append(row)
+        used += cost
+        included.add(id(p))
+    others = _others_line([p for p in properties if id(p) not in included])
+    if others:
+        rows.append(others)
+    text = "\n".join(rows)
+    return text, {"listings": len(properties), "included": len(included), "tokens": estimate_tokens(text)}
+
+
+def summary_prompt(properties: List[Dict], budget: Optional[int] = None) -> Tuple[str, str, Dict]:
+    """(system, user, stats) for GroqLllmClient.summarize."""
+    block, stats = listing_block(properties, budget)
+    user = f"Matches: {len(properties)}\n{block}"
+    stats["tokens"] = estimate_tokens(SUMMARY_SYSTEM) + estimate_tokens(user)
+    return SUMMARY_SYSTEM, user, stats
+
+
+def batch_summary_prompt(result_lists: List[List[Dict]], budget: Optional[int] = None) -> Tuple[str, str, Dict]:
+    """(system, user, stats) summarizing several non-empty result lists in one call; the budget is shared."""
+    budget = budget or settings.LLM_PROMPT_TOKEN_BUDGET
+    share = max(32, budget // max(1, len(result_lists)))
+    sections, included = [], 0
+    for n, properties in enumerate(result_lists, 1):
+        block, stats = listing_block(properties, share)
+        sections.append(f"Request {n} (matches: {len(properties)}):\n{block}")
+        included += stats["included"]
+    user = "\n\n".join(sections)
+    return BATCH_SUMMARY_SYSTEM, user, {
+        "listings": sum(len(p) for p in result_lists), "included": included,
+        "tokens": estimate_tokens(BATCH_SUMMARY_SYSTEM) + estimate_tokens(user),
+    }
+
+
+def extraction_prompt(text: str, budget: Optional[int] = None) -> Tuple[str, str, Dict]:
+    """(system, user, stats) for extract_property_details; overlong seller text is cut at the budget."""
+    budget = budget or settings.LLM_EXTRACT_INPUT_TOKENS
+    pieces = list(re.finditer(r"\S+", text))
+    used, end = 0, 0
+    for match in pieces:
+        used += estimate_tokens(match.group(0))
+        if used > budget:
+            break
+        end = match.end()
+    body = text[:end] if used > budget else text
+    user = f'Text: """{body}"""\nOutput JSON:'
+    return EXTRACTION_SYSTEM, user, {"truncated": used > budget,
+                                     "tokens": estimate_tokens(EXTRACTION_SYSTEM) + estimate_tokens(user)}
+
+
+# ---------------------------
+# Benchmark: prompt size, old one-line-per-listing prompt vs budgeted
+# ---------------------------
+if __name__ == "__main__":
+    import argparse
+    import random
+    import time
+
+    parser = argparse.ArgumentParser(description="Prompt builder benchmark")
+    parser.add_argument("--bench", action="store_true")
+    args = parser.parse_args()
+
+    rng = random.Random(4)
+    places = ["Sector 62, Noida", "DLF Phase 2, Gurugram", "Greater Noida West", "Dwarka, Delhi", "Baner, Pune"]
+    amenities = ["Lift", "Parking", "Gym", "Pool", "Security", "Garden", "Power Backup"]
+
+    def listing(i):
+        bhk = rng.randint(1, 5)
+        kind = rng.choice(["Apartment", "Villa", "Builder Floor"])
+        return {"id": i, "title": f"{bhk}BHK {kind}", "location": rng.choice(places), "bhk": bhk, "type": kind,
+                "price": f"{rng.randint(30, 250)} Lakh", "area": f"{rng.randint(6, 30) * 100} sqft",
+                "amenities": ", ".join(rng.sample(amenities, 4))}
+
+    def old_prompt(properties):
+        property_text = "\n".join([
+            f"- {p.get('title', 'Property')} in {p.get('location', '')}, "
+            f"{p.get('bhk', '')} BHK, Price: {p.get('price', '')}, Type: {p.get('type', '')}"
+            for p in properties
+        ])
+        return ("You are a real estate assistant. "
+                "Summarize the following property listings for a client in a friendly, concise way.\n\n"
+                f"Property List:\n{property_text}\n\n"
+                "Provide a short summary highlighting the best options and their key features.")
+
+    print(f"[Prompts] budget {settings.LLM_PROMPT_TOKEN_BUDGET} tokens for listings; "
+          f"static summary prefix {estimate_tokens(SUMMARY_SYSTEM)} tokens")
+    for n in (5, 20, 100, 1000):
+        properties = [listing(i) for i in range(n)]
+        old = estimate_tokens(old_prompt(properties))
+        t0 = time.perf_counter()
+        system, user, stats = summary_prompt(properties)
+        build_ms = (time.perf_counter() - t0) * 1000
+        print(f"[Prompts] {n:5d} listings: old prompt ~{old} tokens -> budgeted {stats['tokens']} tokens "
+              f"({stats['included']}/{n} rows{' + aggregate' if stats['included'] < n else ''}), "
+              f"built in {build_ms:.2f} ms")
+
+    seller = ("Selling my 3BHK apartment in Sector 62 Noida, 1450 sqft, asking 1.2 crore, lift parking gym. "
+              * 40)
+    old = estimate_tokens(EXTRACTION_SYSTEM) + estimate_tokens(seller)
+    _, _, stats = extraction_prompt(seller)
+    print(f"[Prompts] extraction of a {len(seller)}-char text: ~{old} tokens -> {stats['tokens']} "
+          f"(truncated: {stats['truncated']}); static prefix {estimate_tokens(EXTRACTION_SYSTEM)} tokens, "
+          f"identical on every call")
@@ -0,0 +1,323 @@
+"""
+saved_searches.py — Saved-search alerts (percolator)
+-----------------------------------------------------
+Buyers save a free-text search ("3bhk flat in noida under 2 crore"); it is
+parsed once with store.parse_query and kept as a filter tuple. Instead of
+re-running every saved search against each new listing, the searches are
+indexed the other way round:
+ - buckets keyed by (location, bhk, type), with None as "any"
+ - inside a bucket, max_price thresholds kept sorted (no budget = +inf)
+
+A new listing probes at most 2 x 2 x (1 + matching types) buckets (its
+location keywords, its bhk, its type, each or "any") and bisects each bucket
+to the thresholds >= its price, so the work scales with the number of
+matches, not the number of saved searches.
+
+Matches are collected per subscriber and sent as one digest per
+SAVED_SEARCH_DIGEST_SECONDS through the notifier queue.
+
+Subscriptions are an append-only JSON-lines log (SAVED_SEARCHES_PATH); each
+worker tails it before matching, so searches saved in another worker are
+seen too.
+    python -m app.saved_searches --bench 100000   # index vs re-running every search
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from itertools import product
+from typing import Dict, List, Optional
+
+from .catalog import parse_price
+from .config import settings
+from .store import parse_query
+
+INF = float("inf")
+
+
+class _Thresholds:
+    """Subscription ids sorted by max_price; at_least(p) is a bisect plus the suffix."""
+
+    def __init__(self):
+        self.prices: List[float] = []
+        self.ids: List[str] = []
+
+    def add(self, price: float, sub_id: str):
+        i = bisect_left(self.prices, price)
+        self.prices.insert(i, price)
+        self.ids.insert(i, sub_id)
+
+    def remove(self, price: float, sub_id: str):
+        i = bisect_left(self.prices, price)
+        while i < len(self.prices) and self.prices[i] == price:
+            if self.ids[i] == sub_id:
+                del self.prices[i], self.ids[i]
+                return
+            i += 1
+
+    def at_least(self, price: float) -> List[str]:
+        return self.ids[bisect_left(self.prices, price):]
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class SavedSearchIndex:
+    def __init__(self, path: Optional[str] = None, notifier=None):
+        self.path = path or settings.SAVED_SEARCHES_PATH
+        self.notifier = notifier
+        self.subscriptions: Dict[str, Dict] = {}
+        self._buckets: Dict[tuple, _Thresholds] = {}
+        self._locations: Dict[str, int] = {}        # location keyword -> subscriptions using it
+        self._types: Dict[str, int] = {}
+        self._pending: Dict[str, List[Dict]] = {}   # subscription id -> matched listings awaiting the digest
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.RLock()
+        self._offset = 0
+        self._inode = None
+        self._sync()
+
+    # ---------------------------
+    # Persistence
+    # ---------------------------
+    def _sync(self):
+        """Apply log lines appended since the last read (by this or another worker)."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if st.st_ino != self._inode or st.st_size < self._offset:
+                self._reset()
+                self._inode = st.st_ino
+            if st.st_size == self._offset:
+                return
+            with open(self.path) as f:
+                f.seek(self._offset)
+                for line in f:
+                    if not line.endswith("\n"):
+                        break                           # partially written; pick it up next time
+                    self._offset += len(line.encode())
+                    if line.strip():
+                        self._apply(json.loads(line))
+
+    def _reset(self):
+        self.subscriptions.clear()
+        self._buckets.clear()
+        self._locations.clear()
+        self._types.clear()
+        self._offset = 0
+
+    def _append(self, entry: Dict):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self._sync()
+
+    def _apply(self, entry: Dict):
+        if entry.get("op") == "unsubscribe":
+            sub = self.subscriptions.pop(entry["id"], None)
+            if sub:
+                self._unindex(sub)
+        elif entry["id"] not in self.subscriptions:
+            self.subscriptions[entry["id"]] = entry
+            self._index(entry)
+
+    # ---------------------------
+    # Index
+    # ---------------------------
+    @staticmethod
+    def _key(sub: Dict) -> tuple:
+        f = sub["filters"]
+        return f.get("location"), f.get("bhk"), f.get("prop_type")
+
+    @staticmethod
+    def _budget(sub: Dict) -> float:
+        return sub["filters"].get("max_price") or INF
+
+    def _index(self, sub: Dict):
+        key = self._key(sub)
+        self._buckets.setdefault(key, _Thresholds()).add(self._budget(sub), sub["id"])
+        for counts, value in ((self._locations, key[0]), (self._types, key[2])):
+            if value:
+                counts[value] = counts.get(value, 0) + 1
+
+    def _unindex(self, sub: Dict):
+        key = self._key(sub)
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket.remove(self._budget(sub), sub["id"])
+            if not len(bucket):
+                del self._buckets[key]
+        for counts, value in ((self._locations, key[0]), (self._types, key[2])):
+            if value:
+                counts[value] -= 1
+                if not counts[value]:
+                    del counts[value]
+
+    # ---------------------------
+    # Public API
+    # ---------------------------
+    def subscribe(self, query: str, email: Optional[str] = None, whatsapp: Optional[str] = None) -> Dict:
+        """Save a search; raises ValueError when it has no filters (it would match everything)."""
+        filters = parse_query(query)
+        if not any(filters.values()):
+            raise ValueError("Search has no location, bhk, budget or type to match on")
+        if not email and not whatsapp:
+            raise ValueError("An email or WhatsApp number is required for alerts")
+        sub = {
+            "id": uuid.uuid4().hex,
+            "query": query,
+            "filters": filters,
+            "email": email,
+            "whatsapp": whatsapp,
+            "created": int(time.time()),
+        }
+        self._append(sub)
+        return sub
+
+    def unsubscribe(self, sub_id: str) -> bool:
+        self._sync()
+        if sub_id not in self.subscriptions:
+            return False
+        self._append({"op": "unsubscribe", "id": sub_id})
+        return True
+
+    def match(self, listing: Dict) -> List[Dict]:
+        """Saved searches the listing satisfies (same semantics as PropertyStore.search)."""
+        self._sync()
+        location = str(listing.get("location") or "").lower()
+        prop_type = str(listing.get("type") or "").lower()
+        try:
+            bhk = int(listing.get("bhk"))
+        except (TypeError, ValueError):
+            bhk = None
+        price = parse_price(listing.get("price_value", listing.get("price")))
+
+        with self._lock:
+            locations = [None] + [loc for loc in self._locations if loc in location]
+            types = [None] + [t for t in self._types if t in prop_type]
+            matched = []
+            for key in product(locations, (None, bhk) if bhk else (None,), types):
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    matched.extend(bucket.at_least(price))
+            return [self.subscriptions[sub_id] for sub_id in matched]
+
+    def percolate(self, listing: Dict) -> List[str]:
+        """Match a new listing and queue it for the subscribers' next digest."""
+        subs = self.match(listing)
+        if subs:
+            with self._lock:
+                for sub in subs:
+                    self._pending.setdefault(sub["id"], []).append(listing)
+                if self._timer is None:
+                    self._timer = threading.Timer(settings.SAVED_SEARCH_DIGEST_SECONDS, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+            print(f"[Alerts] Listing {listing.get('id')} matched {len(subs)} saved searches")
+        return [sub["id"] for sub in subs]
+
+    def flush(self) -> int:
+        """Send one digest per subscriber with everything matched since the last flush."""
+        with self._lock:
+            pending, self._pending, self._timer = self._pending, {}, None
+        sent = 0
+        for sub_id, listings in pending.items():
+            sub = self.subscriptions.get(sub_id)
+            if sub is None or self.notifier is None:
+                continue
+            body = self._digest(sub, listings)
+            try:
+                if sub.get("email"):
+                    self.notifier.enqueue_email(sub["email"], f"{len(listings)} new listing(s) for your search", body)
+                if sub.get("whatsapp") and self.notifier.twilio:
+                    self.notifier.enqueue_whatsapp(sub["whatsapp"], body)
+                sent += 1
+            except Exception as e:
+                print(f"[Alerts] Could not queue digest for {sub_id}: {e}")
+        return sent
+
+    @staticmethod
+    def _digest(sub: Dict, listings: List[Dict]) -> str:
+        lines = [f"New listings matching \"{sub['query']}\":"]
+        for item in listings[:settings.SAVED_SEARCH_DIGEST_MAX]:
+            lines.append(f"- {item.get('title', 'Property')} | {item.get('location', '')} | {item.get('price', '')}")
+        if len(listings) > settings.SAVED_SEARCH_DIGEST_MAX:
+            lines.append(f"...and {len(listings) - settings.SAVED_SEARCH_DIGEST_MAX} more")
+        return "\n".join(lines)
+
+
+# ---------------------------
+# Benchmark: index vs re-running every saved search
+# ---------------------------
+if __name__ == "__main__":
+    import argparse
+    import random
+    import tempfile
+
+    from .store import KNOWN_LOCATIONS
+
+    parser = argparse.ArgumentParser(description="Saved-search percolator benchmark")
+    parser.add_argument("--bench", type=int, default=100000, help="number of saved searches")
+    parser.add_argument("--listings", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    kinds = ["flat", "villa", "plot", "house"]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "saved.jsonl")
+        with open(path, "w") as f:
+            for i in range(args.bench):
+                query = " ".join(filter(None, [
+                    f"{rng.randint(1, 5)}bhk" if rng.random() < 0.8 else "",
+                    rng.choice(kinds),
+                    f"in {rng.choice(KNOWN_LOCATIONS)}" if rng.random() < 0.9 else "",
+                    f"under {rng.randint(20, 500)} lakh" if rng.random() < 0.7 else "",
+                ]))
+                f.write(json.dumps({"id": str(i), "query": query, "filters": parse_query(query),
+                                    "email": f"buyer{i}@example.com"}) + "\n")
+        t0 = time.perf_counter()
+        index = SavedSearchIndex(path)
+        load_s = time.perf_counter() - t0
+
+        cities = ["Sector 62, Noida", "DLF Phase 2, Gurugram", "Andheri, Mumbai", "Baner, Pune",
+                  "Greater Noida West", "Dwarka, Delhi", "Whitefield, Bangalore"]
+        listings = [{"id": i, "location": rng.choice(cities), "bhk": rng.randint(1, 5),
+                     "type": rng.choice(["Apartment", "Villa", "Plot", "Builder Floor"]),
+                     "price": f"{rng.randint(20, 500)} Lakh"} for i in range(args.listings)]
+
+        def naive(listing):
+            hits = []
+            price = parse_price(listing["price"])
+            for sub in index.subscriptions.values():
+                f = sub["filters"]
+                if f["location"] and f["location"] not in listing["location"].lower():
+                    continue
+                if f["bhk"] and f["bhk"] != listing["bhk"]:
+                    continue
+                if f["prop_type"] and f["prop_type"] not in listing["type"].lower():
+                    continue
+                if f["max_price"] and price > f["max_price"]:
+                    continue
+                hits.append(sub["id"])
+            return hits
+
+        sample = listings[:max(1, args.listings // 20)]
+        t0 = time.perf_counter()
+        expected = [sorted(naive(item)) for item in sample]
+        naive_ms = (time.perf_counter() - t0) / len(sample) * 1000
+
+        t0 = time.perf_counter()
+        matched = 0
+        for item in listings:
+            matched += len(index.match(item))
+        index_ms = (time.perf_counter() - t0) / len(listings) * 1000
+        same = all(sorted(s["id"] for s in index.match(item)) == want for item, want in zip(sample, expected))
+        print(f"[Alerts] {len(index.subscriptions)} saved searches loaded in {load_s:.2f}s, "
+              f"{len(index._buckets)} buckets")
+        print(f"[Alerts] per new listing: scan {naive_ms:.2f} ms, index {index_ms:.3f} ms "
+              f"({matched / len(listings):.0f} matches avg), identical results: {same}")
@@ -1,62 +1,390 @@
 # app/scheduler.py
+import json
 import os
+import threading
 import uuid
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from .config import settings
+
+try:
+    import fcntl
+except ImportError:   # Windows: single-worker deployments only
+    fcntl = None
+
+# Attempts to book a fresh slot when another worker takes the one just found
+_BOOKING_ATTEMPTS = 3
+
+
+class SlotUnavailable(ValueError):
+    """The requested visit overlaps an existing booking for the property or agent."""
+
+    def __init__(self, booking_id: str):
+        super().__init__(f"Slot overlaps booking {booking_id}")
+        self.booking_id = booking_id
+
+
+class IntervalIndex:
+    """
+    Bookings for one property or agent as non-overlapping [start, end)
+    intervals (epoch seconds), sorted by start. Because they never overlap,
+    the only candidates for a conflict are the neighbours of the insertion
+    point, so a check is two bisects.
+    """
+
+    def __init__(self):
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        self.ids: List[str] = []
+
+    def conflict(self, start: int, end: int) -> Optional[int]:
+        """Position of a booking overlapping [start, end), if any."""
+        i = bisect_right(self.starts, start)
+        if i and self.ends[i - 1] > start:
+            return i - 1
+        if i < len(self.starts) and self.starts[i] < end:
+            return i
+        return None
+
+    def add(self, start: int, end: int, booking_id: str):
+        i = bisect_left(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.ids.insert(i, booking_id)
+
+    def remove(self, start: int, booking_id: str):
+        i = bisect_left(self.starts, start)
+        while i < len(self.starts) and self.starts[i] == start:
+            if self.ids[i] == booking_id:
+                del self.starts[i], self.ends[i], self.ids[i]
+                return
+            i += 1
+
+    def __len__(self):
+        return len(self.starts)
+
 
 class VisitScheduler:
     """
-    Handles scheduling of property site visits and generates .ics calendar files.
+    Books property site visits against per-property and per-agent interval
+    indexes, and renders .ics calendar documents on demand.
+
+    Bookings are persisted as an append-only JSON-lines log (visits.jsonl in
+    `output_dir`) and replayed into the indexes at startup; the log is
+    rewritten without cancelled entries once they make up half of it.
+
+    Every Uvicorn worker has its own scheduler over the same log. Each
+    operation takes an flock on visits.lock and first replays whatever
+    other workers appended since its last look (or the whole log, when one
+    of them compacted it), so conflict checks, appends and compaction
+    always see every worker's bookings.
     """
 
     def __init__(self, output_dir: str = "data/schedules"):
         self.output_dir = output_dir
         os.makedirs(self.output_dir, exist_ok=True)
+        self.log_path = os.path.join(self.output_dir, "visits.jsonl")
+        self.lock_path = os.path.join(self.output_dir, "visits.lock")
+        self._lock = threading.Lock()
+        self._reset()
+        with self._locked():
+            if self._cancelled * 2 > len(self.bookings) + self._cancelled:
+                self._compact()
+        print(f"[Scheduler] Loaded {len(self.bookings)} visits")
+
+    # ---------------------------
+    # Persistence
+    # ---------------------------
+    def _reset(self):
+        self.bookings: Dict[str, Dict] = {}
+        self._properties: Dict[str, IntervalIndex] = {}
+        self._agents: Dict[str, IntervalIndex] = {}
+        self._cancelled = 0
+        self._log_id = None            # (st_dev, st_ino) of the log replayed so far
+        self._offset = 0
 
-    def schedule_visit(self, client_name: str, property_name: str, date_time: datetime) -> str:
+    @contextmanager
+    def _locked(self):
+        """This process's lock plus the cross-worker flock, with the log replayed up to date."""
+        with self._lock:
+            if fcntl is None:
+                self._sync()
+                yield
+                return
+            with open(self.lock_path, "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._sync()
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _sync(self):
+        """Replay log entries appended since the last sync; start over if the log was compacted."""
+        try:
+            st = os.stat(self.log_path)
+        except FileNotFoundError:
+            if self._log_id is not None:
+                self._reset()
+            return
+        if (st.st_dev, st.st_ino) != self._log_id or st.st_size < self._offset:
+            self._reset()
+            self._log_id = (st.st_dev, st.st_ino)
+        if st.st_size == self._offset:
+            return
+        with open(self.log_path, "rb") as f:
+            f.seek(self._offset)
+            for line in f:
+                if line.strip():
+                    self._apply(json.loads(line))
+            self._offset = f.tell()
+
+    def _apply(self, entry: Dict):
+        if entry.get("op") == "cancel":
+            booking = self.bookings.pop(entry["id"], None)
+            if booking:
+                self._unindex(booking)
+            self._cancelled += 1
+        else:
+            self.bookings[entry["id"]] = entry
+            self._index(entry)
+
+    def _append(self, entry: Dict):
+        with open(self.log_path, "ab") as f:
+            f.write((json.dumps(entry, separators=(",", ":")) + "\n").encode())
+            self._offset = f.tell()
+        if self._log_id is None:
+            st = os.stat(self.log_path)
+            self._log_id = (st.st_dev, st.st_ino)
+
+    def _compact(self):
+        tmp = self.log_path + ".tmp"
+        with open(tmp, "wb") as f:
+            for booking in self.bookings.values():
+                f.write((json.dumps(booking, separators=(",", ":")) + "\n").encode())
+        os.replace(tmp, self.log_path)
+        st = os.stat(self.log_path)
+        self._log_id, self._offset = (st.st_dev, st.st_ino), st.st_size
+        self._cancelled = 0
+
+    # ---------------------------
+    # Index
+    # ---------------------------
+    def _indexes(self, property_key: Optional[str], agent: Optional[str], create: bool = False) -> List[IntervalIndex]:
+        found = []
+        for table, key in ((self._properties, property_key), (self._agents, agent)):
+            if not key:
+                continue
+            index = table.get(key)
+            if index is None and create:
+                index = table[key] = IntervalIndex()
+            if index is not None:
+                found.append(index)
+        return found
+
+    def _index(self, booking: Dict):
+        for index in self._indexes(booking["property"], booking.get("agent"), create=True):
+            index.add(booking["start"], booking["end"], booking["id"])
+
+    def _unindex(self, booking: Dict):
+        for index in self._indexes(booking["property"], booking.get("agent")):
+            index.remove(booking["start"], booking["id"])
+
+    def _first_conflict(self, indexes: Iterable[IntervalIndex], start: int, end: int) -> Optional[tuple]:
+        for index in indexes:
+            i = index.conflict(start, end)
+            if i is not None:
+                return index.ids[i], index.ends[i]
+        return None
+
+    # ---------------------------
+    # Public API
+    # ---------------------------
+    def schedule_visit(self, client_name: str, property_name: str, date_time: datetime,
+                       agent: Optional[str] = None, property_id: Optional[str] = None,
+                       duration_minutes: Optional[int] = None) -> Dict:
         """
-        Creates an ICS file for the site visit appointment.
-        Returns the file path.
+        Books the visit if neither the property nor the agent is busy then.
+        Returns the booking; raises SlotUnavailable on a conflict.
         """
-        event_id = str(uuid.uuid4())
-        file_path = os.path.join(self.output_dir, f"visit_{event_id}.ics")
+        duration = duration_minutes or settings.VISIT_MINUTES
+        start = int(date_time.timestamp())
+        booking = {
+            "id": str(uuid.uuid4()),
+            "client": client_name,
+            "property_name": property_name,
+            "property": str(property_id or property_name),
+            "agent": agent,
+            "start": start,
+            "end": start + duration * 60,
+            "created": int(datetime.now().timestamp()),
+        }
+        with self._locked():
+            hit = self._first_conflict(self._indexes(booking["property"], agent), booking["start"], booking["end"])
+            if hit is not None:
+                raise SlotUnavailable(hit[0])
+            self.bookings[booking["id"]] = booking
+            self._index(booking)
+            self._append(booking)
+
+        print(f"[Scheduler] Visit scheduled: {booking['id']} at {date_time:%Y-%m-%d %H:%M}")
+        return booking
 
-        dt_start = date_time.strftime("%Y%m%dT%H%M%S")
-        dt_end = (date_time + timedelta(hours=1)).strftime("%Y%m%dT%H%M%S")
+    def cancel(self, booking_id: str) -> bool:
+        with self._locked():
+            booking = self.bookings.pop(booking_id, None)
+            if booking is None:
+                return False
+            self._unindex(booking)
+            self._append({"op": "cancel", "id": booking_id})
+            self._cancelled += 1
+            if self._cancelled * 2 > len(self.bookings) + self._cancelled:
+                self._compact()
+        return True
 
-        ics_content = f"""BEGIN:VCALENDAR
+    def is_free(self, date_time: datetime, property_id: Optional[str] = None, agent: Optional[str] = None,
+                duration_minutes: Optional[int] = None) -> bool:
+        start = int(date_time.timestamp())
+        end = start + (duration_minutes or settings.VISIT_MINUTES) * 60
+        with self._locked():
+            return self._first_conflict(self._indexes(property_id, agent), start, end) is None
+
+    def next_free_slots(self, property_id: Optional[str] = None, agent: Optional[str] = None,
+                        after: Optional[datetime] = None, n: int = 5,
+                        duration_minutes: Optional[int] = None) -> List[datetime]:
+        """
+        The next `n` visit start times (on the VISIT_SLOT_MINUTES grid, within
+        VISIT_DAY_START..VISIT_DAY_END) when both the property and the agent are free.
+        """
+        duration = (duration_minutes or settings.VISIT_MINUTES) * 60
+        t = self._align(after or datetime.now(), duration)
+        slots = []
+        with self._locked():
+            indexes = self._indexes(property_id, agent)
+            for _ in range(n * 1000):                      # bounded walk; each step skips a booking or a night
+                if len(slots) >= n:
+                    break
+                hit = self._first_conflict(indexes, t, t + duration)
+                if hit is not None:
+                    t = self._align(datetime.fromtimestamp(hit[1]), duration)
+                    continue
+                slots.append(datetime.fromtimestamp(t))
+                t = self._align(datetime.fromtimestamp(t + duration), duration)
+        return slots
+
+    def _align(self, when: datetime, duration: int) -> int:
+        """Round up to the slot grid and move into visiting hours."""
+        step = settings.VISIT_SLOT_MINUTES
+        minutes = -(-(when.hour * 60 + when.minute + (when.second > 0)) // step) * step
+        day = when.replace(hour=0, minute=0, second=0, microsecond=0)
+        start = max(minutes, settings.VISIT_DAY_START * 60)
+        if start * 60 + duration > settings.VISIT_DAY_END * 3600:
+            day += timedelta(days=1)
+            start = settings.VISIT_DAY_START * 60
+        return int((day + timedelta(minutes=start)).timestamp())
+
+    def ics(self, booking_id: str) -> Optional[str]:
+        """iCalendar document for a booking, generated on request."""
+        with self._locked():
+            booking = self.bookings.get(booking_id)
+        if booking is None:
+            return None
+        dt_start = datetime.fromtimestamp(booking["start"]).strftime("%Y%m%dT%H%M%S")
+        dt_end = datetime.fromtimestamp(booking["end"]).strftime("%Y%m%dT%H%M%S")
+        stamp = datetime.utcfromtimestamp(booking["created"]).strftime("%Y%m%dT%H%M%SZ")
+        return f"""BEGIN:VCALENDAR
 VERSION:2.0
 PRODID:-//RealEstateAgenticAI//EN
 BEGIN:VEVENT
-UID:{event_id}
-DTSTAMP:{datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")}
+UID:{booking["id"]}
+DTSTAMP:{stamp}
 DTSTART:{dt_start}
 DTEND:{dt_end}
-SUMMARY:Site Visit - {property_name}
-DESCRIPTION:Scheduled site visit for {client_name} to view property: {property_name}
+SUMMARY:Site Visit - {booking["property_name"]}
+DESCRIPTION:Scheduled site visit for {booking["client"]} to view property: {booking["property_name"]}
 LOCATION:Property Location
 END:VEVENT
 END:VCALENDAR
 """
 
-        with open(file_path, "w") as f:
-            f.write(ics_content)
-
-        print(f"[Scheduler] Visit scheduled: {file_path}")
-        return file_path
-
-    def schedule_from_text(self, query_data: dict) -> str:
+    def schedule_from_text(self, query_data: dict) -> Optional[Dict]:
         """
-        Example convenience function to auto-schedule based on NLU output.
+        Auto-schedule from NLU output: books the first slot from tomorrow on
+        when both the listing and its agent are free. The entities must name
+        the listing ("property_id", with "property" as its display name) and
+        its "agent"; raises ValueError otherwise. Returns None when no slot
+        is free (or other workers kept taking the ones found).
         """
         client_name = query_data.get("client_name", "Client")
-        property_name = query_data.get("entities", {}).get("property", "Selected Property")
+        entities = query_data.get("entities", {})
+        property_id, agent = entities.get("property_id"), entities.get("agent")
+        if not property_id or not agent:
+            raise ValueError("A visit needs a listing id and its agent")
+        property_name = entities.get("property") or f"Property {property_id}"
 
-        # Default: schedule 24 hours from now
-        visit_time = datetime.now() + timedelta(days=1)
-        return self.schedule_visit(client_name, property_name, visit_time)
+        for _ in range(_BOOKING_ATTEMPTS):
+            slots = self.next_free_slots(property_id, agent, after=datetime.now() + timedelta(days=1), n=1)
+            if not slots:
+                return None
+            try:
+                return self.schedule_visit(client_name, property_name, slots[0], agent=agent,
+                                           property_id=property_id)
+            except SlotUnavailable:
+                continue                           # booked by another worker since the lookup
+        return None
 
 
-# Example usage test
+# Example usage / benchmark
 if __name__ == "__main__":
-    scheduler = VisitScheduler()
-    scheduler.schedule_visit("Rahul Sharma", "Sunshine Villa, Noida", datetime.now() + timedelta(days=2, hours=3))
+    import argparse
+    import contextlib
+    import io
+    import random
+    import tempfile
+    import time
+
+    parser = argparse.ArgumentParser(description="Visit scheduler")
+    parser.add_argument("--bench", type=int, default=0, help="book N visits and time conflict checks")
+    args = parser.parse_args()
+
+    if not args.bench:
+        scheduler = VisitScheduler()
+        booking = scheduler.schedule_visit("Rahul Sharma", "Sunshine Villa, Noida",
+                                           datetime.now() + timedelta(days=2, hours=3))
+        print(scheduler.ics(booking["id"]))
+        print(scheduler.next_free_slots("Sunshine Villa, Noida", n=3))
+    else:
+        rng = random.Random(7)
+        with tempfile.TemporaryDirectory() as tmp:
+            scheduler = VisitScheduler(tmp)
+            base = datetime.now().replace(hour=10, minute=0, second=0, microsecond=0) + timedelta(days=1)
+            t0, booked = time.perf_counter(), 0
+            with contextlib.redirect_stdout(io.StringIO()):
+                for i in range(args.bench):
+                    when = base + timedelta(days=rng.randrange(365), hours=rng.randrange(9))
+                    try:
+                        scheduler.schedule_visit(f"Client {i}", f"Listing {rng.randrange(200)}", when,
+                                                 agent=f"Agent {rng.randrange(20)}")
+                        booked += 1
+                    except SlotUnavailable:
+                        pass
+            book_s = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            for _ in range(10000):
+                scheduler.is_free(base + timedelta(days=rng.randrange(365), hours=rng.randrange(9)),
+                                  f"Listing {rng.randrange(200)}", f"Agent {rng.randrange(20)}")
+            check_us = (time.perf_counter() - t0) / 10000 * 1e6
+            t0 = time.perf_counter()
+            for _ in range(1000):
+                scheduler.next_free_slots(f"Listing {rng.randrange(200)}", f"Agent {rng.randrange(20)}",
+                                          after=base, n=5)
+            slots_us = (time.perf_counter() - t0) / 1000 * 1e6
+            t0 = time.perf_counter()
+            VisitScheduler(tmp)
+            load_s = time.perf_counter() - t0
+            size = os.path.getsize(os.path.join(tmp, "visits.jsonl"))
+            print(f"[Scheduler] {booked}/{args.bench} booked in {book_s:.2f}s, conflict check {check_us:.1f} µs, "
+                  f"next 5 free slots {slots_us:.1f} µs, reload {load_s:.2f}s, log {size / booked:.0f} B/visit")
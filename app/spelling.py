@@ -0,0 +1,249 @@
+"""
+spelling.py — Domain-aware query spelling correction (symmetric delete)
+------------------------------------------------------------------------
+Replaces the per-word autocorrect Speller in query normalization. The
+vocabulary is what queries are matched against: catalog locations and
+types (weighted by listing count), amenities and the query words the
+parser and intent classifier look for. A general English dictionary would
+"correct" localities like "noida" or "dwarka" into English words.
+
+Lookup is SymSpell's symmetric delete: every vocabulary word is indexed
+under all its variants with up to SPELL_MAX_DISTANCE characters deleted,
+so the candidates for a typo are the words sharing one of the typo's own
+deletes ("gurgoan" and "gurgaon" both reduce to "gurgan"). Candidates are
+verified with a bounded Damerau-Levenshtein distance; the closest wins,
+then the most frequent. Tokens with digits ("3bhk", "62"), very short
+tokens and known words are left alone.
+
+The vocabulary is small, so an ordinary word it lacks would otherwise be
+pulled onto its nearest neighbour ("land" -> "and", "monday" -> "today").
+To keep that from changing a query's meaning:
+ - date words and the wider set of property words are in the vocabulary
+ - only words of SPELL_MIN_LENGTH letters or more are correction targets
+ - a correction two edits away is only made onto a location or property
+   type term (the "anchors"); everything else must be one edit away
+
+Corrections are memoized per token (SPELL_CACHE_SIZE), so a repeated
+token costs one dict lookup. The index is rebuilt per catalog generation
+and swapped in as a whole.
+    python -m app.spelling --bench      # per-token cost vs autocorrect's Speller
+"""
+
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.config import settings
+
+# Words queries use that the catalog columns don't carry
+QUERY_WORDS = (
+    "show find search available property properties flat flats apartment apartments villa villas plot plots "
+    "house houses penthouse studio builder floor bungalow duplex bhk rk bedroom bedrooms bathroom bathrooms "
+    "lakh lakhs lac crore crores under below above less than within budget price cost rate sqft area "
+    "near with without and for the in of to at me my want looking need some any all best cheap new ready "
+    "move possession construction resale rent sale buy schedule visit book site see appointment tomorrow "
+    "today contact call whatsapp email connect agent owner sector phase city west east north south "
+    "shop shops showroom office offices land commercial residential agricultural farm farmhouse warehouse "
+    "godown kothi independent corner home homes room rooms hall kitchen terrace road facing plan listing listings"
+)
+DATE_WORDS = (
+    "monday tuesday wednesday thursday friday saturday sunday weekend weekday morning afternoon evening "
+    "night day days week weeks month months year next this date time january february march april may june "
+    "july august september october november december"
+)
+# Property types a two-edit typo may be corrected onto (locations are anchors too)
+TYPE_WORDS = (
+    "flat apartment villa plot house penthouse studio builder floor bungalow duplex shop office land "
+    "farmhouse warehouse showroom kothi"
+)
+AMENITIES = (
+    "parking lift gym pool swimming garden security clubhouse balcony furnished semifurnished unfurnished "
+    "power backup park school hospital metro"
+)
+_BASE_COUNT = 1000          # query words outrank catalog words they collide with
+
+
+def damerau_levenshtein(a: str, b: str, limit: int) -> int:
+    """Optimal-string-alignment distance, or limit + 1 once it is known to exceed `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2, prev = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+def _deletes(word: str, distance: int) -> set:
+    found, frontier = {word}, {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w)) if len(w) > 1}
+        found |= frontier
+    return found
+
+
+def _max_distance(word: str) -> int:
+    return min(settings.SPELL_MAX_DISTANCE, 1 if len(word) <= 4 else 2)
+
+
+class SpellCorrector:
+    def __init__(self, vocabulary: Optional[Dict[str, int]] = None, anchors: Optional[Iterable[str]] = None):
+        self._state: Tuple[Dict[str, int], Dict[str, List[str]], frozenset] = ({}, {}, frozenset())
+        self.correct_token = lru_cache(maxsize=settings.SPELL_CACHE_SIZE)(self._correct_token)
+        self.update(vocabulary if vocabulary is not None else base_vocabulary(), anchors)
+
+    def update(self, vocabulary: Dict[str, int], anchors: Optional[Iterable[str]] = None):
+        """
+        Index a new vocabulary (word -> frequency) and swap it in. `anchors`
+        (default: base_anchors()) are the location / type words a two-edit
+        typo may be corrected onto.
+        """
+        deletes: Dict[str, List[str]] = {}
+        for word in vocabulary:
+            # Short words ("and", "for") are known but never a correction target
+            if len(word) < settings.SPELL_MIN_LENGTH:
+                continue
+            for variant in _deletes(word, _max_distance(word)):
+                deletes.setdefault(variant, []).append(word)
+        anchors = frozenset(anchors if anchors is not None else base_anchors())
+        self._state = (dict(vocabulary), deletes, anchors)
+        self.correct_token.cache_clear()
+
+    def _correct_token(self, token: str) -> str:
+        words, deletes, anchors = self._state
+        if token in words or len(token) < settings.SPELL_MIN_LENGTH or not token.isalpha():
+            return token
+        limit = _max_distance(token)
+        best, best_key = token, None
+        for variant in _deletes(token, limit):
+            for word in deletes.get(variant, ()):
+                distance = damerau_levenshtein(token, word, limit)
+                if distance > limit or (distance > 1 and word not in anchors):
+                    continue
+                key = (distance, -words[word], word)
+                if best_key is None or key < best_key:
+                    best, best_key = word, key
+        return best
+
+    def correct(self, text: str) -> str:
+        return " ".join(self.correct_token(token) for token in text.split())
+
+    def __len__(self):
+        return len(self._state[0])
+
+
+def base_vocabulary() -> Dict[str, int]:
+    from app.store import KNOWN_LOCATIONS
+    vocabulary = {word: _BASE_COUNT for word in (QUERY_WORDS + " " + AMENITIES + " " + DATE_WORDS).split()}
+    for location in KNOWN_LOCATIONS:
+        for word in location.split():
+            vocabulary[word] = vocabulary.get(word, 0) + _BASE_COUNT
+    return vocabulary
+
+
+def base_anchors() -> set:
+    from app.store import KNOWN_LOCATIONS
+    return set(TYPE_WORDS.split()) | {word for location in KNOWN_LOCATIONS for word in location.split()}
+
+
+def catalog_vocabulary(entries: Iterable[Tuple[str, str, int]]) -> Dict[str, int]:
+    """Base vocabulary plus the words of catalog locations and types, counted by listings."""
+    vocabulary = base_vocabulary()
+    for text, kind, count in entries:
+        if kind not in ("location", "type"):
+            continue
+        for word in re.findall(r"[a-z]+", str(text).lower()):
+            vocabulary[word] = vocabulary.get(word, 0) + int(count)
+    return vocabulary
+
+
+def catalog_anchors(entries: Iterable[Tuple[str, str, int]]) -> set:
+    """Base anchors plus the words of catalog locations and types."""
+    anchors = base_anchors()
+    for text, kind, _ in entries:
+        if kind in ("location", "type"):
+            anchors.update(re.findall(r"[a-z]+", str(text).lower()))
+    return anchors
+
+
+# ---------------------------
+# Benchmark: per-token cost vs autocorrect
+# ---------------------------
+if __name__ == "__main__":
+    import argparse
+    import random
+    import time
+
+    parser = argparse.ArgumentParser(description="Query spelling correction benchmark")
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    localities = ["sector 62 noida", "dlf phase 2 gurgaon", "greater noida west", "andheri mumbai",
+                  "whitefield bangalore", "dwarka delhi", "baner pune", "gurugram golf course road"]
+    entries = [(loc, "location", 50) for loc in localities] + [("apartment", "type", 400), ("villa", "type", 80)]
+    corrector = SpellCorrector(catalog_vocabulary(entries), catalog_anchors(entries))
+
+    typos = {"gurgoan": "gurgaon", "noyda": "noida", "nodia": "noida", "gurugarm": "gurugram",
+             "andheri": "andheri", "whitefeild": "whitefield", "dwarak": "dwarka", "apartmnet": "apartment",
+             "vila": "villa", "parkng": "parking", "bangalor": "bangalore", "lakhs": "lakhs", "crore": "crore",
+             "undr": "under", "flta": "flat"}
+    rng = random.Random(1)
+    templates = ["{bhk}bhk {kind} in {loc} under {price} lakh", "show me {kind} near {loc} with {amenity}",
+                 "{kind} in {loc} below {price} lakhs"]
+    words = list(typos)
+    queries = [rng.choice(templates).format(bhk=rng.randint(1, 5), kind=rng.choice(["flat", "vila", "apartmnet"]),
+                                            loc=rng.choice(words), price=rng.randint(20, 300),
+                                            amenity=rng.choice(["parkng", "gym", "pool"]))
+               for _ in range(args.queries)]
+    tokens = [t for q in queries for t in q.split()]
+
+    fixed = sum(corrector.correct_token(typo) == want for typo, want in typos.items())
+    print(f"[Spell] vocabulary {len(corrector)} words, typo fixes {fixed}/{len(typos)}: "
+          f"{ {t: corrector.correct_token(t) for t in list(typos)[:6]} }")
+
+    # Regression: ordinary words outside the old vocabulary must come through unchanged
+    keep = ["shop", "land", "corner", "homes", "monday", "commercial shop in noida", "agricultural land",
+            "visit on monday", "garage", "duplex near metro", "friday evening"]
+    changed = {text: corrector.correct(text) for text in keep if corrector.correct(text) != text}
+    print(f"[Spell] ordinary words left alone: {len(keep) - len(changed)}/{len(keep)}"
+          + (f", changed: {changed}" if changed else ""))
+    if changed or fixed < len(typos):
+        raise SystemExit("[Spell] regression: corrections changed")
+
+    corrector.correct_token.cache_clear()
+    distinct = list(dict.fromkeys(tokens))
+    t0 = time.perf_counter()
+    for token in distinct:
+        corrector.correct_token(token)
+    cold_us = (time.perf_counter() - t0) / len(distinct) * 1e6
+    t0 = time.perf_counter()
+    for q in queries:
+        corrector.correct(q)
+    warm_us = (time.perf_counter() - t0) / len(tokens) * 1e6
+    print(f"[Spell] symmetric delete: {cold_us:.1f} µs/token uncached, {warm_us:.2f} µs/token memoized "
+          f"({len(distinct)} distinct tokens)")
+
+    try:
+        from autocorrect import Speller
+    except ImportError:
+        print("[Spell] autocorrect not installed; skipping the Speller baseline")
+    else:
+        t0 = time.perf_counter()
+        speller = Speller(lang="en")
+        load_s = time.perf_counter() - t0
+        sample = tokens[:2000]
+        t0 = time.perf_counter()
+        for token in sample:
+            speller(token)
+        speller_us = (time.perf_counter() - t0) / len(sample) * 1e6
+        speller_fixed = sum(speller(typo) == want for typo, want in typos.items())
+        print(f"[Spell] autocorrect Speller: {speller_us:.1f} µs/token (load {load_s:.2f}s), "
+              f"typo fixes {speller_fixed}/{len(typos)}: { {t: speller(t) for t in list(typos)[:6]} }")
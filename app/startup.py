@@ -0,0 +1,126 @@
+"""
+startup.py — Lazy components, warmup & startup profile
+-------------------------------------------------------
+Heavy subsystems (Chroma embeddings, STT, spaCy, Twilio, ...) are built
+through this registry instead of at module import:
+ - in a background warmup stage started from the FastAPI lifespan, or
+ - lazily on first use when FAST_STARTUP=true (e.g. for --reload cycles).
+
+While warming up it records import time per heavy module and resident
+memory per component, which is served as the startup profile report.
+"""
+
+import importlib
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+# Third-party modules that dominate import time; pre-imported (and timed) during warmup
+HEAVY_MODULES = [
+    "pandas",
+    "chromadb",
+    "speech_recognition",
+    "twilio.rest",
+    "spacy",
+]
+
+
+def _rss_bytes() -> int:
+    """Current resident set size of this process (0 when unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        try:
+            import resource
+            # ru_maxrss is a peak, in KiB on Linux; good enough as a fallback
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        except Exception:
+            return 0
+
+
+class Startup:
+    def __init__(self):
+        self.ready = False
+        self.error = None
+        self.started_at = time.time()
+        self.ready_at = None
+        self.imports: Dict[str, Dict[str, Any]] = {}
+        self.components: Dict[str, Dict[str, Any]] = {}
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        """Register a component factory; nothing is built until get() or warmup()."""
+        self._factories[name] = factory
+
+    def get(self, name: str):
+        """Return the component, building it on first use (thread-safe)."""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            if name not in self._instances:
+                self._instances[name] = self._build(name)
+            return self._instances[name]
+
+    def _build(self, name: str):
+        rss_before = _rss_bytes()
+        t0 = time.perf_counter()
+        instance = self._factories[name]()
+        elapsed = time.perf_counter() - t0
+        self.components[name] = {
+            "seconds": round(elapsed, 4),
+            "rss_mb": round((_rss_bytes() - rss_before) / (1024 * 1024), 2),
+        }
+        print(f"[Startup] Built {name} in {elapsed:.2f}s")
+        return instance
+
+    def timed_import(self, module: str):
+        if module in sys.modules:
+            return
+        rss_before = _rss_bytes()
+        t0 = time.perf_counter()
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            print(f"[Startup] Warning: could not import {module}: {e}")
+            return
+        self.imports[module] = {
+            "seconds": round(time.perf_counter() - t0, 4),
+            "rss_mb": round((_rss_bytes() - rss_before) / (1024 * 1024), 2),
+        }
+
+    def warmup(self, modules: List[str] = None):
+        """Import heavy modules and build every registered component, then flip ready."""
+        try:
+            for module in modules if modules is not None else HEAVY_MODULES:
+                self.timed_import(module)
+            for name in list(self._factories):
+                self.get(name)
+        except Exception as e:
+            self.error = str(e)
+            print(f"[Startup] Warmup failed: {e}")
+            return
+        self.mark_ready()
+
+    def mark_ready(self):
+        self.ready = True
+        self.ready_at = time.time()
+        print(f"[Startup] Ready after {self.ready_at - self.started_at:.2f}s")
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "error": self.error,
+            "seconds_to_ready": round(self.ready_at - self.started_at, 3) if self.ready_at else None,
+            "rss_mb": round(_rss_bytes() / (1024 * 1024), 2),
+            "imports": self.imports,
+            "components": self.components,
+        }
+
+
+startup = Startup()
\ No newline at end of file
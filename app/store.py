@@ -3,18 +3,56 @@ import re
 import pandas as pd
 from typing import List, Dict, Optional
 from .config import settings
-import chromadb
-from chromadb.utils import embedding_functions
-
+from .metrics import timed
+from . import catalog, deadline, dedup, facets
+from .catalog import SharedCatalog
 
 try:
-    from langchain.embeddings import OpenAIEmbeddings
-    from langchain.vectorstores import FAISS
-    from langchain.schema import Document
+    import numpy as np
 except Exception:
-    FAISS = None
-    OpenAIEmbeddings = None
-    Document = None
+    np = None
+
+
+# Location keywords recognised in free-text queries
+KNOWN_LOCATIONS = [
+    "noida", "gurgaon", "gurugram", "delhi", "mumbai", "pune", "bangalore", "greater noida"
+]
+
+
+def parse_query(query: str) -> Dict:
+    """
+    Structured filters (location, bhk, max_price in lakh, prop_type) from a
+    free-text query like '2BHK in Noida under 90 lakh'.
+    """
+    query = query.lower()
+
+    # Extract filters using regex
+    bhk_match = re.search(r"(\d+)\s?bhk", query)
+    bhk = int(bhk_match.group(1)) if bhk_match else None
+
+    price_match = re.search(r"(\d+(\.\d+)?)\s?(lakh|crore|cr)", query)
+    max_price = None
+    if price_match:
+        value, unit = price_match.group(1), price_match.group(3)
+        max_price = float(value) * (100 if "cr" in unit or "crore" in unit else 1)
+
+    # Try to extract location and type keywords
+    location = next((loc for loc in KNOWN_LOCATIONS if loc in query), None)
+    prop_type = property_type(query)
+
+    return {"location": location, "bhk": bhk, "max_price": max_price, "prop_type": prop_type}
+
+
+def property_type(text: str) -> Optional[str]:
+    """Canonical property type named in `text` (villa / apartment / plot), if any."""
+    text = text.lower()
+    if "villa" in text:
+        return "villa"
+    if "flat" in text or "apartment" in text:
+        return "apartment"
+    if "plot" in text:
+        return "plot"
+    return None
 
 
 class PropertyStore:
@@ -25,59 +63,159 @@ class PropertyStore:
         self.vector_enabled = os.getenv("USE_VECTOR", "true").lower() == "true"
         self.df = pd.DataFrame()
         self.vector_store = None
+        self.catalog: Optional[SharedCatalog] = None
+        self.watcher = None
+        self._embedder = None
+        self._query_embeddings = None
+        self._dedup_index = None
+        self._typeahead = None
+        self._spelling = None
         self._load()
 
 
+    def _read_source(self) -> pd.DataFrame:
+        from .catalog_compiler import read_source
+        return read_source(self.csv_path, self.mysql_url if self.use_mysql else None)
+
     def _load(self):
-        print('CSV path '+ self.csv_path);
-        print(os.path.exists(self.csv_path))
-        #if self.csv_path and os.path.exists(self.csv_path):
-        
-        if self.csv_path:
-            base_dir = os.path.dirname(__file__)   # current file’s directory
-            csv_path = os.path.join(base_dir, "data", "properties.csv")
-            self.df = pd.read_csv(csv_path)
-        elif self.mysql_url:
-            from sqlalchemy import create_engine
-            engine = create_engine(self.mysql_url)
-            self.df = pd.read_sql_table('properties', engine)
-        else:
-            self.df = pd.DataFrame(columns=['id','title','description','price','location','bedrooms','type','bathrooms','area','contact_email','contact_phone'])
-        
+        # USE_MYSQL queries the database per request, so the shared catalog (and its watcher) is CSV-only
+        if not self.use_mysql and settings.CATALOG_DIR and catalog.available():
+            self._load_shared()
+            return
+
+        self.df = self._read_source()
+        self._index_vocabulary()
         # Initialize Chroma Vector DB
         if self.vector_enabled:
             self._init_vector_db()
+
+    def _load_shared(self):
+        """Map the host-wide catalog; the first worker to start publishes it."""
+        from .catalog_compiler import source_version
+        from .catalog_watcher import CatalogWatcher
+
+        watch = settings.CATALOG_WATCH_SECONDS > 0
+        self.catalog = SharedCatalog(
+            settings.CATALOG_DIR,
+            # With a watcher, CURRENT is re-read in the background instead of on the request path
+            refresh_seconds=0 if watch else settings.CATALOG_REFRESH_SECONDS,
+            keep=settings.CATALOG_KEEP_GENERATIONS,
+        )
+        # Rebuilt off the request path for every generation, before it is swapped in
+        self.catalog.on_swap(self._index_vocabulary)
+        if not self.catalog.exists():
+            def build():
+                # Normally built ahead of time with `python -m app.catalog_compiler`
+                version = source_version(self.csv_path)
+                df = self._read_source()
+                embeddings = self._embed_documents(df) if self.vector_enabled else None
+                return df, embeddings, {"source_version": version}
+
+            # Under the writer lock: one cold-starting worker embeds, the rest wait and map its result
+            self.catalog.bootstrap(build)
+        generation = self.catalog.current()
+        print(f"[Catalog] Mapped {generation.name} ({len(generation)} rows) from {settings.CATALOG_DIR}")
+        if watch:
+            self.watcher = CatalogWatcher(self, settings.CATALOG_WATCH_SECONDS)
+            self.watcher.start()
+
+    def _frame(self) -> pd.DataFrame:
+        """pandas view for legacy paths; materializes the mapped catalog when shared."""
+        if self.catalog is not None:
+            return self.catalog.current().to_pandas()
+        return self.df
+
+    def _index_vocabulary(self, generation=None):
+        """Typeahead and spelling vocabulary for a generation (or the in-memory frame)."""
+        from .typeahead import Typeahead, frame_entries, generation_entries
+        from .spelling import catalog_anchors, catalog_vocabulary
+        entries = generation_entries(generation) if generation is not None else frame_entries(self.df)
+        self._typeahead = Typeahead(entries)
+        self.spelling.update(catalog_vocabulary(entries), catalog_anchors(entries))
+
+    @property
+    def spelling(self):
+        """Query spelling corrector over the catalog vocabulary; kept current across generations."""
+        if self._spelling is None:
+            from .spelling import SpellCorrector
+            self._spelling = SpellCorrector()
+        return self._spelling
+
+    def autocomplete(self, prefix: str, limit: int = 8) -> List[Dict]:
+        """Location / type / title suggestions for a partially typed query."""
+        if self._typeahead is None:
+            self._index_vocabulary()
+        return self._typeahead.complete(prefix, limit)
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            self._embedder = catalog.default_embedder()
+        return self._embedder
+
+    @property
+    def query_embeddings(self):
+        """Micro-batched, LRU-cached query embedding (documents still go through `embedder`)."""
+        if self._query_embeddings is None:
+            from .embedding_service import EmbeddingService
+            self._query_embeddings = EmbeddingService(lambda: self.embedder)
+        return self._query_embeddings
+
+    def _doc_text(self, row) -> str:
+        return catalog.document_text(row)
+
+    def _embed_documents(self, df: pd.DataFrame):
+        return catalog.embed_documents(df, self.embedder)
             
-    def semantic_index(self, embedder=None):
-        if FAISS is None or OpenAIEmbeddings is None:
-            print('FAISS/langchain not installed; skipping semantic index')
-        return
-        texts = (self.df['title'].fillna('') + '\n' + self.df['description'].fillna('')).tolist()
-        docs = [Document(page_content=t, metadata=self.df.iloc[i].to_dict()) for i, t in enumerate(texts)]
-        embeddings = embedder or OpenAIEmbeddings()
-        self.vector_store = FAISS.from_documents(docs, embeddings)
+    def semantic_index(self, backend: Optional[str] = None):
+        """
+        (Re)build the ANN index for the current catalog generation in-process,
+        e.g. to try another backend; published generations already carry one.
+        """
+        if self.catalog is None:
+            print('Shared catalog disabled; semantic search uses Chroma')
+            return None
+        from .vector_index import build_index
+        generation = self.catalog.current()
+        if generation.embeddings is None:
+            print('No embeddings in catalog; skipping semantic index')
+            return None
+        index = generation.vector_index
+        index.index = build_index(np.asarray(generation.embeddings), backend)
+        index.backend = "exact" if index.index is None else backend or index.backend
+        index.path = None   # no longer the published file, so appends must not extend it
+        self.vector_store = index
+        return index
 
     def _init_vector_db(self):
+        import chromadb
+        from chromadb.utils import embedding_functions
+
         self.client = chromadb.Client()
         self.collection = self.client.get_or_create_collection(
             name="real_estate_props",
             embedding_function=embedding_functions.DefaultEmbeddingFunction()
         )
         # Load data into vector DB
-        #id,title,location,type,bhk,price,area_sqft,contact_person,phone,availability,images,youtube,description,whatsapp
         for idx, row in self.df.iterrows():
-            doc_text = f"{row['title']} {row['location']}  {row['type']} {row['bhk']} {row['price']} {row['area_sqft']} {row['contact_person']} {row['phone']} {row['availability']}  {row['image']} {row['youtube']} {row['description']} {row['whatsapp']}"
             self.collection.add(
                 ids=[str(row['id'])],
-                documents=[doc_text],
+                documents=[self._doc_text(row)],
                 metadatas=[row.to_dict()]
             )
         print(f"[VectorDB] Loaded {len(self.df)} embeddings into Chroma")
 
-    def semantic_search(self, query: str, top_k: int = 5):
-        """Semantic vector search for user queries."""
+    @timed("store.semantic_search")
+    def semantic_search(self, query: str, top_k: int = 5, **filters):
+        """
+        Semantic vector search for user queries. Optional structured filters
+        (location, bhk, max_price, prop_type, as from parse_query) pre-filter
+        candidates on the shared catalog.
+        """
         if not self.vector_enabled:
             return []
+        if self.catalog is not None:
+            return self._shared_semantic_search(query, top_k, **filters)
         results = self.collection.query(query_texts=[query], n_results=top_k)
         matches = []
         for meta in results["metadatas"][0]:
@@ -85,8 +223,61 @@ class PropertyStore:
         print(f"[VectorDB] Found {len(matches)} semantic matches")
         return matches
     
+    def _shared_semantic_search(self, query: str, top_k: int, **filters):
+        """Cosine search over the shared embeddings (exact or ANN, per generation)."""
+        generation = self.catalog.current()
+        if generation.vector_index is None or len(generation) == 0:
+            return []
+        mask = self._filter_mask(generation, **filters) if filters else None
+        q = self.query_embeddings.embed(query, timeout=deadline.timeout(30.0))
+        groups = generation.dedup.groups if generation.dedup is not None else None
+        # Over-fetch so collapsing re-posts of the same flat still fills top_k
+        top, _ = generation.vector_index.search(q, top_k * 2 if groups is not None else top_k, mask)
+        matches = generation.rows(dedup.collapse(top, groups)[:top_k])
+        print(f"[VectorDB] Found {len(matches)} semantic matches")
+        return matches
+
+    def get(self, listing_id) -> Optional[Dict]:
+        """One listing by id (None when it is unknown)."""
+        if self.catalog is not None:
+            generation = self.catalog.current()
+            row = generation.row_of(listing_id)
+            return generation.rows([row])[0] if row is not None else None
+        if "id" not in self.df:
+            return None
+        found = self.df[pd.to_numeric(self.df["id"], errors="coerce") == pd.to_numeric(listing_id, errors="coerce")]
+        return found.iloc[0].to_dict() if not found.empty else None
+
+    def similar(self, listing_id, k: int = 10) -> Optional[List[Dict]]:
+        """
+        Listings most similar to `listing_id` (None when it is unknown). Served
+        from the generation's precomputed neighbour table; without the shared
+        catalog it falls back to a Chroma query with the listing's text.
+        """
+        if self.catalog is not None:
+            generation = self.catalog.current()
+            row = generation.row_of(listing_id)
+            if row is None:
+                return None
+            if generation.neighbors is None:
+                return []
+            rows, scores = generation.neighbors.similar(row, k)
+            matches = generation.rows(rows)
+            for match, score in zip(matches, scores):
+                match["similarity"] = round(float(score), 3)
+            return matches
+
+        ids = pd.to_numeric(self.df["id"], errors="coerce") if "id" in self.df else pd.Series(dtype=float)
+        found = self.df[ids == pd.to_numeric(listing_id, errors="coerce")]
+        if found.empty:
+            return None
+        if not self.vector_enabled or not hasattr(self, "collection"):
+            return []
+        results = self.collection.query(query_texts=[self._doc_text(found.iloc[0])], n_results=k + 1)
+        return [meta for meta in results["metadatas"][0] if str(meta.get("id")) != str(listing_id)][:k]
+
     def search_filters(self, q: dict):
-        df = self.df
+        df = self._frame()
         if 'location' in q and q['location']:
             df = df[df['location'].str.contains(q['location'], case=False, na=False)]
         if 'min_price' in q and q['min_price']:
@@ -98,18 +289,7 @@ class PropertyStore:
         return df
     
     def _price_to_number(self, price_str: str) -> float:
-        if not isinstance(price_str, str):
-            return 0.0
-
-        text = price_str.lower().replace(" ", "")
-        if "cr" in text or "crore" in text:
-            return float(text.lower().replace("crore", "").replace("cr", "").strip())* 100
-        elif "lakh" in text:
-            return float(text.lower().replace("lakh", "").replace("L", "").strip())
-        try:
-            return float(text)
-        except:
-            return 0.0
+        return catalog.parse_price(price_str)
     
     def _filter_df(self, df, location=None, bhk=None, max_price=None, prop_type=None):
         result = df.copy()
@@ -147,6 +327,35 @@ class PropertyStore:
             result = result.iloc[0:0]
     
         return result
+
+    def _filter_indices(self, generation, location=None, bhk=None, max_price=None, prop_type=None):
+        """Same filters as _filter_df, evaluated over the precomputed mapped columns."""
+        mask = self._filter_mask(generation, location, bhk, max_price, prop_type)
+        if mask is None:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(mask)
+
+    def _filter_mask(self, generation, location=None, bhk=None, max_price=None, prop_type=None):
+        """Boolean row mask for the structured filters; None when no filter applies."""
+        mask = None
+
+        def _and(m):
+            return m if mask is None else mask & m
+
+        if location:
+            codes = [i for i, loc in enumerate(generation.locations) if re.search(location, loc, re.IGNORECASE)]
+            mask = _and(np.isin(generation.location_code, codes))
+        if bhk:
+            try:
+                mask = _and(generation.bhk == int(bhk))
+            except (TypeError, ValueError):
+                pass
+        if prop_type:
+            codes = [i for i, t in enumerate(generation.types) if re.search(prop_type, t, re.IGNORECASE)]
+            mask = _and(np.isin(generation.type_code, codes))
+        if max_price:
+            mask = _and(generation.price_num <= float(max_price))
+        return mask
     
     def search_properties(
         self,
@@ -156,6 +365,14 @@ class PropertyStore:
         prop_type: Optional[str] = None,
     ) -> List[Dict]:
         """Structured search with filters"""
+        return self._search_properties(location, bhk, max_price, prop_type)[0]
+
+    def search_properties_faceted(self, location=None, bhk=None, max_price=None, prop_type=None):
+        """(rows, facet counts by bhk / type / price bucket / locality) from one filter pass."""
+        return self._search_properties(location, bhk, max_price, prop_type, with_facets=True)
+
+    def _search_properties(self, location=None, bhk=None, max_price=None, prop_type=None,
+                           with_facets: bool = False):
         if self.use_mysql:
             cursor = self.conn.cursor(dictionary=True)
             query = "SELECT * FROM properties WHERE 1=1"
@@ -178,7 +395,16 @@ class PropertyStore:
             result = cursor.fetchall()
             cursor.close()
             print(f"[Store] Found {len(result)} properties from MySQL")
-            return result
+            return result, facets.from_records(result) if with_facets else None
+
+        elif self.catalog is not None:
+            generation = self.catalog.current()
+            indices = self._filter_indices(generation, location, bhk, max_price, prop_type)
+            if generation.dedup is not None:
+                indices = dedup.collapse(indices, generation.dedup.groups)
+            print(f"[Store] Found {len(indices)} properties from shared catalog {generation.name}")
+            # Facets reuse the selected indices: a gather + bincount per coded column
+            return generation.rows(indices), facets.from_codes(generation, indices) if with_facets else None
 
         else:
             result_df = self._filter_df(self.df, location, bhk, max_price, prop_type)
@@ -186,41 +412,134 @@ class PropertyStore:
                 print(f"[Store] Found {len(result_df)} properties from CSV")
             else:
                 print(f"[Store] Found 0 properties from CSV")
-            return result_df.to_dict(orient="records")
+            records = result_df.to_dict(orient="records")
+            return records, facets.from_records(records) if with_facets else None
     
     
+    @timed("store.search")
     def search(self, query: str) -> List[Dict]:
         """
         Free-text search — interprets user query like:
         '2BHK in Noida under 90 lakh' or 'villa in Gurugram below 2 crore'
         """
-        query = query.lower()
-        print('Query '+query)
-
-        # Extract filters using regex
-        bhk_match = re.search(r"(\d+)\s?bhk", query)
-        bhk = int(bhk_match.group(1)) if bhk_match else None
-
-        price_match = re.search(r"(\d+(\.\d+)?)\s?(lakh|crore|cr)", query)
-        max_price = None
-        if price_match:
-            value, unit = price_match.group(1), price_match.group(3)
-            max_price = float(value) * (100 if "cr" in unit or "crore" in unit else 1)
-
-        # Try to extract location and type keywords
-        possible_locations = [
-            "noida", "gurgaon", "gurugram", "delhi", "mumbai", "pune", "bangalore", "greater noida"
-        ]
-        location = next((loc for loc in possible_locations if loc in query), None)
-
-        prop_type = None
-        if "villa" in query:
-            prop_type = "villa"
-        elif "flat" in query or "apartment" in query:
-            prop_type = "apartment"
-        elif "plot" in query:
-            prop_type = "plot"
-
-        print(f"[Store] Parsed query → location={location}, bhk={bhk}, price={max_price}, type={prop_type}")
-
-        return self.search_properties(location, bhk, max_price, prop_type)
\ No newline at end of file
+        print('Query '+query.lower())
+        filters = parse_query(query)
+        print(f"[Store] Parsed query → location={filters['location']}, bhk={filters['bhk']}, "
+              f"price={filters['max_price']}, type={filters['prop_type']}")
+
+        return self.search_properties(**filters)
+
+    @timed("store.search_faceted")
+    def search_faceted(self, query: str):
+        """Like search(), plus facet counts for the results."""
+        filters = parse_query(query)
+        print(f"[Store] Parsed query → location={filters['location']}, bhk={filters['bhk']}, "
+              f"price={filters['max_price']}, type={filters['prop_type']}")
+        return self.search_properties_faceted(**filters)
+
+    @timed("store.search_batch")
+    def search_batch(self, queries: List[str], limit: int = 20):
+        """
+        {"total", "properties" (first `limit`), "facets"} per query, in input
+        order. On the shared catalog all filters are evaluated together
+        (batch_query.filter_indices); MySQL and the in-memory frame run one search each.
+        """
+        filters = [parse_query(q) for q in queries]
+        results: List[Optional[Dict]] = [None] * len(queries)
+        if self.catalog is None or self.use_mysql:
+            for i, f in enumerate(filters):
+                rows, counts = self._search_properties(**f, with_facets=True)
+                results[i] = {"total": len(rows), "properties": rows[:limit], "facets": counts}
+            return results
+
+        from .batch_query import filter_indices
+        generation = self.catalog.current()
+        groups = generation.dedup.groups if generation.dedup is not None else None
+        for i, indices in filter_indices(generation, filters):
+            if groups is not None:
+                indices = dedup.collapse(indices, groups)
+            # Only the returned page is materialized; totals and facets come from the indices
+            results[i] = {"total": len(indices), "properties": generation.rows(indices[:limit]),
+                          "facets": facets.from_codes(generation, indices)}
+        print(f"[Store] Batch of {len(queries)} queries over shared catalog {generation.name}")
+        return results
+
+    @timed("store.semantic_search_many")
+    def semantic_search_many(self, queries: List[str], top_k: int = 5) -> List[List[Dict]]:
+        """semantic_search for a batch: one embedding batch and one vector lookup for all queries."""
+        if not self.vector_enabled or not queries:
+            return [[] for _ in queries]
+        if self.catalog is None:
+            results = self.collection.query(query_texts=list(queries), n_results=top_k)
+            return [list(metas) for metas in results["metadatas"]]
+
+        generation = self.catalog.current()
+        if generation.vector_index is None or len(generation) == 0:
+            return [[] for _ in queries]
+        vectors = self.query_embeddings.embed_many(list(queries))
+        groups = generation.dedup.groups if generation.dedup is not None else None
+        hits = generation.vector_index.search_many(vectors, top_k * 2 if groups is not None else top_k)
+        return [generation.rows(dedup.collapse(top, groups)[:top_k]) for top, _ in hits]
+
+    @staticmethod
+    def _record(details: Dict) -> Dict:
+        record = {str(k).strip().lower(): v for k, v in details.items()}
+        title = str(record.get("title", ""))
+        if "bhk" not in record:
+            bhk_match = re.search(r"(\d+)\s?bhk", title, re.IGNORECASE)
+            if bhk_match:
+                record["bhk"] = int(bhk_match.group(1))
+        # Extracted uploads have no type column; derive it like a query's, so typed
+        # searches (and saved-search alerts) match them
+        if not record.get("type"):
+            kind = property_type(title)
+            if kind:
+                record["type"] = kind
+        return record
+
+    def find_duplicate(self, details: Dict) -> Optional[Dict]:
+        """The catalog listing `details` is a near-duplicate of, with the estimated similarity."""
+        if not settings.DEDUP_ENABLED:
+            return None
+        if self.catalog is not None:
+            generation = self.catalog.current()
+            index, rows = generation.dedup, generation.rows
+        else:
+            if self._dedup_index is None:
+                self._dedup_index = dedup.DuplicateIndex.from_frame(self.df)
+            index, rows = self._dedup_index, lambda idx: self.df.iloc[list(idx)].to_dict(orient="records")
+        hit = index.find(self._record(details)) if index is not None else None
+        if hit is None:
+            return None
+        row, score = hit
+        return {"listing": rows([row])[0], "similarity": round(score, 3)}
+
+    def save(self, details: Dict) -> Dict:
+        """
+        Append a listing to the catalog. With the shared catalog this publishes
+        a new generation (append-and-swap); readers keep serving the old one
+        until they pick up the new CURRENT.
+        """
+        record = self._record(details)
+        # Not in the upstream CSV/DB; the catalog watcher carries these over on rebuilds
+        record.setdefault("source", "upload")
+
+        if self.catalog is not None:
+            # The id is assigned by append, under the writer lock shared by all workers
+            new_rows = pd.DataFrame([record])
+            embeddings = self._embed_documents(new_rows) if self.vector_enabled else None
+            _, ids = self.catalog.append(new_rows, embeddings, embedder=lambda texts: self.embedder(texts))
+            record["id"] = ids[0]
+        else:
+            ids = pd.to_numeric(self.df["id"], errors="coerce") if "id" in self.df else pd.Series(dtype=float)
+            record.setdefault("id", int(ids.max()) + 1 if ids.notna().any() else 1)
+            new_rows = pd.DataFrame([record])
+            self.df = pd.concat([self.df, new_rows], ignore_index=True)
+            self._dedup_index = None
+            self._index_vocabulary()
+            if self.vector_enabled and hasattr(self, "collection"):
+                row = new_rows.iloc[0]
+                self.collection.add(ids=[str(record["id"])], documents=[self._doc_text(row)],
+                                    metadatas=[row.to_dict()])
+        print(f"[Store] Saved property {record['id']}")
+        return record
@@ -2,9 +2,8 @@
 import os
 import re
 import io
-import speech_recognition as sr
-from autocorrect import Speller
 from app.nlu import NLUProcessor
+from app.metrics import timed
 
 class SpeechToText:
     """
@@ -14,12 +13,11 @@ class SpeechToText:
       - Offline VOSK model (if installed and configured)
     """
 
-    def __init__(self):
+    def __init__(self, nlu: NLUProcessor = None):
         self.mode = os.getenv("STT_MODE", "google")  # or "vosk"
-        self.recognizer = sr.Recognizer()
+        self._recognizer = None
         self.vosk_model = None
-        self.corrector = Speller(lang="en")
-        self.nlu = NLUProcessor()
+        self.nlu = nlu or NLUProcessor()
 
         if self.mode == "vosk":
             try:
@@ -31,10 +29,24 @@ class SpeechToText:
                 print(f"[STT] Warning: VOSK model not found or not installed: {e}")
                 self.mode = "google"  # fallback
 
+    @property
+    def recognizer(self):
+        """speech_recognition is only imported once audio actually arrives."""
+        if self._recognizer is None:
+            import speech_recognition as sr
+            self._recognizer = sr.Recognizer()
+        return self._recognizer
+
+    @property
+    def corrector(self):
+        # Same domain-vocabulary correction as typed queries, memoized per word
+        return self.nlu.corrector.correct_token
+
     def transcribe_audio(self, audio_path: str) -> str:
         """
         Transcribes an audio file (WAV/FLAC/MP3).
         """
+        import speech_recognition as sr
         try:
             with sr.AudioFile(audio_path) as source:
                 audio_data = self.recognizer.record(source)
@@ -61,6 +73,7 @@ class SpeechToText:
         """
         Captures speech directly from microphone input (for live queries).
         """
+        import speech_recognition as sr
         try:
             with sr.Microphone() as source:
                 print("[STT] Speak now...")
@@ -72,11 +85,13 @@ class SpeechToText:
             print(f"[STT] Error from mic: {e}")
             return ""
 
+    @timed("stt.convert")
     def convert(self, audio_file: bytes) -> str:
         """
         Converts speech from an audio file (.wav, .mp3, etc.) into text.
         Returns normalized text string.
         """
+        import speech_recognition as sr
         try:
             with sr.AudioFile(io.BytesIO(audio_file)) as source:
                 audio_data = self.recognizer.record(source)
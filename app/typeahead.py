@@ -0,0 +1,195 @@
+"""
+typeahead.py — Autocomplete over catalog locations, types and titles
+---------------------------------------------------------------------
+Suggestions are the catalog's distinct location, type and title values,
+ranked by how many listings carry them. A partial input matches a value
+when it is a prefix of the value or of one of its later words, so
+"sector 7", "greater no" and "noida" all find "Sector 7, Noida" style
+localities.
+
+The index is a sorted array of normalized keys (each value once per word
+start) plus a sparse table of range maxima over the keys' listing counts:
+ - the keys starting with the typed prefix are one contiguous range (two bisects)
+ - the best-ranked key in any range is an O(1) sparse-table lookup, so the
+   top `limit` suggestions come out of a small heap in O(limit log limit),
+   however many keys share the prefix
+
+It is rebuilt for every catalog generation (SharedCatalog.on_swap) from the
+dictionary-encoded columns, so location/type counts are a bincount.
+    python -m app.typeahead --bench 100000     # build time and per-keystroke latency
+"""
+
+import heapq
+import re
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+
+import pandas as pd
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+# Keys per value: the full text and the suffixes starting at its next words
+MAX_WORD_STARTS = 4
+
+
+def normalize(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", str(text).lower()).strip()
+
+
+class Typeahead:
+    def __init__(self, entries: Iterable[Tuple[str, str, int]]):
+        """`entries`: (display text, kind, listing count)."""
+        self.values: List[Tuple[str, str]] = []
+        counts, keyed = [], []
+        for text, kind, count in entries:
+            norm = normalize(text)
+            if not norm or count <= 0:
+                continue
+            value = len(self.values)
+            self.values.append((str(text), kind))
+            counts.append(count)
+            words = norm.split(" ")
+            for start in range(min(len(words), MAX_WORD_STARTS)):
+                keyed.append((" ".join(words[start:]), value))
+        keyed.sort()
+        self.keys: List[str] = [key for key, _ in keyed]
+        self.key_values = np.array([value for _, value in keyed], dtype=np.int32)
+        self.counts = np.array(counts, dtype=np.int64)
+        self._table = self._sparse_table(self.counts[self.key_values] if keyed else np.empty(0, dtype=np.int64))
+
+    @staticmethod
+    def _sparse_table(weights) -> List["np.ndarray"]:
+        """table[j][i] = position of the largest weight in [i, i + 2**j) (leftmost on ties)."""
+        table = [np.arange(len(weights), dtype=np.int32)]
+        span = 1
+        while span * 2 <= len(weights):
+            prev = table[-1]
+            left, right = prev[:-span], prev[span:]
+            table.append(np.where(weights[right] > weights[left], right, left))
+            span *= 2
+        return table
+
+    def _best(self, lo: int, hi: int) -> int:
+        j = (hi - lo).bit_length() - 1
+        a, b = self._table[j][lo], self._table[j][hi - (1 << j)]
+        return int(b) if self.counts[self.key_values[b]] > self.counts[self.key_values[a]] else int(a)
+
+    def complete(self, prefix: str, limit: int = 8) -> List[Dict]:
+        """Best-ranked values with a word starting with `prefix`."""
+        prefix = normalize(prefix)
+        if not prefix or not self.keys:
+            return []
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + "\uffff", lo)
+        heap = []
+
+        def push(a, b):
+            if a < b:
+                i = self._best(a, b)
+                heapq.heappush(heap, (-int(self.counts[self.key_values[i]]), i, a, b))
+
+        push(lo, hi)
+        seen, found = set(), []
+        while heap and len(found) < limit:
+            neg_count, i, a, b = heapq.heappop(heap)
+            value = int(self.key_values[i])
+            if value not in seen:               # a value can match through two of its word starts
+                seen.add(value)
+                text, kind = self.values[value]
+                found.append({"text": text, "kind": kind, "count": -neg_count})
+            push(a, i)
+            push(i + 1, b)
+        return found
+
+    def __len__(self):
+        return len(self.values)
+
+    @classmethod
+    def from_generation(cls, generation) -> "Typeahead":
+        return cls(generation_entries(generation))
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "Typeahead":
+        return cls(frame_entries(df))
+
+
+def generation_entries(generation) -> List[Tuple[str, str, int]]:
+    """(text, kind, listing count): location/type from the coded columns, titles from the Arrow column."""
+    entries = []
+    for kind, names, codes in (("location", generation.locations, generation.location_code),
+                               ("type", generation.types, generation.type_code)):
+        counts = np.bincount(np.asarray(codes), minlength=len(names))
+        entries.extend((name, kind, int(c)) for name, c in zip(names, counts))
+    if "title" in generation.table.column_names:
+        titles = generation.table.column("title").value_counts().to_pylist()
+        entries.extend((t["values"], "title", t["counts"]) for t in titles if t["values"])
+    return entries
+
+
+def frame_entries(df: pd.DataFrame) -> List[Tuple[str, str, int]]:
+    entries = []
+    for kind in ("location", "type", "title"):
+        if kind in df:
+            counts = df[kind].dropna().astype(str).value_counts()
+            entries.extend((text, kind, int(c)) for text, c in counts.items())
+    return entries
+
+
+# ---------------------------
+# Benchmark: build time and per-keystroke latency
+# ---------------------------
+if __name__ == "__main__":
+    import argparse
+    import os
+    import random
+    import tempfile
+    import time
+
+    from app.catalog import SharedCatalog
+    from app.catalog_compiler import _synthetic_csv
+
+    parser = argparse.ArgumentParser(description="Typeahead benchmark")
+    parser.add_argument("--bench", type=int, default=100000)
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "properties.csv")
+        _synthetic_csv(path, args.bench)
+        df = pd.read_csv(path)
+        # Free-form titles, as real uploads have
+        words = ["spacious", "luxury", "corner", "park facing", "new", "modern", "gated", "premium", "sunny"]
+        df["title"] = [f"{rng.choice(words).title()} {t} near {loc.split(',')[0]}"
+                       for t, loc in zip(df["title"], df["location"])]
+        shared = SharedCatalog(os.path.join(tmp, "catalog"))
+        shared.publish(df)
+        generation = shared.current()
+
+        t0 = time.perf_counter()
+        index = Typeahead.from_generation(generation)
+        build_s = time.perf_counter() - t0
+
+        inputs = ["s", "se", "sector 7", "greater no", "noida", "dlf ph", "lux", "park facing 3",
+                  "villa", "whitefield", "an", "xyz"]
+        for text in inputs[:4]:
+            print(f"[Typeahead] {text!r:14} -> {[s['text'] for s in index.complete(text, 5)]}")
+        keystrokes = [text[:n] for text in inputs for n in range(1, len(text) + 1)]
+        t0 = time.perf_counter()
+        for _ in range(200):
+            for text in keystrokes:
+                index.complete(text)
+        per_us = (time.perf_counter() - t0) / (200 * len(keystrokes)) * 1e6
+
+        names = [normalize(v[0]) for v in index.values]
+        counts = index.counts.tolist()
+        t0 = time.perf_counter()
+        for text in keystrokes[:50]:
+            norm = normalize(text)
+            sorted((-c, n) for n, c in zip(names, counts) if norm in n)[:8]
+        scan_us = (time.perf_counter() - t0) / 50 * 1e6
+        print(f"[Typeahead] {len(generation)} listings -> {len(index)} values, {len(index.keys)} keys, "
+              f"built in {build_s * 1000:.0f} ms")
+        print(f"[Typeahead] per keystroke: {per_us:.1f} µs (linear scan of the values: {scan_us:.0f} µs)")
@@ -5,6 +5,7 @@ Handles property upload workflow:
  - Extract property fields from paragraph or voice input
  - Merge partial data across turns
  - Ask for missing details
+ - Reject near-duplicates of listings already in the catalog
  - Start upload & show progress
  - Reset session when user says "start over"
 """
@@ -15,14 +16,19 @@ from app.nlu_extractor import HybridExtractor
 from app.memory_manager import PropertyMemory
 from app.store import PropertyStore
 from app.llm_client import GroqLllmClient
+from app.notifier import notifier
+from app.saved_searches import SavedSearchIndex
 
 
 class UploadAgent:
-    def __init__(self):
+    def __init__(self, store: PropertyStore = None, saved_searches: SavedSearchIndex = None):
         self.extractor = HybridExtractor()
         self.memory = PropertyMemory()
-        self.store = PropertyStore()
+        # Share the search agent's catalog when given one instead of loading a second copy
+        self.store = store or PropertyStore()
         self.llm = GroqLllmClient()
+        # Buyers' saved searches, matched against every completed upload
+        self.saved_searches = saved_searches or SavedSearchIndex(notifier=notifier)
 
         # Minimal required fields
         self.required_fields = ["title", "location", "price", "area", "amenities", "images"]
@@ -72,6 +78,12 @@ class UploadAgent:
             )
             return {"status": "incomplete", "missing_fields": missing, "message": prompt}
 
+        # 🪞 Already listed (e.g. a broker re-posting with edited text)?
+        duplicate = await asyncio.to_thread(self.check_duplicate, merged)
+        if duplicate:
+            self.memory.clear(session_id)
+            return duplicate
+
         # ⚙️ All details present — start upload
         task = asyncio.create_task(self.upload_property(merged, session_id))
         return {
@@ -91,6 +103,20 @@ class UploadAgent:
                 missing.append(field)
         return missing
 
+    def check_duplicate(self, details: Dict[str, Any]):
+        """Duplicate response when the listing is a near-copy of a catalog listing, else None"""
+        match = self.store.find_duplicate(details)
+        if match is None:
+            return None
+        listing = match["listing"]
+        return {
+            "status": "duplicate",
+            "duplicate_of": listing.get("id"),
+            "similarity": match["similarity"],
+            "message": f"This looks like a listing we already have: {listing.get('title', 'Property')} "
+                       f"in {listing.get('location', '')} (id {listing.get('id')}).",
+        }
+
     # ------------------------------------------------------
     # UPLOAD SIMULATION
     # ------------------------------------------------------
@@ -102,8 +128,16 @@ class UploadAgent:
         for progress in range(0, 101, 25):
             await asyncio.sleep(1)
             print(f"[Upload Progress] {progress}% - {details.get('title', 'Unknown Property')}")
-        # Save property after completion
-        self.store.save(details)
+        # Re-check: the catalog may have gained the same listing while we were uploading
+        duplicate = await asyncio.to_thread(self.check_duplicate, details)
+        if duplicate:
+            self.memory.clear(session_id)
+            print(f"[Upload Rejected] Near-duplicate of property {duplicate['duplicate_of']}")
+            return duplicate
+        # Save property after completion; publishing a catalog generation must not block the event loop
+        record = await asyncio.to_thread(self.store.save, details)
+        # Queue alerts for buyers whose saved searches match the new listing
+        await asyncio.to_thread(self.saved_searches.percolate, record)
         # Clear memory post-success
         self.memory.clear(session_id)
         print("[Upload Completed] Property saved to database.")